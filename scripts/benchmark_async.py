@@ -0,0 +1,146 @@
+"""Benchmark a burst of presses with the threads and the async engine.
+
+Runs a local OpenHAB stub server that answers after `--delay` seconds (a slow
+backend) and handles `--presses` presses of a button with an OpenHAB action:
+with Dispatcher workers (`"engine": "threads"`) and with AsyncEngine
+(`"engine": "async"`).
+
+    python scripts/benchmark_async.py [--presses N] [--delay SECONDS] [--workers N]
+
+Each press is two requests (GET state and POST command), so with the threads
+engine the burst takes about presses / workers * 2 * delay, with the async one
+about 2 * delay while the presses fit into `press_queue_size`.
+"""
+
+import argparse
+import contextlib
+import io
+import os.path
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../src"))
+
+import models  # noqa: E402
+from action import Action  # noqa: E402
+from async_engine import AsyncEngine  # noqa: E402
+from dispatcher import Dispatcher  # noqa: E402
+
+BUTTON = "bench"
+
+
+class StubServer(ThreadingHTTPServer):
+    """Accept the whole burst of connections."""
+
+    request_queue_size = 1024
+    daemon_threads = True
+    delay = 0.0
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """OpenHAB REST API stub, item is always "ON", answers after the delay."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # as real servers do, or keep-alive hits delayed ACK
+    server: StubServer
+
+    def reply(self, body: bytes) -> None:
+        """Send the body after the delay."""
+        time.sleep(self.server.delay)
+        self.send_response(200)
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Item state."""
+        self.reply(b"ON")
+
+    def do_POST(self) -> None:  # noqa: N802
+        """Item command."""
+        self.rfile.read(int(self.headers.get("content-length", 0)))
+        self.reply(b"")
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        """Be quiet."""
+
+
+def make_settings(url: str, presses: int, workers: int) -> models.Settings:
+    """Settings with one button that toggles OpenHAB item."""
+    return models.Settings.model_validate(
+        {
+            "latitude": "0",
+            "longitude": "0",
+            "credentials_file_name": "",
+            "ifttt_key_file_name": "",
+            "openweathermap_key_file_name": "",
+            "images_folder": "",
+            "press_queue_size": presses,
+            "press_workers": workers,
+            "http_pool_size": workers,
+            "dashboards": {},
+            "events": {
+                BUTTON: {
+                    "summary": BUTTON,
+                    "actions": [
+                        {"type": "openhab", "path": url, "item": "Light", "command": "ON;OFF"},
+                    ],
+                },
+            },
+        },
+    )
+
+
+def measure(name: str, engine: Dispatcher | AsyncEngine, presses: int) -> None:
+    """Print time to handle the burst of presses."""
+    threads = threading.active_count()
+    engine.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # actions log every press
+        for _ in range(presses):
+            engine.submit(BUTTON, datetime.now())
+        max_threads = threading.active_count() - threads
+        engine.stop()
+    elapsed = time.perf_counter() - start
+    stats = engine.stats()
+    print(
+        f"{name:<10} {elapsed:8.3f} s, {presses / elapsed:8.1f} presses/s, "
+        f"{stats['processed']} processed, {stats['failed']} failed, "
+        f"{max_threads} engine threads",
+    )
+
+
+def main() -> None:
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--presses", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=models.PRESS_WORKERS)
+    args = parser.parse_args()
+
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    server.delay = args.delay
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    settings = make_settings(
+        f"http://127.0.0.1:{server.server_address[1]}",
+        args.presses,
+        args.workers,
+    )
+    actions = Action(settings)
+    actions.compile_plans([BUTTON])
+
+    measure(
+        "threads",
+        Dispatcher(actions.action, queue_size=args.presses, workers=args.workers),
+        args.presses,
+    )
+    measure("async", AsyncEngine(actions.action_async, settings), args.presses)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
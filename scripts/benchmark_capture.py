@@ -0,0 +1,71 @@
+"""Microbenchmark of button request detection: raw frame parsing vs scapy dissection.
+
+    python scripts/benchmark_capture.py [--frames N]
+
+Measures frames per second for the work done per captured frame
+(no socket I/O): `raw_capture.parse_frame` on a memoryview against scapy
+`Ether(frame)` dissection with the checks from `AmazonDash.arp_handler`.
+"""
+
+import argparse
+import os.path
+import struct
+import sys
+import time
+from collections.abc import Callable
+from typing import Any
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../src"))
+
+from raw_capture import parse_frame  # noqa: E402
+
+SRC_MAC = bytes.fromhex("6854fd27aaf1")
+
+
+def arp_who_has() -> bytes:
+    """ARP who-has frame, what a button sends when it wakes up."""
+    arp = struct.pack("!HHBBH", 1, 0x0800, 6, 4, 1) + SRC_MAC + bytes(4 + 6 + 4)
+    return b"\xff" * 6 + SRC_MAC + struct.pack("!H", 0x0806) + arp
+
+
+def udp_mdns() -> bytes:
+    """Unrelated UDP frame, typical noise on a busy LAN."""
+    ip_header = bytes([0x45, 0]) + bytes(7) + bytes([17]) + bytes(10)
+    udp = struct.pack("!HHHH", 5353, 5353, 8 + 100, 0) + bytes(100)
+    return b"\xff" * 6 + SRC_MAC + struct.pack("!H", 0x0800) + ip_header + udp
+
+
+def measure(name: str, detect: Callable[[bytes], Any], frames: list[bytes]) -> None:
+    """Print frames per second."""
+    start = time.perf_counter()
+    for frame in frames:
+        detect(frame)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<30} {len(frames) / elapsed:12,.0f} frames/s")
+
+
+def main() -> None:
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=100_000)
+    args = parser.parse_args()
+    frames = [arp_who_has(), udp_mdns()] * (args.frames // 2)
+
+    measure("raw parse_frame", lambda frame: parse_frame(memoryview(frame)), frames)
+
+    try:
+        from scapy.layers.dhcp import DHCP  # noqa: PLC0415
+        from scapy.layers.l2 import ARP, Ether  # noqa: PLC0415
+    except ImportError:
+        print("scapy is not installed, skip scapy benchmark")
+        return
+
+    def scapy_detect(frame: bytes) -> bool:
+        pkt = Ether(frame)
+        return pkt.haslayer(ARP) and pkt[ARP].op == 1 or pkt.haslayer(DHCP)  # type: ignore
+
+    measure("scapy dissection", scapy_detect, frames[: len(frames) // 10])
+
+
+if __name__ == "__main__":
+    main()
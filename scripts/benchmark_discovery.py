@@ -0,0 +1,75 @@
+"""Benchmark cold construction of the Google services we use.
+
+Compares `discovery.build()` (what we did before) with building services from the
+discovery documents read once (`google_api.discovery_document`).
+
+    python scripts/benchmark_discovery.py [--network] [--repeat N]
+
+With `--network` also measures the old way with discovery document fetched from Google.
+"""
+
+import argparse
+import os.path
+import sys
+import time
+from collections.abc import Callable
+from typing import Any
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../src"))
+
+from google.auth.credentials import AnonymousCredentials  # noqa: E402
+from googleapiclient import discovery  # noqa: E402
+
+from google_api import discovery_document  # noqa: E402
+
+APIS = [("sheets", "v4"), ("drive", "v3"), ("calendar", "v3")]
+
+
+def measure(name: str, build: Callable[[str, str], Any], repeat: int) -> None:
+    """Print time to build all APIs, first (cold) and the best of the following."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for api, version in APIS:
+            build(api, version)
+        times.append(time.perf_counter() - start)
+    print(f"{name:<40} cold {times[0] * 1000:8.1f} ms   warm {min(times) * 1000:8.1f} ms")
+
+
+def main() -> None:
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--network", action="store_true", help="fetch documents from Google")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    credentials = AnonymousCredentials()
+
+    if args.network:
+        measure(
+            "discovery.build (network)",
+            lambda api, version: discovery.build(
+                api,
+                version,
+                credentials=credentials,
+                static_discovery=False,
+                cache_discovery=False,
+            ),
+            args.repeat,
+        )
+    measure(
+        "discovery.build (static)",
+        lambda api, version: discovery.build(api, version, credentials=credentials),
+        args.repeat,
+    )
+    measure(
+        "build_from_document (read once)",
+        lambda api, version: discovery.build_from_document(
+            discovery_document(api, version),
+            credentials=credentials,
+        ),
+        args.repeat,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark HTTP requests with and without pooled keep-alive session.
+
+Runs a local stub server (like IFTTT webhook or OpenHAB REST API) and compares
+`requests.post` (new connection for each request, what we did before) with
+`http_session.get_session(...).post` (kept-alive connection).
+
+    python scripts/benchmark_http.py [--requests N]
+
+The stub is plain HTTP, with TLS (IFTTT) the saving per request is even bigger.
+"""
+
+import argparse
+import os.path
+import sys
+import threading
+import time
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../src"))
+
+import models  # noqa: E402
+from http_session import get_session  # noqa: E402
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Reply OK to any request, keep connection alive."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # as real servers do, or keep-alive hits delayed ACK
+
+    def do_POST(self) -> None:  # noqa: N802
+        """Handle POST."""
+        self.rfile.read(int(self.headers.get("content-length", 0)))
+        body = b"OK"
+        self.send_response(200)
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        """Be quiet."""
+
+
+def measure(name: str, post: Callable[[], Any], count: int) -> None:
+    """Print average time of the request."""
+    start = time.perf_counter()
+    for _ in range(count):
+        post()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<30} {elapsed / count * 1000:8.3f} ms/request")
+
+
+def main() -> None:
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/trigger/summary/with/key/key"
+    settings = models.Settings.model_construct(
+        http_timeout=models.HTTP_TIMEOUT,
+        http_retries=models.HTTP_RETRIES,
+        http_pool_size=models.HTTP_POOL_SIZE,
+    )
+    payload = '{"value1": "", "value2": "", "value3": ""}'
+    headers = {"content-type": "application/json"}
+
+    measure(
+        "requests.post",
+        lambda: requests.post(url, data=payload, headers=headers, timeout=5),
+        args.requests,
+    )
+    session = get_session(url, settings)
+    measure(
+        "pooled session.post",
+        lambda: session.post(url, data=payload, headers=headers, timeout=5),
+        args.requests,
+    )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
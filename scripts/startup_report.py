@@ -0,0 +1,71 @@
+"""Report what takes time at startup, like `python -X importtime` but readable.
+
+    python scripts/startup_report.py [module ...] [--top N]
+
+Imports the modules (default: amazon_dash) in a fresh interpreter with
+`-X importtime` and prints total import time and the slowest top-level imports.
+For example `python scripts/startup_report.py amazon_dash google_sheet` shows
+what the first Google Sheet action adds.
+"""
+
+import argparse
+import os.path
+import re
+import subprocess
+import sys
+
+SRC_FOLDER = os.path.join(os.path.dirname(__file__), "../src")
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_times(modules: list[str]) -> list[tuple[int, int, str]]:
+    """Import modules with -X importtime.
+
+    Returns [(cumulative us, nesting level, module name)].
+    """
+    # the current interpreter with fixed argv, module names are checked by module_name()
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        cwd=SRC_FOLDER,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if match := IMPORT_TIME_LINE.match(line):
+            _, cumulative, indent, name = match.groups()
+            times.append((int(cumulative), (len(indent) - 1) // 2, name))
+    return times
+
+
+def module_name(name: str) -> str:
+    """Argument type: dotted module name, so nothing else gets into `import`."""
+    if not all(part.isidentifier() for part in name.split(".")):
+        raise argparse.ArgumentTypeError(f"not a module name: {name}")
+    return name
+
+
+def main() -> None:
+    """Print report."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("modules", nargs="*", type=module_name, default=["amazon_dash"])
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    times = import_times(args.modules)
+    total = sum(cumulative for cumulative, level, _ in times if level == 0)
+    print(
+        f"startup with import {', '.join(args.modules)}: "
+        f"{total / 1000:.1f} ms, {len(times)} modules\n",
+    )
+    print(f"{'cumulative ms':>14}  module (and its direct imports)")
+    for cumulative, level, name in sorted(
+        (item for item in times if item[1] <= 1),
+        reverse=True,
+    )[: args.top]:
+        print(f"{cumulative / 1000:14.1f}  {'  ' * level}{name}")
+
+
+if __name__ == "__main__":
+    main()
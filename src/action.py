@@ -1,36 +1,126 @@
 """Register events from amazon dash (button).
 
-Supports google sheet (google_sheet.py), google calendar (google_calendar.py) and ifttt (ifttt.py)
+Supports google sheet (google_sheet.py), google calendar (google_calendar.py), ifttt (ifttt.py)
+and openhab (openhab.py).
+Backend modules are imported only when an action of their type runs first time,
+so we do not load Google API client etc. if no button uses it.
 """
 
+import asyncio
 import collections.abc
-import sys
-import traceback
-from collections.abc import Callable
+import concurrent.futures
+import logging
+import threading
+import time
+from collections.abc import Awaitable, Callable, Iterable, Iterator
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 import models
-from google_api import GoogleApi
-from google_calendar import Calendar
-from google_sheet import Sheet
-from ifttt import Ifttt
-from openhab import OpenHab
+from circuit_breaker import (
+    CircuitBreakers,
+    CircuitOpenError,
+    current_breaker,
+    endpoint,
+    is_outage,
+)
+from latency import latency
+from metrics import counters
+from micro_batch import MicroBatcher
+
+if TYPE_CHECKING:
+    import httpx
+
+    from google_api import GoogleApi
+    from google_sheet import Sheet
+    from outbox import Outbox
+
+logger = logging.getLogger(__name__)
+
+_executor: concurrent.futures.ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(max_workers: int) -> concurrent.futures.ThreadPoolExecutor:
+    """Thread pool shared by all presses to run button actions in parallel."""
+    global _executor  # noqa: PLW0603
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix="action",
+            )
+        return _executor
+
+
+def log_fields(
+    button: str,
+    act: models.ActionItem,
+    duration: float | None = None,
+) -> dict[str, Any]:
+    """Structured log fields of the action."""
+    fields: dict[str, Any] = {"button": button, "action": act.type}
+    if duration is not None:
+        fields["duration"] = round(duration, 6)
+    return fields
 
 
 class Action:
     """Register events from amazon dash (button)."""
 
-    def __init__(self, settings: models.Settings) -> None:
-        """Init."""
+    def __init__(self, settings: models.Settings, outbox: "Outbox | None" = None) -> None:
+        """Init.
+
+        :param outbox: if set, actions are recorded there before they run,
+            failed ones are retried by OutboxRetrier
+        """
         self.settings = settings
+        self.outbox = outbox
+        # coalesce Google writes of presses that come close together
+        self.batcher = (
+            MicroBatcher(settings.write_batch_window) if settings.write_batch_window else None
+        )
+        # fail fast if the backend is down, timeouts from its latency
+        self.breakers = CircuitBreakers(settings)
         self.events: dict[str, models.EventActions] = settings.events
+        # button -> preprocessed actions, they depend only on the button and settings
+        self.plans: dict[str, tuple[models.ActionItem, ...]] = {}
+
+    def button_settings(self, button: str) -> models.EventActions:
+        """Get event settings of the button."""
+        if button in self.events:
+            return self.events[button]
+        return self.events["__DEFAULT__"]
+
+    def compile_plans(self, buttons: Iterable[str]) -> None:
+        """Preprocess actions of the buttons in advance, so a press does not have to."""
+        for button in buttons:
+            for act in self.plan(button):
+                if isinstance(act.summary, list):
+                    act.summary_schedule  # noqa: B018  # build cached schedule
+
+    def plan(self, button: str) -> tuple[models.ActionItem, ...]:
+        """Get preprocessed actions of the button, preprocess if not done yet.
+
+        Actions in the plan are shared by all presses and should not be changed.
+        """
+        if (plan := self.plans.get(button)) is None:
+            # in the worst case two threads compile the same plan, no need for a lock
+            with latency.timed("preprocess_actions", button):
+                plan = tuple(self.preprocess_actions(button, self.button_settings(button)))
+            self.plans[button] = plan
+        return plan
 
     def set_summary_by_time(
         self,
         button_actions: list[models.ActionItem],
+        now: datetime | None = None,
     ) -> list[models.ActionItem]:
-        """Set event summary according now().
+        """Set event summary according the time (the press time), now() if None.
+
+        Actions are not copied, only actions with time-dependent summary are replaced
+        with shallow copies with the selected summary.
 
         If summary is a list like
 
@@ -43,51 +133,14 @@ class Action:
         if summary of any action in button_actions is a list, then select only one summary
         from the list in accordance with the current time
         """
-        result_actions = [action.model_copy(deep=True) for action in button_actions]
-        for action in result_actions:
-            if isinstance(action.summary, list):
-                assert (  # todo: put into pydantic validation
-                    len(action.summary) > 0
-                ), """summary param must be string or array like [
-        {"summary":"summary1", "before":"10:00:00"},
-        {"summary": "summary2", "before":"19:00:00"},
-        ...
-        ]"""
-                time = datetime.now()
-                interval = None
-                for _, interval in enumerate(action.summary):
-                    if interval.before is not None:
-                        interval_end_parts = [int(s) for s in self.get_time_parts(interval.before)]
-                        interval_end = time.replace(
-                            hour=interval_end_parts[0],
-                            minute=interval_end_parts[1],
-                            second=interval_end_parts[2],
-                        )
-                        if time < interval_end:
-                            action.summary = interval.summary
-                            break
-                else:
-                    action.summary = interval.summary if interval else ""
-        return result_actions
-
-    def get_time_parts(self, time_str: str) -> list[str]:
-        """Get [h, m, s] from string HH:MM:SS."""
-        time_parts = time_str.split(":")
-        valid_parts = []
-        for i in time_parts:
-            try:
-                max_time_unit = 60
-                if 0 <= int(i) < max_time_unit:
-                    valid_parts.append(i)
-            except ValueError as e:
-                raise ValueError('Between ":" in `before` param should be numbers.') from e
-        full_time_parts = 3
-        if len(valid_parts) != full_time_parts:
-            raise ValueError(
-                '`before` param should be "HH:MM:SS", '
-                f"for example 10:00:00. Got `{time_str}` instead.",
-            )
-        return time_parts
+        now = now or datetime.now()
+        return [
+            # schedule is cached in the plan action, so it is built once per button
+            action.model_copy(update={"summary": action.summary_schedule.pick(now)})
+            if isinstance(action.summary, list)
+            else action  # frozen, so no need to copy
+            for action in button_actions
+        ]
 
     def preprocess_actions(
         self,
@@ -127,39 +180,179 @@ class Action:
             for action in button_settings.actions
         ]
 
-        print(result)
+        logger.debug("Actions of %s: %s", button, result, extra={"button": button})
         return result
 
-    def action(self, button: str, dry_run: bool = False) -> None:
-        """Register event from the button."""
+    def action(
+        self,
+        button: str,
+        dry_run: bool = False,
+        press_time: datetime | None = None,
+        press_id: int | None = None,
+    ) -> None:
+        """Register event from the button.
+
+        Actions run one after another or, if `parallel` is set for the button
+        (or `parallel_actions` in settings), concurrently in the shared thread pool.
+
+        :param press_time: the actions are registered at this time, now if None
+        :param press_id: the press in the outbox, replaced with its actions
+        """
+        press_time = press_time or datetime.now()
+        button_settings = self.button_settings(button)
+        plan = self.plan(button)
+        with latency.timed("set_summary_by_time", button):
+            actions = self.set_summary_by_time(list(plan), press_time)
+        parallel = (
+            self.settings.parallel_actions
+            if button_settings.parallel is None
+            else button_settings.parallel
+        )
+        entry_ids = self.add_to_outbox(button, actions, dry_run, press_time, press_id)
+        if parallel and len(actions) > 1:
+            executor = get_executor(self.settings.action_workers)
+            concurrent.futures.wait(
+                [
+                    executor.submit(self.run_action, button, act, dry_run, entry_id, press_time)
+                    for act, entry_id in zip(actions, entry_ids, strict=True)
+                ],
+            )
+        else:
+            for act, entry_id in zip(actions, entry_ids, strict=True):
+                self.run_action(button, act, dry_run, entry_id, press_time)
+
+    def add_to_outbox(
+        self,
+        button: str,
+        actions: list[models.ActionItem],
+        dry_run: bool,
+        press_time: datetime,
+        press_id: int | None,
+    ) -> list[int | None]:
+        """Record actions of the press in the outbox, returns entry ids (None if no outbox)."""
+        if self.outbox is None or dry_run:
+            return [None] * len(actions)
+        return list(
+            self.outbox.add(button, actions, press_id=press_id, press_time=press_time.timestamp()),
+        )
+
+    def run_action(
+        self,
+        button: str,
+        act: models.ActionItem,
+        dry_run: bool = False,
+        entry_id: int | None = None,
+        press_time: datetime | None = None,
+    ) -> None:
+        """Run one action of the button.
+
+        Errors are reported and do not affect other actions of the button.
+        If the action is in the outbox (entry_id), it is marked done or scheduled for retry.
+        """
+        logger.debug("Event for %s: (%s)", act.type, act, extra=log_fields(button, act))
+        if not dry_run:
+            start = time.perf_counter()
+            try:
+                self.handle(button, act, press_time)
+            except CircuitOpenError as e:
+                self.action_failed(button, act, entry_id, e)
+            except Exception as e:  # noqa: BLE001
+                logger.exception(
+                    "Event handling error",
+                    extra=log_fields(button, act, time.perf_counter() - start),
+                )
+                self.action_failed(button, act, entry_id, e)
+            else:
+                self.action_done(button, act, entry_id, time.perf_counter() - start)
+
+    def action_done(
+        self,
+        button: str,
+        act: models.ActionItem,
+        entry_id: int | None,
+        duration: float,
+    ) -> None:
+        """Remove the action from the outbox if it is there."""
+        logger.info(
+            "%s action done in %.3f s",
+            act.type,
+            duration,
+            extra=log_fields(button, act, duration),
+        )
+        if self.outbox is not None and entry_id is not None:
+            self.outbox.done(entry_id)
+
+    def action_failed(
+        self,
+        button: str,
+        act: models.ActionItem,
+        entry_id: int | None,
+        error: Exception,
+    ) -> None:
+        """Schedule retry of the failed action if it is in the outbox."""
+        counters.inc(("action_errors", act.type))
+        if isinstance(error, CircuitOpenError):
+            logger.warning("Skip %s action: %s", act.type, error, extra=log_fields(button, act))
+        if self.outbox is not None and entry_id is not None:
+            self.outbox.failed(entry_id, repr(error))
+
+    @contextmanager
+    def circuit_breaker(self, act: models.ActionItem) -> Iterator[None]:
+        """Fail fast if the backend of the action is down, record the call result.
+
+        Raises CircuitOpenError without running the context.
+        """
+        breaker = self.breakers.get(endpoint(act))
+        if not breaker.allow():
+            raise CircuitOpenError(
+                f"{endpoint(act)} is down, will try it again "
+                f"in {self.settings.breaker_reset_timeout} seconds after the last failure",
+            )
+        token = current_breaker.set(breaker)  # timed_http() records the latencies in it
+        try:
+            yield
+        except Exception as e:
+            if is_outage(e):
+                breaker.failure()
+            else:
+                breaker.success()
+            raise
+        finally:
+            current_breaker.reset(token)
+        breaker.success()
+
+    def handle(
+        self,
+        button: str,
+        act: models.ActionItem,
+        press_time: datetime | None = None,
+    ) -> None:
+        """Register the action in its backend, raise exception if failed.
+
+        Raises CircuitOpenError without calling the backend if it is down.
+
+        :param press_time: time of the press to register, now if None
+        """
         action_handlers: dict[str, Callable[..., None]] = {
             "sheet": self.sheet_action,
             "calendar": self.calendar_action,
             "ifttt": self.ifttt_action,
             "openhab": self.openhab_action,
         }
-        if button in self.events:
-            button_settings = self.events[button]
-        else:
-            button_settings = self.events["__DEFAULT__"]
-        actions = self.preprocess_actions(button, button_settings)
-        actions = self.set_summary_by_time(actions)
-        for act in actions:
-            print(f"Event for {act.type}: ({act})")
-            if not dry_run:
-                try:
-                    action_handlers[act.type](button, act)
-                except Exception as e:  # noqa: BLE001
-                    print("!" * 5, f"Event handling error:\n{e}")
-                    traceback.print_exception(*sys.exc_info())
+        with self.circuit_breaker(act), latency.timed("action", act.type):
+            action_handlers[act.type](button, act, press_time)
 
     def ifttt_action(
         self,
         button: str,  # noqa: ARG002
         action_params: models.IftttAction,
+        press_time: datetime | None = None,  # noqa: ARG002
     ) -> None:
         """Register event in IFTTT."""
-        ifttt = Ifttt(self.settings)
+        from ifttt import Ifttt  # noqa: PLC0415
+
+        with latency.timed("client", "ifttt"):
+            ifttt = Ifttt(self.settings, self.breakers.timeout(endpoint(action_params)))
         assert isinstance(action_params.summary, str)
         ifttt.press(
             action_params.summary,
@@ -172,61 +365,316 @@ class Action:
         self,
         button: str,  # noqa: ARG002
         action_params: models.OpenhabAction,
+        press_time: datetime | None = None,  # noqa: ARG002
     ) -> None:
         """Register event in OpenHab."""
-        openhab = OpenHab(self.settings)
-        openhab.press(action_params)
+        from openhab import OpenHab  # noqa: PLC0415
+
+        with latency.timed("client", "openhab"):
+            openhab = OpenHab(self.settings)
+        openhab.press(action_params, timeout=self.breakers.timeout(endpoint(action_params)))
 
     def calendar_action(
         self,
         button: str,  # noqa: ARG002
         action_params: models.CalendarAction,
+        press_time: datetime | None = None,
     ) -> None:
         """Register event in Google Calendar."""
-        calendar = Calendar(self.settings, action_params.calendar_id)
-        self.event(calendar, action_params)
+        from google_calendar import Calendar  # noqa: PLC0415
+
+        def open_calendar() -> Calendar:
+            with latency.timed("client", "calendar"):
+                return Calendar(self.settings, action_params.calendar_id)
+
+        def register(calendar: Calendar) -> None:
+            self.event(calendar, action_params, press_time)
+
+        if self.batcher is None:
+            register(open_calendar())
+        else:
+            self.batcher.run(("calendar", action_params.calendar_id), open_calendar, register)
 
     def sheet_action(
         self,
         button: str,  # noqa: ARG002
         action_params: models.SheetAction,
+        press_time: datetime | None = None,
     ) -> None:
         """Register event in Google Sheet."""
-        sheet = Sheet(
-            self.settings,
-            action_params.name,
-            press_sheet=action_params.press_sheet,
-            event_sheet=action_params.event_sheet,
+
+        def open_sheet() -> "Sheet":
+            return self.open_sheet(action_params)
+
+        def register(sheet: "Sheet") -> None:
+            assert isinstance(action_params.summary, str)
+            sheet.press(action_params.summary, press_time)
+            self.event(sheet, action_params, press_time)
+
+        if self.batcher is None:
+            sheet = open_sheet()
+            with sheet.batch():  # all writes in one batchUpdate
+                register(sheet)
+        else:
+            key = (action_params.name, action_params.press_sheet, action_params.event_sheet)
+            self.batcher.run(("sheet", *key), open_sheet, register)
+
+    def open_sheet(self, action_params: models.SheetAction) -> "Sheet":
+        """Google Sheet of the action."""
+        from google_sheet import Sheet  # noqa: PLC0415
+
+        with latency.timed("client", "sheet"):
+            return Sheet(
+                self.settings,
+                action_params.name,
+                press_sheet=action_params.press_sheet,
+                event_sheet=action_params.event_sheet,
+            )
+
+    def replay(self, button: str, act: models.ActionItem, press_time: datetime) -> None:
+        """Retry the failed action of the press, raise exception if failed.
+
+        The failed call may have been applied (for example its answer timed out),
+        so Google Sheet and Calendar actions are skipped if the press is there already.
+        IFTTT and OpenHAB actions are sent again.
+        """
+        if self.is_registered(act, press_time):
+            logger.info(
+                "%s action is registered already, skip the retry",
+                act.type,
+                extra=log_fields(button, act),
+            )
+            return
+        self.handle(button, act, press_time)
+
+    def is_registered(self, act: models.ActionItem, press_time: datetime) -> bool:
+        """Check if the Google Sheet or Calendar action of the press is registered.
+
+        The press row and the event of a Sheet action are written in one batchUpdate,
+        so the press row is enough.
+        """
+        if not isinstance(act, models.SheetAction | models.CalendarAction):
+            return False
+        assert isinstance(act.summary, str)
+        with self.circuit_breaker(act):
+            if isinstance(act, models.SheetAction):
+                return self.open_sheet(act).has_press(act.summary, press_time)
+            from google_calendar import Calendar  # noqa: PLC0415
+
+            with latency.timed("client", "calendar"):
+                calendar = Calendar(self.settings, act.calendar_id)
+            return calendar.has_event_at(act.summary, press_time)
+
+    async def action_async(
+        self,
+        button: str,
+        client: "httpx.AsyncClient",
+        dry_run: bool = False,
+        press_time: datetime | None = None,
+        press_id: int | None = None,
+    ) -> None:
+        """Register event from the button in the event loop, async version of action().
+
+        With `parallel` the actions run concurrently as tasks instead of in the thread pool.
+        """
+        press_time = press_time or datetime.now()
+        button_settings = self.button_settings(button)
+        plan = self.plan(button)
+        with latency.timed("set_summary_by_time", button):
+            actions = self.set_summary_by_time(list(plan), press_time)
+        parallel = (
+            self.settings.parallel_actions
+            if button_settings.parallel is None
+            else button_settings.parallel
         )
+        entry_ids = self.add_to_outbox(button, actions, dry_run, press_time, press_id)
+        if parallel and len(actions) > 1:
+            await asyncio.gather(
+                *(
+                    self.run_action_async(button, act, client, dry_run, entry_id, press_time)
+                    for act, entry_id in zip(actions, entry_ids, strict=True)
+                ),
+            )
+        else:
+            for act, entry_id in zip(actions, entry_ids, strict=True):
+                await self.run_action_async(button, act, client, dry_run, entry_id, press_time)
+
+    async def run_action_async(  # noqa: PLR0913
+        self,
+        button: str,
+        act: models.ActionItem,
+        client: "httpx.AsyncClient",
+        dry_run: bool = False,
+        entry_id: int | None = None,
+        press_time: datetime | None = None,
+    ) -> None:
+        """Run one action of the button, async version of run_action()."""
+        logger.debug("Event for %s: (%s)", act.type, act, extra=log_fields(button, act))
+        if not dry_run:
+            start = time.perf_counter()
+            try:
+                await self.handle_async(button, act, client, press_time)
+            except CircuitOpenError as e:
+                self.action_failed(button, act, entry_id, e)
+            except Exception as e:  # noqa: BLE001
+                logger.exception(
+                    "Event handling error",
+                    extra=log_fields(button, act, time.perf_counter() - start),
+                )
+                self.action_failed(button, act, entry_id, e)
+            else:
+                self.action_done(button, act, entry_id, time.perf_counter() - start)
+
+    async def handle_async(
+        self,
+        button: str,
+        act: models.ActionItem,
+        client: "httpx.AsyncClient",
+        press_time: datetime | None = None,
+    ) -> None:
+        """Register the action in its backend with the async client, see handle()."""
+        action_handlers: dict[str, Callable[..., Awaitable[None]]] = {
+            "sheet": self.sheet_action_async,
+            "calendar": self.calendar_action_async,
+            "ifttt": self.ifttt_action_async,
+            "openhab": self.openhab_action_async,
+        }
+        with self.circuit_breaker(act), latency.timed("action", act.type):
+            await action_handlers[act.type](button, act, client, press_time)
+
+    async def ifttt_action_async(
+        self,
+        button: str,  # noqa: ARG002
+        action_params: models.IftttAction,
+        client: "httpx.AsyncClient",
+        press_time: datetime | None = None,  # noqa: ARG002
+    ) -> None:
+        """Register event in IFTTT with async client."""
+        from ifttt import Ifttt  # noqa: PLC0415
+
         assert isinstance(action_params.summary, str)
-        sheet.press(action_params.summary)
-        self.event(sheet, action_params)
+        with latency.timed("client", "ifttt"):
+            ifttt = Ifttt(self.settings, self.breakers.timeout(endpoint(action_params)))
+        await ifttt.press_async(
+            client,
+            action_params.summary,
+            action_params.value1,
+            action_params.value2,
+            action_params.value3,
+        )
+
+    async def openhab_action_async(
+        self,
+        button: str,  # noqa: ARG002
+        action_params: models.OpenhabAction,
+        client: "httpx.AsyncClient",
+        press_time: datetime | None = None,  # noqa: ARG002
+    ) -> None:
+        """Register event in OpenHab with async client."""
+        from openhab import OpenHab  # noqa: PLC0415
+
+        with latency.timed("client", "openhab"):
+            openhab = OpenHab(self.settings)
+        await openhab.press_async(
+            client,
+            action_params,
+            timeout=self.breakers.timeout(endpoint(action_params)),
+        )
+
+    async def calendar_action_async(
+        self,
+        button: str,  # noqa: ARG002
+        action_params: models.CalendarAction,
+        client: "httpx.AsyncClient",
+        press_time: datetime | None = None,
+    ) -> None:
+        """Register event in Google Calendar with async client."""
+        from google_calendar import Calendar  # noqa: PLC0415
+
+        with latency.timed("client", "calendar"):
+            calendar = Calendar(self.settings, action_params.calendar_id)  # no API calls
+        async with calendar.batch_async(client):  # close and start concurrently
+            await self.event_async(calendar, action_params, client, press_time)
+
+    async def sheet_action_async(
+        self,
+        button: str,  # noqa: ARG002
+        action_params: models.SheetAction,
+        client: "httpx.AsyncClient",
+        press_time: datetime | None = None,
+    ) -> None:
+        """Register event in Google Sheet with async client."""
+        from sheet_cache import get_sheet_id_cache  # noqa: PLC0415
+
+        if get_sheet_id_cache(self.settings).get(action_params.name):
+            sheet = self.open_sheet(action_params)  # ids are cached, no API calls
+        else:  # looks up the ids with sync API once, do not block the loop
+            sheet = await asyncio.to_thread(self.open_sheet, action_params)
+        async with sheet.batch_async(client):  # all writes in one batchUpdate
+            assert isinstance(action_params.summary, str)
+            sheet.press(action_params.summary, press_time)
+            await self.event_async(sheet, action_params, client, press_time)
 
     def event(
         self,
-        target: GoogleApi,
+        target: "GoogleApi",
         action_params: models.CalendarAction | models.SheetAction,
+        press_time: datetime | None = None,
     ) -> None:
         """Event registration common logic."""
         assert isinstance(action_params.summary, str)
         last_event_row, last_event = target.get_last_event(action_params.summary)
+        self.register_event(target, action_params, last_event_row, last_event, press_time)
+
+    async def event_async(
+        self,
+        target: "GoogleApi",
+        action_params: models.CalendarAction | models.SheetAction,
+        client: "httpx.AsyncClient",
+        press_time: datetime | None = None,
+    ) -> None:
+        """Event registration common logic, async version of event()."""
+        assert isinstance(action_params.summary, str)
+        last_event_row, last_event = await target.get_last_event_async(
+            client,
+            action_params.summary,
+        )
+        self.register_event(target, action_params, last_event_row, last_event, press_time)
+
+    def register_event(
+        self,
+        target: "GoogleApi",
+        action_params: models.CalendarAction | models.SheetAction,
+        last_event_row: int | str | None,
+        last_event: list[Any] | None,
+        press_time: datetime | None = None,
+    ) -> None:
+        """Close the last event and/or start new one at the press time (now if None).
+
+        Writes only, so inside target batch they are postponed till the flush.
+        The same press always gives the same writes, so its retry can find them.
+        """
+        fields = {"action": action_params.type, "summary": action_params.summary}
+        pressed = press_time or datetime.now()
         if last_event:
             assert last_event_row is not None
             last_start = last_event[1]
             last_end = last_event[2] if len(last_event) > 2 else None  # noqa: PLR2004
-            nowtz = datetime.now(last_start.tzinfo)
+            nowtz = pressed.astimezone(last_start.tzinfo) if last_start.tzinfo else pressed
             if last_end and abs(nowtz - last_end) < timedelta(seconds=action_params.restart):
-                print(
+                logger.info(
                     "Button press ignored because previuos event closed "
                     "and it is too early to start new one",
+                    extra=fields,
                 )
                 return
             if last_start <= nowtz and (nowtz - last_start) < timedelta(
                 seconds=action_params.restart,
             ):
-                print(
+                logger.info(
                     "Button press ignored because event in progress "
                     "and it is too early to close it",
+                    extra=fields,
                 )
                 return
             if not last_end:
@@ -235,11 +683,11 @@ class Action:
                         last_event_row,
                         (last_start + timedelta(seconds=action_params.default)),
                     )
-                    print("Auto close previous event")
+                    logger.info("Auto close previous event", extra=fields)
                 else:
-                    target.close_event(last_event_row, datetime.now())
-                    print("Close previous event")
+                    target.close_event(last_event_row, pressed)
+                    logger.info("Close previous event", extra=fields)
                     return
         assert isinstance(action_params.summary, str)
-        target.start_event(action_params.summary)
-        print("New event started")
+        target.start_event(action_params.summary, pressed)
+        logger.info("New event started", extra=fields)
@@ -1,28 +1,68 @@
 """Amazon Dash Button server.
 
 Sniff for ARP traffic and detects amazon dash (button) press.
-Register events in class Action
+Presses are queued to Dispatcher workers (or AsyncEngine event loop) that register
+events in class Action.
+Log records are written to stdout by LogWriter thread, so capture does not wait for stdout.
 """
 
+import atexit
+import logging
 import os.path
+import signal
 import sys
-from datetime import datetime, timedelta
-from typing import Any
-
-from scapy.all import (
-    Packet,
-    sniff,
-)
-from scapy.layers.dhcp import DHCP
-from scapy.layers.l2 import ARP
+import threading
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
 
 import models
 from action import Action
+from async_engine import AsyncEngine
+from dispatcher import Dispatcher, Press
+from expiring_set import ExpiringSet
+from file_watcher import FileWatcher
+from latency import latency
+from log import LogWriter
+from metrics import MetricsServer, collect, counters
+from outbox import Outbox, OutboxRetrier
+from raw_capture import RawCapture
+
+if TYPE_CHECKING:
+    import httpx
+    from scapy.packet import Packet
+
+logger = logging.getLogger(__name__)
 
 NO_SETTINGS_FILE = """\nNo {} found. \nIf you run application in docker container you
 should connect volume with setting files, like
     -v $PWD/amazon-dash-private:/amazon-dash-private:ro"""
 
+SETTINGS_FOLDER = ".."
+CAPTURE_FILTER = "arp or (udp and port 67)"
+REPORT_WINDOW = 60  # seconds, unknown MAC reports rate limit window
+# settings used only at start, we cannot apply them on reload
+RESTART_SETTINGS = (
+    "sniff_backend",
+    "sniff_interface",
+    "press_queue_size",
+    "press_workers",
+    "engine",
+    "async_max_connections",
+    "action_workers",
+    "http_timeout",
+    "http_retries",
+    "http_pool_size",
+    "outbox_file_name",
+    "outbox_retry_delay",
+    "outbox_max_retry_delay",
+    "outbox_max_attempts",
+    "reload_interval",
+    "metrics_port",
+    "metrics_host",
+    "log_format",
+)
+
 
 class AmazonDash:
     """Amazon Dash Button server."""
@@ -31,12 +71,26 @@ class AmazonDash:
         """Init."""
         self.buttons: dict[str, Any] = {}
         self.settings: models.Settings | None = None
-        self.seen_macs: set[str] = set()
-        self.seen_dhcp: set[str] = set()
-        self.debounce: dict[  # bounce protection (in less than bounce_delay from last event)
-            str,
-            dict[str, Any],
-        ] = {}
+        self.dispatcher: Dispatcher | AsyncEngine | None = None
+        self.actions: Action | None = None
+        self.outbox: Outbox | None = None
+        # unknown MACs already reported
+        self.seen_macs = ExpiringSet(models.SEEN_MACS_CAPACITY, models.SEEN_MACS_TTL)
+        self.seen_dhcp = ExpiringSet(models.SEEN_MACS_CAPACITY, models.SEEN_MACS_TTL)
+        self.report_window_start = 0.0
+        self.reports_in_window = 0
+        self.suppressed_reports = 0  # MACs not reported in the window
+        self.suppressed_macs: set[str] = set()  # to count each MAC once, cleared with the window
+        # bounce protection (in less than bounce_delay from last event): button -> last press time
+        self.debounce: dict[str, float] = {}
+        self.sniff_socket: Any = None  # scapy socket, to change its filter on reload
+        self.raw_capture: RawCapture | None = None  # raw backend, to change its filter on reload
+        self.sniff_filter: str | None = None
+        # changed only from the capture thread, so no locks
+        self.frames = 0
+        self.unknown_frames = 0
+        # set by SIGUSR1, the report is logged from the latency-reporter thread
+        self.latency_requested = threading.Event()
 
     @staticmethod
     def button_file_name(root: str) -> str:
@@ -48,22 +102,30 @@ class AmazonDash:
         """Return settings file name."""
         return os.path.join(root, "amazon-dash-private", "settings.json")
 
-    def load_settings(self, settings_folder: str = "..") -> models.Settings:
+    def load_settings(self, settings_folder: str = SETTINGS_FOLDER) -> models.Settings:
         """Load settings."""
         if not os.path.isfile(self.setting_file_name(settings_folder)):
             print(NO_SETTINGS_FILE.format(self.setting_file_name(settings_folder)))
             sys.exit(1)
+        return self.read_settings(settings_folder)
+
+    def read_settings(self, settings_folder: str = SETTINGS_FOLDER) -> models.Settings:
+        """Read and validate settings file."""
         with open(
             self.setting_file_name(settings_folder),
             encoding="utf-8-sig",
         ) as settings_file:
             return models.Settings.model_validate_json(settings_file.read())
 
-    def load_buttons(self, settings_folder: str = "..") -> dict[str, Any]:
+    def load_buttons(self, settings_folder: str = SETTINGS_FOLDER) -> dict[str, Any]:
         """Load known buttons."""
         if not os.path.isfile(self.button_file_name(settings_folder)):
             print(NO_SETTINGS_FILE.format(self.button_file_name(settings_folder)))
             sys.exit(1)
+        return self.read_buttons(settings_folder)
+
+    def read_buttons(self, settings_folder: str = SETTINGS_FOLDER) -> dict[str, Any]:
+        """Read and validate buttons file."""
         with open(
             self.button_file_name(settings_folder),
             encoding="utf-8-sig",
@@ -72,20 +134,121 @@ class AmazonDash:
                 exclude_none=True,
             )
 
-    def arp_handler(self, pkt: Packet) -> None:
+    def reload(self, changed_files: list[str], settings_folder: str = SETTINGS_FOLDER) -> None:
+        """Reload changed settings files (called by FileWatcher).
+
+        If a file is absent or not valid, we keep working with the loaded settings.
+        """
+        buttons, settings = self.buttons, self.settings
+        try:
+            if self.button_file_name(settings_folder) in changed_files:
+                buttons = self.read_buttons(settings_folder)
+            if self.setting_file_name(settings_folder) in changed_files:
+                settings = self.read_settings(settings_folder)
+        except (OSError, ValueError) as e:  # pydantic ValidationError is ValueError
+            logger.error("Settings are not reloaded, continue with the previous ones:\n%s", e)
+            return
+        assert settings is not None
+        self.apply(buttons, settings)
+
+    def apply(self, buttons: dict[str, Any], settings: models.Settings) -> None:
+        """Swap in reloaded buttons and settings, rebuild only what depends on changed ones.
+
+        All is built before the swap, so a press uses either old or new settings.
+        Bounce protection and backend clients are kept.
+        """
+        assert self.settings is not None and self.actions is not None
+        settings_changed = settings != self.settings
+        if not settings_changed and buttons == self.buttons:
+            return
+        if settings_changed:
+            actions = Action(settings, self.outbox)  # all plans depend on settings
+            # keep backends state and latencies
+            actions.breakers = self.actions.breakers
+            actions.breakers.configure(settings)
+            if restart_needed := [
+                name
+                for name in RESTART_SETTINGS
+                if getattr(settings, name) != getattr(self.settings, name)
+            ]:
+                logger.warning(
+                    "Restart to apply changed settings: %s",
+                    ", ".join(restart_needed),
+                )
+            if settings.log_level != self.settings.log_level:
+                logging.getLogger().setLevel(settings.log_level)
+        else:
+            actions = self.actions  # plans of the buttons are still valid
+        actions.compile_plans(buttons.values())
+        for seen in (self.seen_macs, self.seen_dhcp):
+            seen.capacity = settings.seen_macs_capacity
+            seen.ttl = settings.seen_macs_ttl
+        self.actions = actions
+        self.settings = settings
+        self.buttons = buttons
+        capturing = self.sniff_socket is not None or self.raw_capture is not None
+        if capturing and self.capture_filter() != self.sniff_filter:
+            self.update_sniff_filter()
+        logger.info("Settings reloaded, %s buttons", len(self.buttons))
+
+    def arp_handler(self, pkt: "Packet") -> None:
         """Handle sniffed ARP and DHCP requests."""
+        # scapy is imported only if we sniff with it, already loaded at this point
+        from scapy.layers.dhcp import DHCP  # noqa: PLC0415
+        from scapy.layers.l2 import ARP  # noqa: PLC0415
+
+        self.frames += 1
         who_has_request = 1
         if pkt.haslayer(ARP) and pkt[ARP].op == who_has_request or pkt.haslayer(DHCP):
             mac = str(pkt.src)  # pkt[layer].hwsrc
             if mac in self.buttons:
-                self.trigger(self.buttons[mac], datetime.fromtimestamp(float(pkt.time)))
+                self.trigger(self.buttons[mac], datetime.fromtimestamp(float(pkt.time)), mac)
             else:
-                if pkt.haslayer(DHCP) and mac not in self.seen_dhcp:
-                    print(f"DHCP request from unknown MAC {mac}:\n{pkt[DHCP].options}")
-                    self.seen_dhcp.add(mac)
-                if mac not in self.seen_macs and mac not in self.seen_dhcp:
-                    print(f"Network request from unknown MAC {mac}")
-                    self.seen_macs.add(mac)
+                is_dhcp = pkt.haslayer(DHCP)
+                self.learn(mac, is_dhcp, f":\n{pkt[DHCP].options}" if is_dhcp else "")
+
+    def raw_frame_handler(self, mac: str, frame_time: float, is_dhcp: bool) -> None:
+        """Handle ARP and DHCP requests captured by RawCapture."""
+        assert self.settings is not None
+        self.frames += 1
+        if mac in self.buttons:
+            self.trigger(self.buttons[mac], datetime.fromtimestamp(frame_time), mac)
+        elif self.settings.sniff_mode == "learn":  # VLAN tagged frames may pass the kernel filter
+            self.learn(mac, is_dhcp)
+
+    def learn(self, mac: str, is_dhcp: bool, details: str = "") -> None:
+        """Report request from unknown MAC."""
+        self.unknown_frames += 1
+        if is_dhcp and mac not in self.seen_dhcp and self.may_report(mac):
+            logger.info("DHCP request from unknown MAC %s%s", mac, details, extra={"mac": mac})
+            self.seen_dhcp.add(mac)
+        if mac not in self.seen_macs and mac not in self.seen_dhcp and self.may_report(mac):
+            logger.info("Network request from unknown MAC %s", mac, extra={"mac": mac})
+            self.seen_macs.add(mac)
+
+    def may_report(self, mac: str) -> bool:
+        """Rate limit for unknown MAC reports in learning mode.
+
+        Not reported MACs are not marked as seen, so they will be reported later.
+        Each of them is counted as suppressed once in the window, not on each frame.
+        """
+        assert self.settings is not None
+        now = time.monotonic()
+        if now - self.report_window_start >= REPORT_WINDOW:
+            if self.suppressed_reports:
+                logger.info("Suppressed %s unknown MAC reports", self.suppressed_reports)
+            self.report_window_start = now
+            self.reports_in_window = 0
+            self.suppressed_reports = 0
+            self.suppressed_macs = set()
+        if self.reports_in_window >= self.settings.unknown_mac_reports_per_minute:
+            if mac not in self.suppressed_macs:
+                self.suppressed_reports += 1
+                if len(self.suppressed_macs) < self.settings.seen_macs_capacity:
+                    self.suppressed_macs.add(mac)
+            return False
+        self.reports_in_window += 1
+        return True
 
     def is_bounced(self, button: str, press_time: datetime) -> bool:
         """Check if the button is pressed too recently and the press should be ignored.
@@ -93,37 +256,248 @@ class AmazonDash:
         If this is not bouncing we register the press in debounce dict.
         """
         assert self.settings is not None
-        if (
-            button in self.debounce
-            and self.debounce[button]["time"] + timedelta(seconds=self.settings.bounce_delay)
-            > press_time
-        ):
+        timestamp = press_time.timestamp()
+        last_press = self.debounce.get(button)
+        if last_press is not None and last_press + self.settings.bounce_delay > timestamp:
             return True
 
-        self.debounce[button] = {"time": press_time}
+        self.debounce[button] = timestamp
         return False
 
-    def trigger(self, button: str, press_time: datetime) -> None:
+    def stats(self) -> dict[str, Any]:
+        """Sizes and eviction counters of the press detection memory, backends state."""
+        return {
+            "seen_macs": self.seen_macs.stats(),
+            "seen_dhcp": self.seen_dhcp.stats(),
+            "debounce": len(self.debounce),
+            "breakers": self.actions.breakers.stats() if self.actions is not None else {},
+        }
+
+    def trigger(self, button: str, press_time: datetime, mac: str | None = None) -> None:
         """Button press action."""
         assert self.settings is not None
-        if self.is_bounced(button, press_time):
-            print(
-                f'Bounce protection. Skip this network request from "{button}" '
-                f'as duplicate (see "bounce_delay" in settings).',
+        latency.record("capture", button, time.time() - press_time.timestamp())
+        with latency.timed("debounce", button):
+            bounced = self.is_bounced(button, press_time)
+        if bounced:
+            counters.inc(("bounced", button))
+            logger.debug(
+                'Bounce protection. Skip this network request from "%s" '
+                'as duplicate (see "bounce_delay" in settings).',
+                button,
+                extra={"button": button, "mac": mac},
             )
             return
-        print(f'button "{button}" pressed')
-        Action(self.settings).action(button)
+        counters.inc(("presses", button))
+        logger.info('button "%s" pressed', button, extra={"button": button, "mac": mac})
+        self.submit(button, press_time)
+
+    def submit(self, button: str, press_time: datetime, press_id: int | None = None) -> None:
+        """Queue the press, record it in the outbox first so a crash does not lose it."""
+        assert self.dispatcher is not None
+        if self.outbox is not None and press_id is None:
+            press_id = self.outbox.add_press(button, press_time.timestamp())
+        if not self.dispatcher.submit(button, press_time, press_id) and press_id is not None:
+            assert self.outbox is not None
+            self.outbox.drop_press(press_id)
+
+    def submit_left_presses(self) -> None:
+        """Queue presses the previous run recorded in the outbox and did not handle."""
+        assert self.outbox is not None
+        for press_id, button, press_time in self.outbox.presses():
+            logger.info(
+                'Queue press of "%s" left by the previous run',
+                button,
+                extra={"button": button},
+            )
+            self.submit(button, datetime.fromtimestamp(press_time), press_id)
+
+    def action(self, press: Press) -> None:
+        """Register button press events (runs in a Dispatcher worker thread)."""
+        assert self.actions is not None
+        self.actions.action(press.button, press_time=press.time, press_id=press.outbox_id)
+
+    async def action_async(self, press: Press, client: "httpx.AsyncClient") -> None:
+        """Register button press events (runs in AsyncEngine event loop)."""
+        assert self.actions is not None
+        await self.actions.action_async(
+            press.button,
+            client,
+            press_time=press.time,
+            press_id=press.outbox_id,
+        )
+
+    def replay(self, button: str, act: models.ActionItem, press_time: float) -> None:
+        """Retry failed action (runs in OutboxRetrier thread)."""
+        assert self.actions is not None
+        self.actions.replay(button, act, datetime.fromtimestamp(press_time))
+
+    def request_latency(self, signum: int, frame: Any) -> None:  # noqa: ARG002
+        """SIGUSR1 handler.
+
+        Only sets the flag: logging from a signal handler can deadlock on the lock
+        of the log handler the interrupted code holds.
+        """
+        self.latency_requested.set()
+
+    def log_latency(self) -> None:
+        """Log press path latencies."""
+        logger.info("Press path latencies, ms:\n%s", latency.report())
+
+    def report_latency(self) -> None:
+        """Log press path latencies on each request (latency-reporter thread loop)."""
+        while self.latency_requested.wait():
+            self.latency_requested.clear()
+            self.log_latency()
+
+    def start_logging(self) -> None:
+        """Write log records in background thread, flush them on exit."""
+        assert self.settings is not None
+        logging.getLogger().setLevel(self.settings.log_level)
+        log_writer = LogWriter(self.settings.log_format)
+        log_writer.start()
+        atexit.register(log_writer.stop)
+
+    def open_outbox(self) -> None:
+        """Open outbox if it is configured."""
+        assert self.settings is not None
+        if self.settings.outbox_file_name:
+            self.outbox = Outbox(
+                self.settings.outbox_file_name,
+                retry_delay=self.settings.outbox_retry_delay,
+                max_retry_delay=self.settings.outbox_max_retry_delay,
+                max_attempts=self.settings.outbox_max_attempts,
+            )
+
+    def compile_actions(self) -> Action:
+        """Create Action with plans compiled for all known buttons."""
+        assert self.settings is not None
+        actions = Action(self.settings, self.outbox)
+        actions.compile_plans(self.buttons.values())
+        return actions
+
+    def capture_filter(self) -> str:
+        """BPF filter for sniffing.
+
+        In "buttons" mode only frames from known buttons pass the filter,
+        so the kernel drops all other traffic before it reaches Python.
+        """
+        if macs := self.filter_macs():
+            return f"({CAPTURE_FILTER}) and ({' or '.join(f'ether src {mac}' for mac in macs)})"
+        return CAPTURE_FILTER
+
+    def filter_macs(self) -> list[str]:
+        """MACs for the capture filter, empty list if all MACs pass."""
+        assert self.settings is not None
+        if self.settings.sniff_mode == "buttons":
+            return sorted(self.buttons)
+        return []
 
     def sniff_arp(self) -> None:
         """Sniff for ARP and DHCP requests."""
-        sniff(prn=self.arp_handler, store=0, filter="arp or (udp and port 67)")
+        assert self.settings is not None
+        if self.settings.sniff_backend == "raw":
+            self.sniff_filter = self.capture_filter()
+            self.raw_capture = RawCapture(
+                self.raw_frame_handler,
+                self.settings.sniff_interface,
+                self.filter_macs(),
+            )
+            self.raw_capture.run()
+        else:
+            from scapy.sendrecv import sniff  # noqa: PLC0415
+
+            self.sniff_socket = self.open_scapy_socket()
+            sniff(prn=self.arp_handler, store=0, opened_socket=self.sniff_socket)
+
+    def open_scapy_socket(self) -> Any:
+        """Open scapy capture socket with the capture filter.
+
+        We open the socket ourselves to change its filter on reload.
+        The layers are imported first: the socket picks its decode class from
+        `conf.l2types` when it is opened, without Ether all frames are Raw.
+        """
+        assert self.settings is not None
+        # scapy.all takes seconds to import on slow devices, we need only sniff and 2 layers
+        import scapy.layers.dhcp  # noqa: PLC0415, F401 (also loads inet)
+        import scapy.layers.l2  # noqa: PLC0415, F401 (registers Ether in conf.l2types)
+        from scapy.config import conf  # noqa: PLC0415
+
+        self.sniff_filter = self.capture_filter()
+        return conf.L2listen(iface=self.settings.sniff_interface, filter=self.sniff_filter)
+
+    def update_sniff_filter(self) -> None:
+        """Replace the kernel filter of the running sniff socket.
+
+        Linux replaces the filter atomically, so sniff is not interrupted.
+        """
+        new_filter = self.capture_filter()
+        try:
+            if self.raw_capture is not None:
+                self.raw_capture.set_macs(self.filter_macs())
+            else:
+                self.attach_scapy_filter(new_filter)
+        except (ImportError, AttributeError, OSError) as e:
+            logger.warning("Cannot change capture filter, restart to apply it: %s", e)
+            return
+        self.sniff_filter = new_filter
+        logger.info("Capture filter changed to %s", new_filter)
+
+    def attach_scapy_filter(self, new_filter: str) -> None:
+        """Replace the filter of the scapy socket, raise OSError if it cannot be compiled."""
+        from scapy.arch.linux import attach_filter  # noqa: PLC0415
+        from scapy.error import Scapy_Exception  # noqa: PLC0415
+
+        try:
+            attach_filter(self.sniff_socket.ins, new_filter, self.sniff_socket.iface)
+        except Scapy_Exception as e:  # for example no tcpdump to compile the filter
+            raise OSError(str(e)) from e
 
     def run(self) -> None:
         """Run server."""
         self.buttons = self.load_buttons()
         self.settings = self.load_settings()
-        print(f"amazon_dash started, loaded {len(self.buttons)} buttons")
+        self.start_logging()
+        self.seen_macs = ExpiringSet(self.settings.seen_macs_capacity, self.settings.seen_macs_ttl)
+        self.seen_dhcp = ExpiringSet(self.settings.seen_macs_capacity, self.settings.seen_macs_ttl)
+        self.open_outbox()
+        self.actions = self.compile_actions()
+        if self.settings.engine == "async":
+            self.dispatcher = AsyncEngine(self.action_async, self.settings)
+        else:
+            self.dispatcher = Dispatcher(
+                self.action,
+                queue_size=self.settings.press_queue_size,
+                workers=self.settings.press_workers,
+            )
+        self.dispatcher.start()
+        if self.outbox is not None:  # retry actions failed in this or previous run
+            self.submit_left_presses()
+            OutboxRetrier(self.outbox, self.replay).start()
+        if self.settings.metrics_port is not None:
+            MetricsServer(
+                self.settings.metrics_host,
+                self.settings.metrics_port,
+                lambda: collect(self),
+            ).start()
+        if hasattr(signal, "SIGUSR1"):  # not on Windows
+            threading.Thread(
+                target=self.report_latency,
+                name="latency-reporter",
+                daemon=True,
+            ).start()
+            signal.signal(signal.SIGUSR1, self.request_latency)
+        if self.settings.reload_interval:
+            FileWatcher(
+                [self.button_file_name(SETTINGS_FOLDER), self.setting_file_name(SETTINGS_FOLDER)],
+                self.reload,
+                self.settings.reload_interval,
+            ).start()
+        logger.info(
+            "amazon_dash started in %s mode, loaded %s buttons",
+            self.settings.sniff_mode,
+            len(self.buttons),
+        )
         self.sniff_arp()
 
 
@@ -0,0 +1,168 @@
+"""Handle button presses in one asyncio event loop.
+
+Alternative to Dispatcher for `"engine": "async"`. The capture thread hands presses
+to the loop thread, each press is a task and all backends share one `httpx`
+client, so presses waiting for slow backends take no threads and reuse connections.
+The number of presses in flight is bounded, extra presses are dropped like in
+Dispatcher when its queue is full.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+import models
+from dispatcher import Press, press_done
+from latency import latency
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncEngine:
+    """Run async button press handler in the event loop thread."""
+
+    def __init__(
+        self,
+        handler: Callable[[Press, "httpx.AsyncClient"], Awaitable[None]],
+        settings: models.Settings,
+        transport: "httpx.AsyncBaseTransport | None" = None,
+    ) -> None:
+        """Init.
+
+        :param handler: handles the press of the button with the shared client
+        :param transport: for tests, by default connection pool with `http_*` settings
+        """
+        self.handler = handler
+        self.settings = settings
+        self.transport = transport
+        self.max_in_flight = settings.press_queue_size
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.client: httpx.AsyncClient | None = None
+        self.thread: threading.Thread | None = None
+        self.ready = threading.Event()
+        self.tasks: set[asyncio.Task[None]] = set()  # keep references, the loop does not
+        self.lock = threading.Lock()  # counters are changed from capture and loop threads
+        self.in_flight = 0
+        self.max_depth = 0
+        self.submitted = 0
+        self.dropped = 0
+        self.processed = 0
+        self.failed = 0
+
+    def open_client(self) -> "httpx.AsyncClient":
+        """Create HTTP client shared by all presses."""
+        import httpx  # noqa: PLC0415
+
+        limits = httpx.Limits(
+            max_connections=self.settings.async_max_connections,
+            max_keepalive_connections=self.settings.http_pool_size,
+        )
+        return httpx.AsyncClient(
+            timeout=self.settings.http_timeout,
+            transport=self.transport
+            or httpx.AsyncHTTPTransport(limits=limits, retries=self.settings.http_retries),
+        )
+
+    def start(self) -> None:
+        """Start the event loop thread."""
+        self.loop = asyncio.new_event_loop()
+        self.client = self.open_client()
+        self.thread = threading.Thread(target=self.run, name="async-engine", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+    def run(self) -> None:
+        """Event loop thread."""
+        assert self.loop is not None
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self.ready.set)
+        self.loop.run_forever()
+
+    def stop(self) -> None:
+        """Stop the event loop after all presses in flight are handled."""
+        if self.loop is None or self.thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = self.thread = None
+
+    async def shutdown(self) -> None:
+        """Wait for the presses in flight and close the client."""
+        while self.tasks:
+            await asyncio.gather(*self.tasks)
+        assert self.client is not None
+        await self.client.aclose()
+
+    def submit(self, button: str, press_time: datetime, outbox_id: int | None = None) -> bool:
+        """Pass the press to the event loop.
+
+        Never blocks, returns False if the press was dropped because too many are in flight.
+        """
+        assert self.loop is not None
+        with self.lock:
+            if self.in_flight >= self.max_in_flight:
+                self.dropped += 1
+                dropped = self.dropped
+            else:
+                dropped = 0
+                self.in_flight += 1
+                self.submitted += 1
+                self.max_depth = max(self.max_depth, self.in_flight)
+        if dropped:
+            logger.warning(
+                'Too many presses in flight (%s), drop press of "%s" (dropped %s so far)',
+                self.max_in_flight,
+                button,
+                dropped,
+                extra={"button": button},
+            )
+            return False
+        self.loop.call_soon_threadsafe(self.spawn, Press(button, press_time, outbox_id))
+        return True
+
+    def spawn(self, press: Press) -> None:
+        """Start the press task (in the loop thread)."""
+        task = asyncio.get_running_loop().create_task(self.handle(press))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def handle(self, press: Press) -> None:
+        """Press task."""
+        assert self.client is not None
+        failed = False
+        latency.record("queue", press.button, time.time() - press.time.timestamp())
+        try:
+            await self.handler(press, self.client)
+        except Exception:  # noqa: BLE001
+            failed = True
+            logger.exception(
+                'Button "%s" press handling error',
+                press.button,
+                extra={"button": press.button},
+            )
+        finally:
+            press_done(press)
+            with self.lock:
+                self.in_flight -= 1
+                self.processed += 1
+                self.failed += failed
+
+    def stats(self) -> dict[str, int]:
+        """Engine counters, the same as Dispatcher has."""
+        return {
+            "depth": self.in_flight,
+            "max_depth": self.max_depth,
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,265 @@
+"""Circuit breakers and adaptive timeouts per backend endpoint.
+
+After `breaker_failures` failures in a row the endpoint is considered down
+(circuit open) and its actions fail fast, without waiting for the timeout, so
+one dead backend does not hold press workers for the others. Failed actions go
+to the outbox if it is configured. After `breaker_reset_timeout` seconds one
+action is let through (half-open): if it succeeds the circuit is closed.
+
+Timeouts are derived from p99 of the recent HTTP call latencies of the endpoint,
+bounded by `http_min_timeout` and `http_timeout`. Calls timed with `timed_http()`
+inside `Action.circuit_breaker()` count in the breaker of the action. A call that
+timed out counts with its duration, so the timeout grows if the backend gets slower,
+and the half-open probe waits for `http_timeout`.
+"""
+
+import http.client
+import math
+import socket
+import ssl
+import sys
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+
+import models
+from latency import latency
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+LATENCY_SAMPLES = 200  # recent latencies of the endpoint to estimate p99
+LATENCY_MIN_SAMPLES = 20  # use fixed timeout until we have that many
+TIMEOUT_P99_FACTOR = 3  # timeout is p99 latency times this
+HTTP_TOO_MANY_REQUESTS = 429
+HTTP_SERVER_ERROR = 500
+
+
+class CircuitOpenError(Exception):
+    """The backend is down, the action is not sent."""
+
+
+def transport_errors() -> tuple[type[BaseException], ...]:
+    """Errors of the connection to the backend, of the HTTP clients that are loaded.
+
+    The clients are imported only with their backends, if a client is not loaded
+    its errors cannot be raised.
+    """
+    errors: list[type[BaseException]] = [
+        ConnectionError,
+        TimeoutError,
+        socket.gaierror,
+        ssl.SSLError,
+        http.client.HTTPException,
+    ]
+    if (requests := sys.modules.get("requests")) is not None:
+        errors += [requests.ConnectionError, requests.Timeout]
+    if (httpx := sys.modules.get("httpx")) is not None:
+        errors.append(httpx.TransportError)
+    if (httplib2 := sys.modules.get("httplib2")) is not None:
+        errors.append(httplib2.HttpLib2Error)
+    if (google_auth := sys.modules.get("google.auth.exceptions")) is not None:
+        errors.append(google_auth.TransportError)
+    return tuple(errors)
+
+
+def is_timeout(error: BaseException) -> bool:
+    """Check if the error is a timeout of the HTTP call, or raised while handling one."""
+    timeouts: list[type[BaseException]] = [TimeoutError]
+    if (requests := sys.modules.get("requests")) is not None:
+        timeouts.append(requests.Timeout)
+    if (httpx := sys.modules.get("httpx")) is not None:
+        timeouts.append(httpx.TimeoutException)
+    if isinstance(error, tuple(timeouts)):
+        return True
+    cause = error.__cause__ or error.__context__
+    return cause is not None and is_timeout(cause)
+
+
+def is_outage(error: BaseException) -> bool:
+    """Check if the error means the backend is down or overloaded.
+
+    Only transport errors, 5xx and 429 are outages. Client errors and errors of
+    the action settings, for example a spreadsheet is not found or no IFTTT key
+    file, do not open the breaker the other buttons share.
+    An error raised while handling an outage error (like IftttError) is an outage.
+    """
+    status = getattr(getattr(error, "resp", None), "status", None)  # googleapiclient
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)  # requests, httpx
+    if status is not None:
+        status = int(status)
+        return status >= HTTP_SERVER_ERROR or status == HTTP_TOO_MANY_REQUESTS
+    if isinstance(error, transport_errors()):
+        return True
+    cause = error.__cause__ or error.__context__
+    return cause is not None and is_outage(cause)
+
+
+class CircuitBreaker:
+    """Circuit breaker and latency statistics of one endpoint."""
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        reset_timeout: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Init.
+
+        :param failure_threshold: failures in a row to open the circuit, 0 - never open
+        :param reset_timeout: seconds in open state before the probe
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0  # in a row
+        self.opened_at = 0.0
+        self.rejected = 0  # actions failed fast
+        self.latencies: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def allow(self) -> bool:
+        """Check if the action may be sent to the backend.
+
+        In half-open state only one probe is allowed until its result is recorded.
+        """
+        with self.lock:
+            if self.state == OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                return True
+            if self.state == CLOSED:
+                return True
+            self.rejected += 1
+            return False
+
+    def success(self) -> None:
+        """Record action the backend answered."""
+        with self.lock:
+            self.failures = 0
+            self.state = CLOSED
+
+    def record(self, latency: float) -> None:
+        """Add HTTP call latency for the timeout."""
+        with self.lock:
+            self.latencies.append(latency)
+
+    def failure(self) -> None:
+        """Record failed call, open the circuit if there are too many."""
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (
+                self.failure_threshold and self.failures >= self.failure_threshold
+            ):
+                self.state = OPEN
+                self.opened_at = self.clock()
+
+    def p99(self) -> float | None:
+        """99th percentile of the recent latencies, None if there are not enough of them."""
+        with self.lock:
+            if len(self.latencies) < LATENCY_MIN_SAMPLES:
+                return None
+            latencies = sorted(self.latencies)
+        return latencies[math.ceil(len(latencies) * 0.99) - 1]
+
+    def timeout(self, min_timeout: float, max_timeout: float) -> float:
+        """Request timeout from p99 latency.
+
+        max_timeout until we know the latency, and for the half-open probe: the backend
+        may be up but slower than the timeout from the latencies before the outage.
+        """
+        if self.state == HALF_OPEN or (p99 := self.p99()) is None:
+            return max_timeout
+        return min(max_timeout, max(min_timeout, p99 * TIMEOUT_P99_FACTOR))
+
+    def stats(self) -> dict[str, float | str | None]:
+        """State and latency."""
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "p99": self.p99(),
+        }
+
+
+current_breaker: ContextVar[CircuitBreaker | None] = ContextVar("current_breaker", default=None)
+
+
+@contextmanager
+def timed_http(backend: str) -> Iterator[None]:
+    """Time HTTP call for the latency report and the timeout of the current breaker.
+
+    Failed calls do not count in the timeout, except timeouts.
+    """
+    breaker = current_breaker.get()
+    start = time.perf_counter()
+    with latency.timed("http", backend):
+        try:
+            yield
+        except Exception as e:
+            if breaker is not None and is_timeout(e):
+                breaker.record(time.perf_counter() - start)
+            raise
+    if breaker is not None:
+        breaker.record(time.perf_counter() - start)
+
+
+class CircuitBreakers:
+    """Circuit breakers of all endpoints."""
+
+    def __init__(
+        self,
+        settings: models.Settings,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Init."""
+        self.settings = settings
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.breakers: dict[str, CircuitBreaker] = {}
+
+    def configure(self, settings: models.Settings) -> None:
+        """Apply reloaded settings to all breakers."""
+        with self.lock:
+            self.settings = settings
+            for breaker in self.breakers.values():
+                breaker.failure_threshold = settings.breaker_failures
+                breaker.reset_timeout = settings.breaker_reset_timeout
+
+    def get(self, endpoint: str) -> CircuitBreaker:
+        """Get breaker of the endpoint, create if not created yet."""
+        with self.lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker(
+                    self.settings.breaker_failures,
+                    self.settings.breaker_reset_timeout,
+                    self.clock,
+                )
+            return self.breakers[endpoint]
+
+    def timeout(self, endpoint: str) -> float:
+        """Request timeout for the endpoint."""
+        if not self.settings.adaptive_timeout:
+            return self.settings.http_timeout
+        return self.get(endpoint).timeout(
+            self.settings.http_min_timeout,
+            self.settings.http_timeout,
+        )
+
+    def stats(self) -> dict[str, dict[str, float | str | None]]:
+        """Breakers state by endpoint."""
+        with self.lock:
+            breakers = dict(self.breakers)
+        return {endpoint: breaker.stats() for endpoint, breaker in breakers.items()}
+
+
+def endpoint(act: models.ActionItem) -> str:
+    """Backend endpoint of the action, actions of one endpoint share the breaker."""
+    if isinstance(act, models.OpenhabAction):
+        return f"openhab {urlsplit(act.path).netloc}"
+    return act.type  # Google APIs and IFTTT have one endpoint each
@@ -0,0 +1,135 @@
+"""Producer/consumer pipeline between packet capture and action dispatch.
+
+The sniff callback only puts press records on a bounded queue, worker threads
+run the (slow) backend actions.
+So capture is never blocked by Google / IFTTT / OpenHAB round trips.
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime
+
+import models
+from latency import latency
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Press:
+    """Button press record."""
+
+    button: str
+    time: datetime
+    outbox_id: int | None = None  # the press in the outbox, see Outbox.add_press()
+
+
+def press_done(press: Press) -> None:
+    """Record and log the time from the capture to the end of the press handling."""
+    duration = time.time() - press.time.timestamp()
+    latency.record("press", press.button, duration)
+    logger.info(
+        'Button "%s" press handled in %.3f s',
+        press.button,
+        duration,
+        extra={"button": press.button, "duration": round(duration, 6)},
+    )
+
+
+class Dispatcher:
+    """Run button press handler in worker threads.
+
+    If the queue is full the press is dropped (and counted) instead of blocking capture.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Press], None],
+        queue_size: int = models.PRESS_QUEUE_SIZE,
+        workers: int = models.PRESS_WORKERS,
+    ) -> None:
+        """Init."""
+        self.handler = handler
+        self.queue: queue.Queue[Press | None] = queue.Queue(maxsize=queue_size)
+        self.workers_count = workers
+        self.workers: list[threading.Thread] = []
+        # producer side counters are changed only from the capture thread
+        self.submitted = 0
+        self.dropped = 0
+        self.max_depth = 0
+        # consumer side counters are changed from workers
+        self.processed = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start worker threads."""
+        for idx in range(self.workers_count):
+            worker = threading.Thread(target=self.work, name=f"dispatcher-{idx}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self) -> None:
+        """Stop worker threads after they process all queued presses."""
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+    def submit(self, button: str, press_time: datetime, outbox_id: int | None = None) -> bool:
+        """Put press into the queue.
+
+        Never blocks, returns False if the press was dropped because the queue is full.
+        """
+        try:
+            self.queue.put_nowait(Press(button, press_time, outbox_id))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(
+                'Press queue is full (%s), drop press of "%s" (dropped %s so far)',
+                self.queue.maxsize,
+                button,
+                self.dropped,
+                extra={"button": button},
+            )
+            return False
+        self.submitted += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    def work(self) -> None:
+        """Worker thread loop."""
+        while (press := self.queue.get()) is not None:
+            latency.record("queue", press.button, time.time() - press.time.timestamp())
+            try:
+                self.handler(press)
+            except Exception:  # noqa: BLE001
+                with self.lock:
+                    self.failed += 1
+                logger.exception(
+                    'Button "%s" press handling error',
+                    press.button,
+                    extra={"button": press.button},
+                )
+            finally:
+                press_done(press)
+                with self.lock:
+                    self.processed += 1
+                self.queue.task_done()
+        self.queue.task_done()
+
+    def stats(self) -> dict[str, int]:
+        """Pipeline counters."""
+        return {
+            "depth": self.queue.qsize(),
+            "max_depth": self.max_depth,
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,67 @@
+"""Bounded set with expiration for MACs seen on the network.
+
+With MAC randomization (phones, guest Wi-Fi) the number of unknown MACs is not
+limited, so we keep only the most recently seen ones and forget them after TTL.
+"""
+
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+
+
+class ExpiringSet:
+    """LRU set with TTL.
+
+    Keys older than `ttl` seconds are treated as absent, if there are more than
+    `capacity` keys the least recently added are evicted.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Init."""
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock
+        self.items: OrderedDict[Hashable, float] = OrderedDict()  # key -> time added
+        self.evictions = 0  # removed because of capacity
+        self.expirations = 0  # removed because of TTL
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Check if the key was added less than TTL ago."""
+        added = self.items.get(key)
+        if added is None:
+            return False
+        if self.clock() - added >= self.ttl:
+            del self.items[key]
+            self.expirations += 1
+            return False
+        return True
+
+    def __len__(self) -> int:
+        """Keys count, including expired but not removed yet."""
+        return len(self.items)
+
+    def add(self, key: Hashable) -> None:
+        """Add the key or renew it if already added."""
+        self.items[key] = self.clock()
+        self.items.move_to_end(key)
+        while len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Remove all keys."""
+        self.items.clear()
+
+    def stats(self) -> dict[str, int]:
+        """Size and eviction counters."""
+        return {
+            "size": len(self.items),
+            "capacity": self.capacity,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
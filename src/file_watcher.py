@@ -0,0 +1,145 @@
+"""Watch settings files and call back when they change.
+
+On Linux inotify (through ctypes, no extra dependency) wakes us up right after a
+file is written. Files are also compared with their last seen state every
+`interval` seconds, so changes are detected where inotify is not available or does
+not see them (macOS, some docker volumes and network file systems).
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import threading
+import time
+from collections.abc import Callable
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+SETTLE_DELAY = 0.1  # seconds, editors write a file in several steps
+EVENTS_BUFFER_SIZE = 4096
+
+FileState = tuple[int, int, int] | None  # (mtime ns, size, inode), None if no file
+
+
+def file_state(path: str) -> FileState:
+    """State of the file to detect changes."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def open_inotify(folders: set[str]) -> int | None:
+    """Open inotify descriptor watching the folders.
+
+    We watch folders, not files, because editors and `docker cp` replace the file.
+    Returns None if inotify is not available.
+    """
+    library = ctypes.util.find_library("c")
+    try:
+        libc = ctypes.CDLL(library, use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    for folder in folders:
+        if libc.inotify_add_watch(fd, os.fsencode(folder), WATCH_MASK) < 0:
+            os.close(fd)
+            return None
+    return fd
+
+
+class FileWatcher:
+    """Call back with the list of changed files."""
+
+    def __init__(
+        self,
+        paths: list[str],
+        callback: Callable[[list[str]], None],
+        interval: float,
+    ) -> None:
+        """Init.
+
+        :param paths: files to watch
+        :param callback: called from the watcher thread with changed files
+        :param interval: seconds between checks if inotify does not wake us up earlier
+        """
+        self.paths = paths
+        self.callback = callback
+        self.interval = interval
+        self.states = {path: file_state(path) for path in paths}
+        self.inotify_fd: int | None = None
+        self.stopped = threading.Event()
+        self.thread: threading.Thread | None = None
+
+    def changed(self) -> list[str]:
+        """Files changed since the last call."""
+        result = []
+        for path in self.paths:
+            state = file_state(path)
+            if state != self.states[path]:
+                self.states[path] = state
+                result.append(path)
+        return result
+
+    def wait(self) -> None:
+        """Wait for inotify event or interval."""
+        if self.inotify_fd is None:
+            self.stopped.wait(self.interval)
+            return
+        readable, _, _ = select.select([self.inotify_fd], [], [], self.interval)
+        if readable:
+            time.sleep(SETTLE_DELAY)
+            self.drain()
+
+    def drain(self) -> None:
+        """Read all inotify events, we need only to know there were some."""
+        assert self.inotify_fd is not None
+        try:
+            while os.read(self.inotify_fd, EVENTS_BUFFER_SIZE):
+                pass
+        except BlockingIOError:
+            pass
+
+    def run(self) -> None:
+        """Watch until stopped."""
+        folders = {os.path.dirname(os.path.abspath(path)) for path in self.paths}
+        self.inotify_fd = open_inotify(folders)
+        try:
+            while not self.stopped.is_set():
+                self.wait()
+                if not self.stopped.is_set() and (changed := self.changed()):
+                    try:
+                        self.callback(changed)
+                    except Exception:  # noqa: BLE001
+                        logger.exception("Error handling changed files %s", changed)
+        finally:
+            if self.inotify_fd is not None:
+                os.close(self.inotify_fd)
+                self.inotify_fd = None
+
+    def start(self) -> None:
+        """Watch in background thread."""
+        self.thread = threading.Thread(target=self.run, name="file-watcher", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stop watching.
+
+        The thread stops after the current wait, not later than `interval`.
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
@@ -1,13 +1,94 @@
 """Google API class."""
 
-from datetime import datetime
-from functools import cached_property
-from typing import Any
+import asyncio
+import threading
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from functools import cache, cached_property
+from typing import TYPE_CHECKING, Any
 
+import httplib2
 from google.oauth2 import service_account
-from googleapiclient import discovery
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient import discovery, discovery_cache
+from googleapiclient.errors import HttpError, UnknownApiNameOrVersion
+from googleapiclient.http import build_http
 
 import models
+from circuit_breaker import timed_http
+from metrics import counters
+
+if TYPE_CHECKING:
+    import httpx
+
+TIME_PRECISION = timedelta(seconds=1)  # Calendar keeps event times in seconds
+HTTP_FORBIDDEN = 403  # also for "rateLimitExceeded"
+HTTP_TOO_MANY_REQUESTS = 429
+SCOPES = [
+    "https://www.googleapis.com/auth/calendar",
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.metadata.readonly",
+]
+
+
+class ClientRegistry:
+    """Process-wide cache of Google credentials and services.
+
+    Credentials are loaded once per credentials file and shared by all threads,
+    the google-auth transport refreshes the access token in place when it expires.
+    Services are built once per (api, version, credentials file) in each thread
+    because httplib2 connections used by the services are not thread-safe.
+    """
+
+    def __init__(self) -> None:
+        """Init."""
+        self.lock = threading.Lock()
+        self.credentials: dict[str, service_account.Credentials] = {}
+        self.local = threading.local()
+
+    def get_credentials(
+        self,
+        file_name: str,
+        factory: Callable[[], service_account.Credentials],
+    ) -> service_account.Credentials:
+        """Get credentials for the file, load them with factory if not loaded yet."""
+        with self.lock:
+            if file_name not in self.credentials:
+                self.credentials[file_name] = factory()
+            return self.credentials[file_name]
+
+    def get_service(
+        self,
+        key: tuple[str, str, str],
+        factory: Callable[[], Any],
+    ) -> Any:
+        """Get service for the (api, version, credentials file), build it if not built yet."""
+        services: dict[tuple[str, str, str], Any] = self.local.__dict__.setdefault("services", {})
+        if key not in services:
+            services[key] = factory()
+        return services[key]
+
+    def clear(self) -> None:
+        """Forget all credentials and services."""
+        with self.lock:
+            self.credentials = {}
+            self.local = threading.local()
+
+
+registry = ClientRegistry()
+
+
+@cache
+def discovery_document(api: str, version: str) -> str:
+    """Get discovery document for the API.
+
+    Use the documents shipped with googleapiclient so services are built offline,
+    without fetching the document from Google. Each document is read only once.
+    """
+    document = discovery_cache.get_static_doc(api, version)
+    if document is None:
+        raise UnknownApiNameOrVersion(f"name: {api}  version: {version}")
+    return document  # type: ignore
 
 
 class GoogleApi:
@@ -23,15 +104,21 @@ class GoogleApi:
         self.version = version
 
     def get_credentials(self) -> service_account.Credentials:
-        """Get credentials for http."""
+        """Get credentials for http.
+
+        Loaded from the file only once, see ClientRegistry.
+        """
+        return registry.get_credentials(
+            self.settings.credentials_file_name,
+            self.load_credentials,
+        )
+
+    def load_credentials(self) -> service_account.Credentials:
+        """Load credentials from the file."""
         try:
             credentials = service_account.Credentials.from_service_account_file(
                 self.settings.credentials_file_name,
-                scopes=[
-                    "https://www.googleapis.com/auth/calendar",
-                    "https://www.googleapis.com/auth/spreadsheets",
-                    "https://www.googleapis.com/auth/drive.metadata.readonly",
-                ],
+                scopes=SCOPES,
             )
         except Exception as e:
             error_message = (
@@ -43,9 +130,72 @@ class GoogleApi:
         return credentials
 
     def get_service(self, api: str, version: str) -> Any:
+        """Get service from the ClientRegistry, build it if not built yet."""
         if not self.credentials:
             raise ValueError(f"Cannot get service `{self.api}`: Google API is not authorized.")
-        return discovery.build(api, version, credentials=self.credentials)
+        return registry.get_service(
+            (api, version, self.settings.credentials_file_name),
+            lambda: discovery.build_from_document(
+                discovery_document(api, version),
+                http=AuthorizedHttp(self.credentials, http=self.build_http()),
+            ),
+        )
+
+    def build_http(self) -> httplib2.Http:
+        """HTTP client for the service, with `http_timeout` instead of 60 seconds default."""
+        http = build_http()
+        http.timeout = self.settings.http_timeout
+        return http
+
+    def execute(self, request: Any, requests: int = 1) -> Any:
+        """Execute API request (or HTTP batch) and record its latency and quota usage.
+
+        :param requests: API requests in the HTTP batch, each counts in the quota
+        """
+        counters.inc(("google_requests", self.api), requests)
+        try:
+            with timed_http(self.api):
+                return request.execute()
+        except HttpError as e:
+            self.count_quota_error(e)
+            raise
+
+    async def execute_async(self, client: "httpx.AsyncClient", request: Any) -> Any:
+        """Execute API request (googleapiclient HttpRequest) with async HTTP client.
+
+        The request is built by googleapiclient as usual, only sent with httpx instead of
+        httplib2, and its response is parsed by googleapiclient (raises HttpError).
+        """
+        if not self.credentials.valid:
+            from google.auth.transport.requests import Request  # noqa: PLC0415
+
+            # token refresh is rare (once an hour), the thread does not block the event loop
+            await asyncio.to_thread(self.credentials.refresh, Request())
+        headers = dict(request.headers)
+        self.credentials.apply(headers)
+        counters.inc(("google_requests", self.api))
+        with timed_http(self.api):
+            response = await client.request(
+                request.method,
+                request.uri,
+                content=request.body,
+                headers=headers,
+            )
+        try:
+            return request.postproc(
+                httplib2.Response({"status": response.status_code, **response.headers}),
+                response.content,
+            )
+        except HttpError as e:
+            self.count_quota_error(e)
+            raise
+
+    def count_quota_error(self, error: HttpError) -> None:
+        """Count the error if Google rejected the request because of the quota."""
+        if error.resp.status == HTTP_TOO_MANY_REQUESTS or (
+            error.resp.status == HTTP_FORBIDDEN and "rateLimitExceeded" in str(error.content)
+        ):
+            counters.inc(("google_quota_exceeded", self.api))
 
     @cached_property
     def service(self) -> Any:  # do not use discovery.Resource as workaround for pyrefly
@@ -59,8 +209,16 @@ class GoogleApi:
         """Get last event."""
         raise NotImplementedError
 
-    def start_event(self, summary: str) -> None:
-        """Start event."""
+    async def get_last_event_async(
+        self,
+        client: "httpx.AsyncClient",
+        summary: str,
+    ) -> tuple[int | str | None, list[Any] | None]:
+        """Get last event with async client."""
+        raise NotImplementedError
+
+    def start_event(self, summary: str, start_time: datetime | None = None) -> None:
+        """Start event at start_time, now if None."""
         raise NotImplementedError
 
     def close_event(self, event_id: int | str, close_time: datetime) -> None:
@@ -1,16 +1,68 @@
 """Register Amazon Dash Button events in Google Calendar using Google Calendar API."""
 
+import asyncio
+import logging
 import os
+import threading
 import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime, timedelta
-from typing import Any, cast
+from typing import TYPE_CHECKING, Any, cast
 
 import dateutil.parser
+from googleapiclient.errors import HttpError
 
 import models
-from google_api import GoogleApi
+from google_api import TIME_PRECISION, GoogleApi
+
+if TYPE_CHECKING:
+    import httpx
 
 # GCAL_TIME_PARSE = '%Y-%m-%dT%H:%M:%S%z'
+SEARCH_WINDOWS_DAYS = (1, 7, 100)  # look for the last event in the last day, week, ...
+HTTP_NOT_FOUND = 404
+HTTP_GONE = 410  # deleted event
+PENDING_EVENT_ID = "pending-{}"  # id of the event to be inserted when batch is flushed
+MAX_BATCH_REQUESTS = 50  # Calendar API limit for HTTP batch
+
+logger = logging.getLogger(__name__)
+
+
+class LastEventCache:
+    """(calendarId, summary) -> id of the last event we know, shared by all presses."""
+
+    def __init__(self) -> None:
+        """Init."""
+        self.lock = threading.Lock()
+        self.event_ids: dict[tuple[str, str], str] = {}
+
+    def get(self, calendar_id: str, summary: str) -> str | None:
+        """Get last event id."""
+        with self.lock:
+            return self.event_ids.get((calendar_id, summary))
+
+    def set(self, calendar_id: str, summary: str, event_id: str) -> None:
+        """Remember last event id."""
+        with self.lock:
+            self.event_ids[(calendar_id, summary)] = event_id
+
+    def invalidate(self, calendar_id: str, event_id: str) -> None:
+        """Forget the event."""
+        with self.lock:
+            self.event_ids = {
+                key: cached_id
+                for key, cached_id in self.event_ids.items()
+                if key[0] != calendar_id or cached_id != event_id
+            }
+
+    def clear(self) -> None:
+        """Forget all events."""
+        with self.lock:
+            self.event_ids = {}
+
+
+last_events = LastEventCache()
 
 
 class Calendar(GoogleApi):
@@ -21,6 +73,9 @@ class Calendar(GoogleApi):
         super().__init__(settings, api="calendar", version="v3")
         self.tz = os.environ.get("TZ", "Europe/Moscow")
         self.calendarId = calendar_id
+        self.batching = False
+        self.pending_inserts: list[dict[str, Any]] = []  # event bodies waiting for flush()
+        self.pending_patches: dict[str, dict[str, Any]] = {}  # event id -> patch body
 
     def get_calendar_id(self, name: str) -> str | None:
         """Get ID of the calendar named as `name`.
@@ -34,8 +89,8 @@ class Calendar(GoogleApi):
         """
         page_token = None
         while True:
-            calendar_list = self.service.calendarList().list(pageToken=page_token).execute()
-            print("Calendar page:", calendar_list)
+            calendar_list = self.execute(self.service.calendarList().list(pageToken=page_token))
+            logger.debug("Calendar page: %s", calendar_list)
             if ids := [
                 item["id"] for item in calendar_list.get("items", []) if item["summary"] == name
             ]:
@@ -56,66 +111,273 @@ class Calendar(GoogleApi):
         tz_hours, tz_minutes = divmod(tz_minutes, 60)
         return f"{t.strftime(gcal_time_format)}{tz_hours:+03d}:{abs(tz_minutes):02d}"
 
-    def start_event(self, summary: str) -> None:
-        """Start event in Google Calendar."""
+    def start_event(self, summary: str, start_time: datetime | None = None) -> None:
+        """Start event in Google Calendar at start_time, now if None."""
+        start_time = start_time or datetime.now()
         insert_event_request = {
             "summary": summary,
             "description": "Event created by amazon dash (button) click.",
             "start": {
-                "dateTime": self.time_to_str(datetime.now()),
+                "dateTime": self.time_to_str(start_time),
                 # 'timeZone': '{tz}'.format(tz=self.tz),
             },
             "end": {
-                "dateTime": self.time_to_str(datetime.now()),
+                "dateTime": self.time_to_str(start_time),
                 # 'timeZone': '{tz}'.format(tz=self.tz),
             },
         }
-        _ = (
-            self.service.events()
-            .insert(calendarId=self.calendarId, body=insert_event_request)  # 'primary',
-            .execute()
-        )
+        if self.batching:
+            self.pending_inserts.append(insert_event_request)
+            return
+        event = self.execute(self.insert_request(insert_event_request))
+        last_events.set(self.calendarId, summary, event["id"])
         # print('Calendar event created: %s' % (event.get('htmlLink')))
 
     def get_last_event(self, summary: str) -> tuple[str | None, list[Any] | None]:
         """Get last event from Google Calendar.
 
+        First check the event we know from LastEventCache with one `events.get`.
+        If there is no such event, search in growing time windows (SEARCH_WINDOWS_DAYS),
+        so usually we do not have to page through all events of the last 100 days.
+        In batch the events and changes waiting for flush are taken into account.
+
         :param summary: text to search
         :return:
         <id for close event>, [summary, start, end]
         """
+        if event := self.pending_event(summary):
+            return self.event_to_row(event)
+        if event_id := last_events.get(self.calendarId, summary):
+            event = self.get_event(event_id)
+            if event and event.get("status") != "cancelled" and event.get("summary") == summary:
+                return self.event_to_row(self.patched(event))
+            last_events.invalidate(self.calendarId, event_id)
+        for days in SEARCH_WINDOWS_DAYS:
+            if event := self.find_last_event(summary, days):
+                last_events.set(self.calendarId, summary, event["id"])
+                return self.event_to_row(self.patched(event))
+        return None, None
+
+    async def get_last_event_async(
+        self,
+        client: "httpx.AsyncClient",
+        summary: str,
+    ) -> tuple[str | None, list[Any] | None]:
+        """Get last event from Google Calendar, async version of get_last_event."""
+        if event := self.pending_event(summary):
+            return self.event_to_row(event)
+        if event_id := last_events.get(self.calendarId, summary):
+            event = await self.get_event_async(client, event_id)
+            if event and event.get("status") != "cancelled" and event.get("summary") == summary:
+                return self.event_to_row(self.patched(event))
+            last_events.invalidate(self.calendarId, event_id)
+        for days in SEARCH_WINDOWS_DAYS:
+            if event := await self.find_last_event_async(client, summary, days):
+                last_events.set(self.calendarId, summary, event["id"])
+                return self.event_to_row(self.patched(event))
+        return None, None
+
+    def has_event_at(self, summary: str, event_time: datetime) -> bool:
+        """Check if the last event with the summary starts or ends at the time."""
+        _, event = self.get_last_event(summary)
+        return any(
+            abs(moment - (event_time.astimezone(moment.tzinfo) if moment.tzinfo else event_time))
+            < TIME_PRECISION
+            for moment in (event or [])[1:]
+            if moment is not None
+        )
+
+    def pending_event(self, summary: str) -> dict[str, Any] | None:
+        """The last event with the summary waiting for insert in the batch."""
+        for idx in reversed(range(len(self.pending_inserts))):
+            if self.pending_inserts[idx]["summary"] == summary:
+                return {**self.pending_inserts[idx], "id": PENDING_EVENT_ID.format(idx)}
+        return None
+
+    def patched(self, event: dict[str, Any]) -> dict[str, Any]:
+        """Event with the patch waiting in the batch."""
+        if patch := self.pending_patches.get(event["id"]):
+            return {**event, **patch}
+        return event
+
+    @contextmanager
+    def batch(self) -> Iterator["Calendar"]:
+        """Collect inserts and patches inside the context and send them in HTTP batch.
+
+        Usage::
+
+            with calendar.batch():
+                calendar.close_event(event_id, datetime.now())
+                calendar.start_event(summary)
+        """
+        self.batching = True
+        try:
+            yield self
+        finally:
+            self.batching = False
+            self.flush()
+
+    @asynccontextmanager
+    async def batch_async(self, client: "httpx.AsyncClient") -> AsyncIterator["Calendar"]:
+        """Async version of batch(), the requests are sent concurrently with the async client."""
+        self.batching = True
+        try:
+            yield self
+        finally:
+            self.batching = False
+            await self.flush_async(client)
+
+    def flush(self) -> None:
+        """Send postponed inserts and patches.
+
+        Requests in HTTP batch are independent, if some of them failed
+        the first error is raised after all of them are done.
+        """
+        requests = self.take_pending()
+        errors: list[Exception] = []
+
+        def callback(request_id: str, response: Any, exception: Exception | None) -> None:
+            if exception is not None:
+                errors.append(exception)
+            else:
+                self.request_done(requests[int(request_id)][1], response)
+
+        for start in range(0, len(requests), MAX_BATCH_REQUESTS):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for idx in range(start, min(start + MAX_BATCH_REQUESTS, len(requests))):
+                batch.add(requests[idx][0], request_id=str(idx))
+            self.execute(batch, requests=min(MAX_BATCH_REQUESTS, len(requests) - start))
+        if errors:
+            raise errors[0]
+
+    async def flush_async(self, client: "httpx.AsyncClient") -> None:
+        """Send postponed inserts and patches concurrently, see flush()."""
+        requests = self.take_pending()
+        responses = await asyncio.gather(
+            *(self.execute_async(client, request) for request, _ in requests),
+            return_exceptions=True,
+        )
+        errors = []
+        for (_, inserted_summary), response in zip(requests, responses, strict=True):
+            if isinstance(response, Exception):
+                errors.append(response)
+            else:
+                self.request_done(inserted_summary, response)
+        if errors:
+            raise errors[0]
+
+    def take_pending(self) -> list[tuple[Any, str | None]]:
+        """API requests for postponed inserts and patches.
+
+        [(request, summary of inserted event or None for patch)]
+        """
+        requests: list[tuple[Any, str | None]] = [
+            (self.insert_request(body), body["summary"]) for body in self.pending_inserts
+        ] + [
+            (self.patch_request(event_id, body), None)
+            for event_id, body in self.pending_patches.items()
+        ]
+        self.pending_inserts, self.pending_patches = [], {}
+        return requests
+
+    def request_done(self, inserted_summary: str | None, response: Any) -> None:
+        """Remember inserted event."""
+        if inserted_summary is not None:
+            last_events.set(self.calendarId, inserted_summary, response["id"])
+
+    def insert_request(self, body: dict[str, Any]) -> Any:
+        """API request to insert event."""
+        return self.service.events().insert(calendarId=self.calendarId, body=body)  # 'primary',
+
+    def patch_request(self, event_id: int | str, body: dict[str, Any]) -> Any:
+        """API request to patch event."""
+        return self.service.events().patch(
+            calendarId=self.calendarId,  # 'primary',
+            eventId=event_id,
+            body=body,
+        )
+
+    def get_event(self, event_id: str) -> dict[str, Any] | None:
+        """Get event by id, None if it does not exist."""
+        try:
+            return self.execute(self.event_request(event_id))  # type: ignore
+        except HttpError as e:
+            if e.resp.status in (HTTP_NOT_FOUND, HTTP_GONE):
+                return None
+            raise
+
+    async def get_event_async(
+        self,
+        client: "httpx.AsyncClient",
+        event_id: str,
+    ) -> dict[str, Any] | None:
+        """Get event by id with async client, see get_event()."""
+        try:
+            return await self.execute_async(client, self.event_request(event_id))  # type: ignore
+        except HttpError as e:
+            if e.resp.status in (HTTP_NOT_FOUND, HTTP_GONE):
+                return None
+            raise
+
+    def event_request(self, event_id: str) -> Any:
+        """API request to get event."""
+        return self.service.events().get(
+            calendarId=self.calendarId,  # 'primary',
+            eventId=event_id,
+        )
+
+    def find_last_event(self, summary: str, days: int) -> dict[str, Any] | None:
+        """Find the last event with the summary that ends in the last `days`."""
         page_token = None
         while True:
-            # we need only last event but do not see how to get just it from the API
-            events = (
-                self.service.events()
-                .list(
-                    calendarId=self.calendarId,  # 'primary',
-                    timeMin=self.google_time_format(
-                        datetime.now() - timedelta(days=100),
-                    ),  # better limit than sorry
-                    q=summary,
-                    # timeZone='UTC',
-                    orderBy="startTime",
-                    singleEvents=True,
-                    showDeleted=False,
-                    pageToken=page_token,
-                )
-                .execute()
-            )
+            events = self.execute(self.events_list_request(summary, days, page_token))
             page_token = events.get("nextPageToken")
             if not page_token:
                 # very stupid - we have to skip to last page
                 if len(events["items"]) > 0:
-                    event = events["items"][-1]
-                    # from pprint import pprint
-                    # pprint(events)
-                    start = self.get_event_datetime(event, "start")
-                    if event["start"] == event["end"]:
-                        return event["id"], [event["summary"], start]
-                    end = self.get_event_datetime(event, "end")
-                    return event["id"], [event["summary"], start, end]
-                return None, None
+                    return events["items"][-1]  # type: ignore
+                return None
+
+    async def find_last_event_async(
+        self,
+        client: "httpx.AsyncClient",
+        summary: str,
+        days: int,
+    ) -> dict[str, Any] | None:
+        """Find the last event with async client, see find_last_event()."""
+        page_token = None
+        while True:
+            events = await self.execute_async(
+                client,
+                self.events_list_request(summary, days, page_token),
+            )
+            page_token = events.get("nextPageToken")
+            if not page_token:
+                if len(events["items"]) > 0:
+                    return events["items"][-1]  # type: ignore
+                return None
+
+    def events_list_request(self, summary: str, days: int, page_token: str | None) -> Any:
+        """API request to list page of events with the summary that end in the last `days`."""
+        # we need only last event but do not see how to get just it from the API
+        return self.service.events().list(
+            calendarId=self.calendarId,  # 'primary',
+            timeMin=self.google_time_format(datetime.now() - timedelta(days=days)),
+            q=summary,
+            # timeZone='UTC',
+            orderBy="startTime",
+            singleEvents=True,
+            showDeleted=False,
+            pageToken=page_token,
+        )
+
+    def event_to_row(self, event: dict[str, Any]) -> tuple[str, list[Any]]:
+        """Convert event to <id for close event>, [summary, start, end]."""
+        start = self.get_event_datetime(event, "start")
+        if event["start"] == event["end"]:
+            return event["id"], [event["summary"], start]
+        end = self.get_event_datetime(event, "end")
+        return event["id"], [event["summary"], start, end]
 
     def get_event_datetime(self, event, name: str) -> datetime | None:
         if "dateTime" in event[name]:
@@ -128,28 +390,31 @@ class Calendar(GoogleApi):
 
     def delete_event(self, event_id: str) -> None:
         """Delete event from Google Calendar."""
-        self.service.events().delete(
-            calendarId=self.calendarId,
-            eventId=event_id,  # 'primary',
-        ).execute()
+        self.execute(
+            self.service.events().delete(
+                calendarId=self.calendarId,
+                eventId=event_id,  # 'primary',
+            ),
+        )
+        last_events.invalidate(self.calendarId, event_id)
 
     def close_event(self, event_id: int | str, close_time: datetime) -> None:
-        """Close event in Google Calendar."""
-        event = (
-            self.service.events()
-            .get(calendarId=self.calendarId, eventId=event_id)  # 'primary',
-            .execute()
-        )
-        event["end"] = {
+        """Close event in Google Calendar.
+
+        Patch only the event end, so we do not need to read the event first.
+        """
+        end = {
             "dateTime": self.time_to_str(close_time),
             # 'timeZone': '{tz}'.format(tz=self.tz),
         }
-        _ = (
-            self.service.events()
-            .update(calendarId=self.calendarId, eventId=event_id, body=event)  # 'primary',
-            .execute()
-        )
-        # print(updated_event)
+        if self.batching:
+            for idx, body in enumerate(self.pending_inserts):
+                if PENDING_EVENT_ID.format(idx) == event_id:
+                    body["end"] = end
+                    return
+            self.pending_patches[str(event_id)] = {"end": end}
+            return
+        self.execute(self.patch_request(event_id, {"end": end}))
 
     def google_time_format(self, t: datetime) -> str:
         """Convert datetime to Google Calendar time format."""
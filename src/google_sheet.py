@@ -1,12 +1,24 @@
 """Register Amazon Dash Button events in Google Sheets using Google Sheets API."""
 
 import datetime
-from typing import Any
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from typing import TYPE_CHECKING, Any
+
+from googleapiclient.errors import HttpError
 
 import models
-from google_api import GoogleApi
+from google_api import TIME_PRECISION, GoogleApi
+from sheet_cache import EventIndex, get_event_index, get_sheet_id_cache
+
+if TYPE_CHECKING:
+    import httpx
 
-GSHEET_TIME_FORMAT = "%d/%m/%Y %H:%M:%S"
+SERIAL_TIME_EPOCH = datetime.datetime(year=1899, month=12, day=30)
+PRESS_ROWS_TO_CHECK = 1000  # the last presses to look for a retried one
+HTTP_NOT_FOUND = 404
+# wrong sheetId in batchUpdate returns 400 "No grid with id: ..."
+NOT_FOUND_MARKERS = ("not found", "no grid with id")
 
 
 class Sheet(GoogleApi):
@@ -26,10 +38,20 @@ class Sheet(GoogleApi):
             version="v4",  # discoveryServiceUrl=('https://sheets.googleapis.com/$discovery/rest?version=v4')
         )
         self.drive_service = self.get_service(api="drive", version="v3")
+        self.name = name
         self.press_sheet = press_sheet
         self.event_sheet = event_sheet
-        self.spreadSheetId = self.get_file_id(name)
-        self.sheets = self.get_sheets(press_sheet, event_sheet)
+        self.id_cache = get_sheet_id_cache(settings)
+        if cached_ids := self.id_cache.get(name):
+            self.spreadSheetId, self.sheets = cached_ids
+        else:
+            self.spreadSheetId = self.get_file_id(name)
+            self.sheets = self.get_sheets(press_sheet, event_sheet)
+            if self.spreadSheetId:
+                self.id_cache.set(name, self.spreadSheetId, self.sheets)
+        self.batching = False
+        self.pending: list[dict[str, Any]] = []  # batchUpdate requests waiting for flush()
+        self.pending_sheets: set[str] = set()
 
     def get_last_event(self, summary: str) -> tuple[int | None, list[Any] | None]:
         """Get last event from Google Sheet.
@@ -38,21 +60,37 @@ class Sheet(GoogleApi):
         :return:
         <id for close event>, [summary, start, end]
         """
-        row, event = self.find_last_row(sheet=self.event_sheet, search_string=summary)
+        return self.indexed_event(self.synced_event_index(), summary)
+
+    async def get_last_event_async(
+        self,
+        client: "httpx.AsyncClient",
+        summary: str,
+    ) -> tuple[int | None, list[Any] | None]:
+        """Get last event from Google Sheet, async version of get_last_event."""
+        return self.indexed_event(await self.synced_event_index_async(client), summary)
+
+    def indexed_event(
+        self,
+        index: EventIndex,
+        summary: str,
+    ) -> tuple[int | None, list[Any] | None]:
+        """Get the last event with the summary from the event index."""
+        row, event = index.find(summary)
         if event:
             for col in range(1, len(event)):
                 event[col] = self.from_serial_time(event[col])
             return row, event
         return None, None
 
-    def start_event(self, summary: str) -> None:
-        """Start event in Google Sheet."""
-        self.insert_row(sheet=self.event_sheet)
-        self.copy_row_formatting(sheet=self.event_sheet)
-        self.update_cells(
-            sheet=self.event_sheet,
-            values=[summary, datetime.datetime.now().strftime(GSHEET_TIME_FORMAT)],
+    def start_event(self, summary: str, start_time: datetime.datetime | None = None) -> None:
+        """Start event in Google Sheet at start_time, now if None."""
+        values = [summary, start_time or datetime.datetime.now()]
+        self.write(
+            self.event_sheet,
+            self.new_row_requests(sheet=self.event_sheet, values=values),
         )
+        self.row_inserted(self.event_sheet, values)
 
     def close_event(
         self,
@@ -64,25 +102,198 @@ class Sheet(GoogleApi):
         row 0-based
         """
         row_num = int(event_id)
-        self.update_cells(
-            sheet=self.event_sheet,
-            row=row_num,
-            col=2,
-            values=[
-                close_time.strftime(GSHEET_TIME_FORMAT),
-                f"=C{row_num + 1}-B{row_num + 1}",
+        self.write(
+            self.event_sheet,
+            [
+                self.update_cells_request(
+                    sheet=self.event_sheet,
+                    row=row_num,
+                    col=2,
+                    values=[close_time, f"=C{row_num + 1}-B{row_num + 1}"],
+                ),
             ],
         )
+        self.event_index.update_row(row_num, 2, [self.to_serial_time(close_time)])
+
+    def press(self, summary: str, press_time: datetime.datetime | None = None) -> None:
+        """Register press event in Google Sheet, at press_time or now."""
+        values = [summary, press_time or datetime.datetime.now()]
+        self.write(
+            self.press_sheet,
+            self.new_row_requests(sheet=self.press_sheet, values=values),
+        )
+        self.row_inserted(self.press_sheet, values)
+
+    def has_press(self, summary: str, press_time: datetime.datetime) -> bool:
+        """Check if the press is registered in the press sheet (new rows are at the top)."""
+        serial = self.to_serial_time(press_time)
+        precision = TIME_PRECISION / datetime.timedelta(days=1)
+        return any(
+            len(row) > 1
+            and row[0] == summary
+            and isinstance(row[1], int | float)
+            and abs(row[1] - serial) < precision
+            for row in self.get_rows(sheet=self.press_sheet, row=1, rows=PRESS_ROWS_TO_CHECK)
+        )
+
+    @property
+    def event_index(self) -> EventIndex:
+        """Index of the last events in the event sheet."""
+        return get_event_index(str(self.spreadSheetId), self.event_sheet)
 
-    def press(self, summary: str) -> None:
-        """Register press event in Google Sheet."""
-        self.insert_row(sheet=self.press_sheet)
-        self.copy_row_formatting(sheet=self.press_sheet)
-        self.update_cells(
-            sheet=self.press_sheet,
-            values=[summary, datetime.datetime.now().strftime(GSHEET_TIME_FORMAT)],
+    def synced_event_index(self) -> EventIndex:
+        """Get event index, seed it if it is not seeded or the sheet was changed outside.
+
+        In batch with pending writes to the event sheet the index was synced before them
+        and has them already, so we do not flush to check the sheet.
+        """
+        index = self.event_index
+        if self.event_sheet in self.pending_sheets and index.row_count is not None:
+            return index
+        row_count = self.get_row_count(self.event_sheet)
+        if not index.is_synced(row_count):
+            first_row = 1
+            index.seed(
+                self.get_rows(sheet=self.event_sheet, row=first_row, rows=row_count, cols=3),
+                first_row=first_row,
+                row_count=row_count,
+            )
+        return index
+
+    async def synced_event_index_async(self, client: "httpx.AsyncClient") -> EventIndex:
+        """Get event index, async version of synced_event_index."""
+        index = self.event_index
+        if self.event_sheet in self.pending_sheets:
+            if index.row_count is not None:
+                return index
+            await self.flush_async(client)
+        row_count = self.row_count_from(
+            await self.execute_async(client, self.row_count_request()),
+            self.event_sheet,
+        )
+        if not index.is_synced(row_count):
+            first_row = 1
+            result = await self.execute_async(
+                client,
+                self.rows_request(sheet=self.event_sheet, row=first_row, rows=row_count, cols=3),
+            )
+            index.seed(result.get("values", []), first_row=first_row, row_count=row_count)
+        return index
+
+    def row_inserted(self, sheet: str, values: list[Any]) -> None:
+        """Update event index with the row inserted at the top of the sheet."""
+        if sheet == self.event_sheet:
+            self.event_index.insert_row(
+                1,
+                [
+                    self.to_serial_time(value) if isinstance(value, datetime.datetime) else value
+                    for value in values
+                ],
+            )
+
+    @contextmanager
+    def batch(self) -> Iterator["Sheet"]:
+        """Collect all writes inside the context and send them in one batchUpdate.
+
+        Usage::
+
+            with sheet.batch():
+                sheet.press(summary)
+                sheet.start_event(summary)
+        """
+        self.batching = True
+        try:
+            yield self
+        finally:
+            self.batching = False
+            self.flush()
+
+    @asynccontextmanager
+    async def batch_async(self, client: "httpx.AsyncClient") -> AsyncIterator["Sheet"]:
+        """Async version of batch(), the writes are sent with the async client."""
+        self.batching = True
+        try:
+            yield self
+        finally:
+            self.batching = False
+            await self.flush_async(client)
+
+    def write(self, sheet: str, requests: list[dict[str, Any]]) -> None:
+        """Send batchUpdate requests that change the sheet, or postpone them if batching."""
+        if self.batching:
+            self.pending.extend(requests)
+            self.pending_sheets.add(sheet)
+        else:
+            self.batch_update(requests)
+
+    def flush(self) -> None:
+        """Send postponed batchUpdate requests."""
+        if self.pending:
+            requests, self.pending = self.pending, []
+            self.pending_sheets = set()
+            self.batch_update(requests)
+
+    async def flush_async(self, client: "httpx.AsyncClient") -> None:
+        """Send postponed batchUpdate requests with the async client."""
+        if self.pending:
+            requests, self.pending = self.pending, []
+            self.pending_sheets = set()
+            try:
+                await self.execute_async(client, self.batch_update_request(requests))
+            except Exception:
+                self.event_index.reset()
+                raise
+
+    def batch_update(self, requests: list[dict[str, Any]]) -> None:
+        """Send batchUpdate requests in one API call.
+
+        If it fails we do not know what is in the sheet, so the event index is dropped.
+        """
+        try:
+            self.execute(self.batch_update_request(requests))
+        except Exception:
+            self.event_index.reset()
+            raise
+
+    def batch_update_request(self, requests: list[dict[str, Any]]) -> Any:
+        """API request to apply batchUpdate requests."""
+        return self.service.spreadsheets().batchUpdate(
+            spreadsheetId=self.spreadSheetId,
+            body={"requests": requests},
         )
 
+    def new_row_requests(self, sheet: str, values: list[Any]) -> list[dict[str, Any]]:
+        """Requests to insert row at the top of the sheet with the values.
+
+        Formatting is copied from the previous top row.
+        """
+        return [
+            self.insert_row_request(sheet=sheet),
+            self.copy_row_formatting_request(sheet=sheet),
+            self.update_cells_request(sheet=sheet, values=values),
+        ]
+
+    def execute(self, request: Any, requests: int = 1) -> Any:
+        """Execute API request.
+
+        If spreadsheet or sheet is not found, the cached ids are outdated so we drop them.
+        """
+        try:
+            return super().execute(request, requests)
+        except HttpError as e:
+            if is_not_found(e):
+                self.id_cache.invalidate(self.name)
+            raise
+
+    async def execute_async(self, client: "httpx.AsyncClient", request: Any) -> Any:
+        """Execute API request with async client, see execute()."""
+        try:
+            return await super().execute_async(client, request)
+        except HttpError as e:
+            if is_not_found(e):
+                self.id_cache.invalidate(self.name)
+            raise
+
     def get_file_id(self, name: str) -> str | None:
         """Get file id by name.
 
@@ -94,15 +305,13 @@ class Sheet(GoogleApi):
             while True:
                 # Full blown page iteration from API doc
                 # but in fact we will get exactly one or no one file
-                response = (
-                    self.drive_service.files()
-                    .list(
+                response = self.execute(
+                    self.drive_service.files().list(
                         q=f"name='{name}'",
                         spaces="drive",
                         fields="nextPageToken, files(id, name)",
                         pageToken=page_token,
-                    )
-                    .execute()
+                    ),
                 )
                 for file in response.get("files", []):
                     if file.get("name") == name:
@@ -152,13 +361,37 @@ class Sheet(GoogleApi):
                 ranges=[],
                 includeGridData=False,
             )
-            sheets = request.execute()["sheets"]
+            sheets = self.execute(request)["sheets"]
             # todo check if press_sheet and event_sheet are in the sheets
             return {
                 sheet["properties"]["title"]: sheet["properties"]["sheetId"] for sheet in sheets
             }
         return {press_sheet: None, event_sheet: None}
 
+    def get_row_count(self, sheet: str) -> int:
+        """Get number of rows in the sheet grid.
+
+        Much cheaper than fetching the rows, so we use it to detect changes made outside.
+        """
+        if sheet in self.pending_sheets:
+            self.flush()
+        return self.row_count_from(self.execute(self.row_count_request()), sheet)
+
+    def row_count_request(self) -> Any:
+        """API request to get grid size of all sheets."""
+        return self.service.spreadsheets().get(
+            spreadsheetId=self.spreadSheetId,
+            fields="sheets(properties(title,gridProperties(rowCount)))",
+        )
+
+    def row_count_from(self, result: dict[str, Any], sheet: str) -> int:
+        """Get number of rows in the sheet from row_count_request result."""
+        for sheet_data in result["sheets"]:
+            if sheet_data["properties"]["title"] == sheet:
+                return sheet_data["properties"]["gridProperties"]["rowCount"]  # type: ignore
+        self.id_cache.invalidate(self.name)
+        raise ValueError(f"No sheet `{sheet}` in the spreadsheet `{self.name}`.")
+
     def update_cells(self, sheet: str, values: list[Any], row: int = 1, col: int = 0) -> None:
         """Update cells in Google Sheet.
 
@@ -180,7 +413,7 @@ class Sheet(GoogleApi):
                 },
             )
         )
-        request.execute()
+        self.execute(request)
 
     def append_row(self, sheet: str, values: list[Any], row: int = 1) -> None:
         """Append row to Google Sheet.
@@ -199,67 +432,88 @@ class Sheet(GoogleApi):
             )
         )
 
+    def update_cells_request(
+        self,
+        sheet: str,
+        values: list[Any],
+        row: int = 1,
+        col: int = 0,
+    ) -> dict[str, Any]:
+        """Request to update cells, the same as user entered the values.
+
+        row and col 0-based
+        """
+        return {
+            "updateCells": {
+                "start": {"sheetId": self.sheets[sheet], "rowIndex": row, "columnIndex": col},
+                "rows": [{"values": [self.cell_data(value) for value in values]}],
+                "fields": "userEnteredValue",
+            },
+        }
+
     def insert_row(self, sheet: str, after: int = 1) -> None:
         """Insert row to Google Sheet."""
-        insert_row_request = {
-            "requests": [
-                {
-                    "insertDimension": {
-                        "range": {
-                            "sheetId": self.sheets[sheet],
-                            "dimension": "ROWS",
-                            "startIndex": after,
-                            "endIndex": after + 1,
-                        },
-                        "inheritFromBefore": False,
-                    },
+        self.write(sheet, [self.insert_row_request(sheet, after)])
+
+    def insert_row_request(self, sheet: str, after: int = 1) -> dict[str, Any]:
+        """Request to insert row to Google Sheet."""
+        return {
+            "insertDimension": {
+                "range": {
+                    "sheetId": self.sheets[sheet],
+                    "dimension": "ROWS",
+                    "startIndex": after,
+                    "endIndex": after + 1,
                 },
-            ],
+                "inheritFromBefore": False,
+            },
         }
-        request = self.service.spreadsheets().batchUpdate(
-            spreadsheetId=self.spreadSheetId,
-            body=insert_row_request,
-        )
-        request.execute()
 
     def copy_row_formatting(self, sheet: str, copy_from: int = 2, copy_to: int = 1) -> None:
         """Copy row formatting from copy_from to copy_to."""
-        copy_formatting_request = {
-            "requests": [
-                {
-                    "copyPaste": {
-                        "source": {
-                            "sheetId": self.sheets[sheet],
-                            "startRowIndex": copy_from - 1,
-                            "endRowIndex": copy_from,
-                            "startColumnIndex": 0,
-                            "endColumnIndex": 1000,
-                        },
-                        "destination": {
-                            "sheetId": self.sheets[sheet],
-                            "startRowIndex": copy_to - 1,
-                            "endRowIndex": copy_to,
-                            "startColumnIndex": 0,
-                            "endColumnIndex": 1000,
-                        },
-                        "pasteType": "PASTE_FORMAT",
-                        "pasteOrientation": "NORMAL",
-                    },
+        self.write(sheet, [self.copy_row_formatting_request(sheet, copy_from, copy_to)])
+
+    def copy_row_formatting_request(
+        self,
+        sheet: str,
+        copy_from: int = 2,
+        copy_to: int = 1,
+    ) -> dict[str, Any]:
+        """Request to copy row formatting from copy_from to copy_to."""
+        return {
+            "copyPaste": {
+                "source": {
+                    "sheetId": self.sheets[sheet],
+                    "startRowIndex": copy_from - 1,
+                    "endRowIndex": copy_from,
+                    "startColumnIndex": 0,
+                    "endColumnIndex": 1000,
                 },
-            ],
+                "destination": {
+                    "sheetId": self.sheets[sheet],
+                    "startRowIndex": copy_to - 1,
+                    "endRowIndex": copy_to,
+                    "startColumnIndex": 0,
+                    "endColumnIndex": 1000,
+                },
+                "pasteType": "PASTE_FORMAT",
+                "pasteOrientation": "NORMAL",
+            },
         }
-        request = self.service.spreadsheets().batchUpdate(
-            spreadsheetId=self.spreadSheetId,
-            body=copy_formatting_request,
-        )
-        request.execute()
 
     def get_rows(self, sheet: str, row: int = 1, rows: int = 1, cols: int = 3) -> list[list[Any]]:
         """Get rows from Google Sheet.
 
         row 0-based
         """
-        result = (
+        if sheet in self.pending_sheets:
+            self.flush()  # we should read what we have written
+        result = self.execute(self.rows_request(sheet=sheet, row=row, rows=rows, cols=cols))
+        return result.get("values", [])
+
+    def rows_request(self, sheet: str, row: int, rows: int, cols: int) -> Any:
+        """API request to get rows values."""
+        return (
             self.service.spreadsheets()
             .values()
             .get(
@@ -267,13 +521,38 @@ class Sheet(GoogleApi):
                 range=f"{sheet}!A{row + 1}:{chr(ord('A') + cols - 1)}{row + rows - 1}",
                 valueRenderOption="UNFORMATTED_VALUE",
             )
-            .execute()
         )
-        return result.get("values", [])
 
     def from_serial_time(self, serial: float) -> datetime.datetime:
         """Convert google 'serial number' date-time to datetime."""
-        return datetime.datetime(year=1899, month=12, day=30) + datetime.timedelta(days=serial)
+        return SERIAL_TIME_EPOCH + datetime.timedelta(days=serial)
+
+    def to_serial_time(self, time: datetime.datetime) -> float:
+        """Convert datetime to google 'serial number' date-time."""
+        return (time.replace(tzinfo=None) - SERIAL_TIME_EPOCH) / datetime.timedelta(days=1)
+
+    def cell_data(self, value: Any) -> dict[str, Any]:
+        """Google Sheet CellData with the value.
+
+        Date-time is written as a number, cell formatting shows it as a date-time.
+        Strings starting with "=" are formulas.
+        """
+        if isinstance(value, datetime.datetime):
+            entered_value = {"numberValue": self.to_serial_time(value)}
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            entered_value = {"numberValue": value}
+        elif isinstance(value, str) and value.startswith("="):
+            entered_value = {"formulaValue": value}
+        else:
+            entered_value = {"stringValue": str(value)}
+        return {"userEnteredValue": entered_value}
+
+
+def is_not_found(error: HttpError) -> bool:
+    """Check if API error is about missing spreadsheet or sheet."""
+    return error.resp.status == HTTP_NOT_FOUND or any(
+        marker in str(error).lower() for marker in NOT_FOUND_MARKERS
+    )
 
 
 def check() -> None:
@@ -0,0 +1,64 @@
+"""Long-lived HTTP sessions shared by all presses.
+
+One `requests.Session` per scheme and host, so IFTTT and OpenHAB requests reuse
+kept-alive connections instead of TCP (and TLS) handshake on each button press.
+"""
+
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import models
+
+RETRY_STATUSES = (502, 503, 504)
+RETRY_BACKOFF = 0.2  # seconds, doubled on each retry
+
+_sessions: dict[tuple[str, str], requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def create_session(settings: models.Settings) -> requests.Session:
+    """Create session with connection pool and retries from settings.
+
+    Connection errors are retried for all requests (nothing was sent yet),
+    gateway errors only for idempotent requests (urllib3 Retry default methods).
+    """
+    retries = Retry(
+        total=settings.http_retries,
+        connect=settings.http_retries,
+        read=0,
+        status=settings.http_retries,
+        status_forcelist=RETRY_STATUSES,
+        backoff_factor=RETRY_BACKOFF,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.http_pool_size,
+        max_retries=retries,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session(url: str, settings: models.Settings) -> requests.Session:
+    """Get session for the URL host, create it if not created yet."""
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    with _sessions_lock:
+        if key not in _sessions:
+            _sessions[key] = create_session(settings)
+        return _sessions[key]
+
+
+def close_sessions() -> None:
+    """Close all sessions."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -4,22 +4,49 @@ https://ifttt.com/maker_webhooks
 """
 
 import json
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-import requests
 from requests import RequestException
 
 import models
+from circuit_breaker import timed_http
+from http_session import get_session
 
-HTTP_OK = 200
+if TYPE_CHECKING:
+    import httpx
+
+
+class IftttError(Exception):
+    """IFTTT request failed.
+
+    The message has no webhook URL, because it contains the key.
+    """
+
+    def __init__(self, summary: str, error: Exception) -> None:
+        """Init.
+
+        :param error: requests or httpx exception
+        """
+        # HTTP status for is_outage(), None if there is no answer
+        self.response = getattr(error, "response", None)
+        reason = (
+            f"HTTP {self.response.status_code}"
+            if self.response is not None
+            else type(error).__name__
+        )
+        super().__init__(f"IFTTT {summary} event failed: {reason}")
 
 
 class Ifttt:
     """Register Amazon Dash Button events in IFTTT Maker Webhook."""
 
-    def __init__(self, settings: models.Settings) -> None:
-        """Init."""
+    def __init__(self, settings: models.Settings, timeout: float | None = None) -> None:
+        """Init.
+
+        :param timeout: seconds for requests, `http_timeout` if None
+        """
         self.settings = settings
+        self.timeout = timeout or settings.http_timeout
         self.key_file = self.load_key()
         self.key = self.key_file["key"]
 
@@ -28,22 +55,55 @@ class Ifttt:
         with open(self.settings.ifttt_key_file_name, encoding="utf-8-sig") as key_file:
             return json.loads(key_file.read())  # type: ignore
 
-    def press(self, summary: str, v1: str, v2: str, v3: str) -> None:
-        """Register event in IFTTT."""
-        payload = {"value1": v1, "value2": v2, "value3": v3}
+    def trigger_url(self, summary: str) -> str:
+        """Webhook URL of the event."""
         # todo urlencode event string
-        url = f"https://maker.ifttt.com/trigger/{summary}/with/key/{self.key}"
+        return f"https://maker.ifttt.com/trigger/{summary}/with/key/{self.key}"
+
+    def press(
+        self,
+        summary: str,
+        v1: str,
+        v2: str,
+        v3: str,
+    ) -> None:
+        """Register event in IFTTT, raise IftttError if it failed."""
+        payload = {"value1": v1, "value2": v2, "value3": v3}
+        url = self.trigger_url(summary)
         try:
-            result = requests.post(
-                url,
-                data=json.dumps(payload),
-                headers={"content-type": "application/json"},
-                timeout=5,
-            )
-            if result.status_code != HTTP_OK:
-                print("*" * 10, "IFTTT error:\n", url, "\n", result)
+            with timed_http("ifttt"):
+                result = get_session(url, self.settings).post(
+                    url,
+                    data=json.dumps(payload),
+                    headers={"content-type": "application/json"},
+                    timeout=self.timeout,
+                )
+                result.raise_for_status()
         except RequestException as e:
-            print("*" * 10, "IFTTT request fail:\n", url, "\n", e)
+            raise IftttError(summary, e) from None  # the cause has the URL with the key
+
+    async def press_async(
+        self,
+        client: "httpx.AsyncClient",
+        summary: str,
+        v1: str,
+        v2: str,
+        v3: str,
+    ) -> None:
+        """Register event in IFTTT with async client."""
+        import httpx  # noqa: PLC0415
+
+        url = self.trigger_url(summary)
+        try:
+            with timed_http("ifttt"):
+                result = await client.post(
+                    url,
+                    json={"value1": v1, "value2": v2, "value3": v3},
+                    timeout=self.timeout,
+                )
+                result.raise_for_status()
+        except httpx.HTTPError as e:
+            raise IftttError(summary, e) from None  # the cause has the URL with the key
 
 
 def check() -> None:
@@ -0,0 +1,146 @@
+"""Latency histograms of the press path stages.
+
+Stages are timed from the frame capture to the last backend answer:
+
+- capture: from the frame capture time (`pkt.time`) to the press detection, by button
+- debounce: bounce protection check, by button
+- queue: from the capture to the start of the press handling, by button
+- preprocess_actions, set_summary_by_time: action preparation, by button
+- client: backend object construction, by backend
+- http: each backend HTTP call, by backend
+- action: one action of the press, by backend
+- press: from the capture to the last action done, by button
+
+Histograms are HDR-style: log-linear buckets with relative error < 1/SUB_BUCKETS,
+so they take little memory whatever the values are.
+Send SIGUSR1 to the server to log the report.
+"""
+
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS  # buckets in each power of 2, ~3% precision
+PERCENTILES = (50, 90, 99)
+
+
+def bucket_index(value: int) -> int:
+    """Bucket of the value (microseconds)."""
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+
+def bucket_start(index: int) -> int:
+    """The lowest value of the bucket."""
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    return (index % SUB_BUCKETS + SUB_BUCKETS) << shift
+
+
+class Histogram:
+    """Latency histogram with microsecond resolution."""
+
+    def __init__(self) -> None:
+        """Init."""
+        self.counts: dict[int, int] = {}  # bucket index -> count
+        self.count = 0
+        self.total = 0  # us
+        self.min = 0  # us
+        self.max = 0  # us
+
+    def record(self, seconds: float) -> None:
+        """Add the latency."""
+        value = max(0, round(seconds * 1_000_000))
+        index = bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.min = value if self.count == 0 else min(self.min, value)
+        self.max = max(self.max, value)
+        self.count += 1
+        self.total += value
+
+    def percentile(self, percent: float) -> float:
+        """Latency in seconds that `percent` of the values do not exceed.
+
+        The highest value of the bucket, so it is not less than the real one.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, round(self.count * percent / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.max, bucket_start(index + 1) - 1) / 1_000_000
+        return self.max / 1_000_000
+
+    def mean(self) -> float:
+        """Mean latency in seconds."""
+        return self.total / self.count / 1_000_000 if self.count else 0.0
+
+
+class LatencyRecorder:
+    """Histograms by (stage, label), label is the button or the backend."""
+
+    def __init__(self) -> None:
+        """Init."""
+        self.lock = threading.Lock()
+        self.histograms: dict[tuple[str, str], Histogram] = {}
+
+    def record(self, stage: str, label: str, seconds: float) -> None:
+        """Add the stage latency."""
+        with self.lock:
+            histogram = self.histograms.get((stage, label))
+            if histogram is None:
+                histogram = self.histograms[(stage, label)] = Histogram()
+            histogram.record(seconds)
+
+    @contextmanager
+    def timed(self, stage: str, label: str) -> Iterator[None]:
+        """Record the time of the context, also if it raised."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, label, time.perf_counter() - start)
+
+    def snapshot(self) -> dict[tuple[str, str], dict[str, float]]:
+        """Count and percentiles in seconds by (stage, label)."""
+        with self.lock:
+            return {
+                key: {
+                    "count": histogram.count,
+                    "sum": histogram.total / 1_000_000,
+                    "mean": histogram.mean(),
+                    **{f"p{percent}": histogram.percentile(percent) for percent in PERCENTILES},
+                    "max": histogram.max / 1_000_000,
+                }
+                for key, histogram in sorted(self.histograms.items())
+            }
+
+    def report(self) -> str:
+        """Table of the stage latencies in milliseconds."""
+        header = f"{'stage':<20} {'button / backend':<20} {'count':>7}"
+        lines = [
+            header + "".join(f"{name:>10}" for name in ("mean", "p50", "p90", "p99", "max")),
+        ]
+        for (stage, label), stats in self.snapshot().items():
+            lines.append(
+                f"{stage:<20} {label:<20} {stats['count']:>7}"
+                + "".join(
+                    f"{stats[name] * 1000:10.2f}" for name in ("mean", "p50", "p90", "p99", "max")
+                ),
+            )
+        return "\n".join(lines)
+
+    def clear(self) -> None:
+        """Forget all latencies."""
+        with self.lock:
+            self.histograms = {}
+
+
+latency = LatencyRecorder()
@@ -0,0 +1,105 @@
+"""Non-blocking structured logging.
+
+Modules log with `logging.getLogger(__name__)`. LogWriter puts the records on a
+bounded queue and writes them to stdout from a background thread, so a slow
+stdout (for example Docker log driver) does not stall the capture or the press
+handling. If the queue is full the record is dropped and counted.
+
+Records are JSON lines with the fields passed in `extra`, like button, mac,
+action (type) and duration (seconds), or plain text with `"log_format": "text"`.
+Records below `log_level` are filtered out in the caller, before the message
+is formatted.
+"""
+
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime
+from typing import Any, TextIO
+
+from metrics import counters
+
+LOG_QUEUE_SIZE = 10000  # records waiting for the writer thread
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+# LogRecord attributes, all other attributes are from `extra`
+RECORD_FIELDS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Log record as JSON line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """JSON with time, level, logger, message, extra fields and exception."""
+        created = datetime.fromtimestamp(record.created).astimezone()
+        entry: dict[str, Any] = {
+            "time": created.isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(
+            (key, value) for key, value in vars(record).items() if key not in RECORD_FIELDS
+        )
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Put records on the queue without blocking, drop them if it is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Merge the message args and the traceback, they may change before the writer gets them.
+
+        Unlike QueueHandler.prepare does not format the record, this is up to the writer.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Put the record, count it as dropped if the queue is full."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            counters.inc(("log_dropped",))
+
+
+class LogWriter:
+    """Queue handler of the root logger and the thread that writes its records."""
+
+    def __init__(
+        self,
+        log_format: str = "json",
+        stream: TextIO | None = None,
+        queue_size: int = LOG_QUEUE_SIZE,
+    ) -> None:
+        """Init.
+
+        :param stream: stdout if None
+        """
+        self.handler = DroppingQueueHandler(queue.Queue(queue_size))
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(
+            JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT),
+        )
+        self.listener = logging.handlers.QueueListener(self.handler.queue, output)
+
+    def start(self) -> None:
+        """Start the writer thread and send the records of all loggers to it."""
+        self.listener.start()
+        logging.getLogger().addHandler(self.handler)
+
+    def stop(self) -> None:
+        """Write queued records and stop the writer thread."""
+        logging.getLogger().removeHandler(self.handler)
+        self.listener.stop()
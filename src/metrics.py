@@ -0,0 +1,256 @@
+"""Prometheus metrics endpoint.
+
+If `metrics_port` is set, `GET /metrics` returns the server metrics in
+Prometheus text format (also accepted by OpenMetrics scrapers). Metrics are
+collected on scrape from the counters the server keeps anyway, so the capture
+path only increments a few counters.
+
+Counters incremented from many threads are thread-local (ThreadCounters),
+so there are no locks on the press path.
+"""
+
+import threading
+from collections.abc import Callable, Hashable, Iterable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any
+
+from latency import PERCENTILES, latency
+
+if TYPE_CHECKING:
+    from amazon_dash import AmazonDash
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+HTTP_OK = 200
+HTTP_NOT_FOUND = 404
+
+Labels = dict[str, str]
+Sample = tuple[Labels, float]
+
+
+class ThreadCounters:
+    """Counters without locks on increment.
+
+    Each thread increments its own dict, the totals are summed on read.
+    Dicts of finished threads are kept, so the totals never go down.
+    """
+
+    def __init__(self) -> None:
+        """Init."""
+        self.local = threading.local()
+        self.lock = threading.Lock()  # only to register the dict of a new thread
+        self.thread_counts: list[dict[Hashable, int]] = []
+
+    def inc(self, key: Hashable, amount: int = 1) -> None:
+        """Increment the counter."""
+        counts = self.local.__dict__.get("counts")
+        if counts is None:
+            counts = self.local.counts = {}
+            with self.lock:
+                self.thread_counts.append(counts)
+        counts[key] = counts.get(key, 0) + amount
+
+    def totals(self) -> dict[Hashable, int]:
+        """Sum of the counters of all threads."""
+        with self.lock:
+            thread_counts = list(self.thread_counts)
+        result: dict[Hashable, int] = {}
+        for counts in thread_counts:
+            for key, value in counts.copy().items():  # copy is atomic, the thread goes on
+                result[key] = result.get(key, 0) + value
+        return result
+
+    def clear(self) -> None:
+        """Reset all counters."""
+        with self.lock:
+            self.local = threading.local()
+            self.thread_counts = []
+
+
+counters = ThreadCounters()
+
+
+def escape(value: str) -> str:
+    """Escape label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Exposition:
+    """Metrics in Prometheus text format."""
+
+    def __init__(self) -> None:
+        """Init."""
+        self.lines: list[str] = []
+
+    def add(self, name: str, kind: str, help_text: str, samples: Iterable[Sample]) -> None:
+        """Add metric with its samples."""
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            self.sample(name, labels, value)
+
+    def sample(self, name: str, labels: Labels, value: float) -> None:
+        """Add sample line."""
+        if labels:
+            label_text = ",".join(f'{key}="{escape(text)}"' for key, text in labels.items())
+            name = f"{name}{{{label_text}}}"
+        self.lines.append(f"{name} {value:g}" if isinstance(value, float) else f"{name} {value}")
+
+    def text(self) -> str:
+        """Exposition text."""
+        return "\n".join(self.lines) + "\n"
+
+
+def by_label(totals: dict[Hashable, int], metric: str, *label_names: str) -> list[Sample]:
+    """Samples of the counter keys (metric, label values...)."""
+    return [
+        (dict(zip(label_names, key[1:], strict=True)), value)
+        for key, value in sorted(totals.items(), key=str)
+        if isinstance(key, tuple) and key[0] == metric
+    ]
+
+
+def collect(dash: "AmazonDash") -> str:
+    """Server metrics in Prometheus text format."""
+    totals = counters.totals()
+    metrics = Exposition()
+    metrics.add(
+        "amazon_dash_frames_total",
+        "counter",
+        "ARP and DHCP frames seen.",
+        [({}, dash.frames)],
+    )
+    metrics.add(
+        "amazon_dash_presses_total",
+        "counter",
+        "Button presses.",
+        by_label(totals, "presses", "button"),
+    )
+    metrics.add(
+        "amazon_dash_bounced_presses_total",
+        "counter",
+        "Presses ignored by bounce protection.",
+        by_label(totals, "bounced", "button"),
+    )
+    metrics.add(
+        "amazon_dash_unknown_frames_total",
+        "counter",
+        "Frames from unknown MACs.",
+        [({}, dash.unknown_frames)],
+    )
+    metrics.add(
+        "amazon_dash_unknown_macs",
+        "gauge",
+        "Unknown MACs remembered as reported.",
+        [({"request": "arp"}, len(dash.seen_macs)), ({"request": "dhcp"}, len(dash.seen_dhcp))],
+    )
+    if dash.dispatcher is not None:
+        stats = dash.dispatcher.stats()
+        metrics.add(
+            "amazon_dash_queue_depth",
+            "gauge",
+            "Presses waiting or in handling.",
+            [({}, stats["depth"])],
+        )
+        for name in ("submitted", "dropped", "processed", "failed"):
+            metrics.add(
+                f"amazon_dash_presses_{name}_total",
+                "counter",
+                f"Presses {name} by the press handler.",
+                [({}, stats[name])],
+            )
+    metrics.add(
+        "amazon_dash_action_errors_total",
+        "counter",
+        "Failed actions by action type.",
+        by_label(totals, "action_errors", "type"),
+    )
+    metrics.add(
+        "amazon_dash_google_requests_total",
+        "counter",
+        "Google API requests (quota usage) by API.",
+        by_label(totals, "google_requests", "api"),
+    )
+    metrics.add(
+        "amazon_dash_google_quota_exceeded_total",
+        "counter",
+        "Google API requests rejected because of the quota, by API.",
+        by_label(totals, "google_quota_exceeded", "api"),
+    )
+    if dash.actions is not None:
+        metrics.add(
+            "amazon_dash_backend_up",
+            "gauge",
+            "0 if the circuit breaker of the backend is open.",
+            [
+                ({"endpoint": endpoint}, int(breaker["state"] == "closed"))
+                for endpoint, breaker in dash.actions.breakers.stats().items()
+            ],
+        )
+    if dash.outbox is not None:
+        metrics.add(
+            "amazon_dash_outbox_entries",
+            "gauge",
+            "Actions in the outbox by state.",
+            [({"state": state}, count) for state, count in dash.outbox.stats().items()],
+        )
+    metrics.add(
+        "amazon_dash_log_dropped_total",
+        "counter",
+        "Log records dropped because the log writer could not keep up.",
+        by_label(totals, "log_dropped"),
+    )
+    add_latency(metrics)
+    return metrics.text()
+
+
+def add_latency(metrics: Exposition) -> None:
+    """Press path stage latencies as summary."""
+    name = "amazon_dash_latency_seconds"
+    metrics.add(name, "summary", "Press path stage latency by button or backend.", [])
+    for (stage, label), stats in latency.snapshot().items():
+        labels = {"stage": stage, "label": label}
+        for percent in PERCENTILES:
+            metrics.sample(name, {**labels, "quantile": str(percent / 100)}, stats[f"p{percent}"])
+        metrics.sample(f"{name}_sum", labels, stats["sum"])
+        metrics.sample(f"{name}_count", labels, stats["count"])
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serve GET /metrics."""
+
+    server: "MetricsServer"
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Metrics."""
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(HTTP_NOT_FOUND)
+            return
+        body = self.server.collect().encode()
+        self.send_response(HTTP_OK)
+        self.send_header("content-type", CONTENT_TYPE)
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        """Do not log each scrape."""
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Metrics HTTP server in background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, host: str, port: int, collect: Callable[[], str]) -> None:
+        """Init."""
+        super().__init__((host, port), MetricsHandler)
+        self.collect = collect
+
+    def start(self) -> None:
+        """Serve in background thread."""
+        threading.Thread(target=self.serve_forever, name="metrics", daemon=True).start()
+
+    def stop(self) -> None:
+        """Stop serving."""
+        self.shutdown()
+        self.server_close()
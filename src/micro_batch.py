@@ -0,0 +1,110 @@
+"""Coalesce writes of presses that come close together into one backend batch.
+
+The first press for a backend starts a timer, after the batching window the timer
+thread runs this press and all presses collected meanwhile with one backend object
+in `batch()` mode, so Google gets one Sheets batchUpdate or one Calendar HTTP batch.
+Flushes of one backend run one after another, so presses are written in arrival
+order. Each press waits for the flush and gets its own error.
+"""
+
+import contextvars
+import threading
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future
+from contextlib import AbstractContextManager
+from typing import Any, Protocol, TypeVar
+
+
+class Batchable(Protocol):
+    """Backend that can postpone its writes."""
+
+    def batch(self) -> AbstractContextManager[Any]:
+        """Collect writes inside the context and send them at exit."""
+
+
+BackendT = TypeVar("BackendT", bound=Batchable)
+
+
+class MicroBatcher:
+    """Run works for the same backend collected in `window` seconds in one batch."""
+
+    def __init__(self, window: float) -> None:
+        """Init."""
+        self.window = window
+        self.lock = threading.Lock()
+        self.groups: dict[Hashable, list[tuple[Callable[[Any], None], Future[None]]]] = {}
+        self.flush_locks: dict[Hashable, threading.Lock] = {}  # one flush of the key at a time
+        self.batches = 0  # flushed batches
+        self.works = 0  # works in all flushed batches
+
+    def run(
+        self,
+        key: Hashable,
+        open_backend: Callable[[], BackendT],
+        work: Callable[[BackendT], None],
+    ) -> None:
+        """Run the work in the batch of the backend `key`.
+
+        Returns after the batch is flushed, raises the error of the work or of the flush.
+        """
+        future: Future[None] = Future()
+        with self.lock:
+            group = self.groups.get(key)
+            if group is None:
+                group = self.groups[key] = []
+                flush_lock = self.flush_locks.setdefault(key, threading.Lock())
+                # in the context of the first press, so its HTTP calls count in its breaker
+                context = contextvars.copy_context()
+                timer = threading.Timer(
+                    self.window,
+                    context.run,
+                    (self.flush_group, key, flush_lock, open_backend),
+                )
+                timer.daemon = True
+                timer.start()
+            group.append((work, future))
+        future.result()
+
+    def flush_group(
+        self,
+        key: Hashable,
+        flush_lock: threading.Lock,
+        open_backend: Callable[[], BackendT],
+    ) -> None:
+        """Flush the presses collected for the key (timer thread).
+
+        The group is taken under the flush lock: the next group of the key is started
+        only after this one is taken, so it is flushed after this flush ends.
+        """
+        with flush_lock:
+            with self.lock:
+                group = self.groups.pop(key)
+            self.flush(open_backend, group)
+
+    def flush(
+        self,
+        open_backend: Callable[[], BackendT],
+        group: list[tuple[Callable[[Any], None], Future[None]]],
+    ) -> None:
+        """Run the works in the backend batch and set their results."""
+        with self.lock:
+            self.batches += 1
+            self.works += len(group)
+        succeeded: list[Future[None]] = []
+        try:
+            backend = open_backend()
+            with backend.batch():
+                for work, future in group:
+                    try:
+                        work(backend)
+                    except Exception as e:  # noqa: BLE001
+                        future.set_exception(e)
+                    else:
+                        succeeded.append(future)
+        except Exception as e:  # noqa: BLE001  # nothing or not all was written
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future in succeeded:
+            future.set_result(None)
@@ -1,15 +1,82 @@
+from bisect import bisect_right
 from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime
+from functools import cached_property
 from typing import Any, Literal, Union
 
 from pydantic import (
     BaseModel,
+    ConfigDict,
     RootModel,
     TypeAdapter,
     constr,
+    field_validator,
     model_validator,
 )
 
 BOUNCE_DELAY = 5
+PRESS_QUEUE_SIZE = 100
+PRESS_WORKERS = 2
+ACTION_WORKERS = 8
+SHEET_CACHE_TTL = 24 * 60 * 60
+HTTP_TIMEOUT = 5
+HTTP_RETRIES = 2
+HTTP_POOL_SIZE = 4
+HTTP_MIN_TIMEOUT = 1  # seconds, adaptive timeout is not shorter
+BREAKER_FAILURES = 5  # failures in a row to consider the backend down
+BREAKER_RESET_TIMEOUT = 30  # seconds, then try the backend that is down again
+METRICS_HOST = "0.0.0.0"  # noqa: S104  # Prometheus scrapes from other hosts
+ASYNC_MAX_CONNECTIONS = 100  # all hosts together, for engine "async"
+UNKNOWN_MAC_REPORTS_PER_MINUTE = 10
+OUTBOX_RETRY_DELAY = 5  # seconds, first retry of failed action, doubled for each next one
+OUTBOX_MAX_RETRY_DELAY = 15 * 60
+OUTBOX_MAX_ATTEMPTS = 20
+RELOAD_INTERVAL = 5  # seconds, check settings files for changes
+SEEN_MACS_CAPACITY = 1000  # unknown MACs to remember, so we do not report them again
+SEEN_MACS_TTL = 24 * 60 * 60  # seconds, after that unknown MAC is reported again
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+WEEKDAY_GROUPS = {"weekday": frozenset(range(5)), "weekend": frozenset({5, 6})}
+
+
+def parse_time_of_day(time_str: str) -> int:
+    """Get seconds since midnight from string HH:MM:SS."""
+    time_parts = time_str.split(":")
+    seconds = 0
+    valid_parts = 0
+    for i in time_parts:
+        try:
+            max_time_unit = 60
+            if 0 <= int(i) < max_time_unit:
+                seconds = seconds * 60 + int(i)
+                valid_parts += 1
+        except ValueError as e:
+            raise ValueError('Between ":" in `before` param should be numbers.') from e
+    full_time_parts = 3
+    if valid_parts != full_time_parts or len(time_parts) != full_time_parts:
+        raise ValueError(
+            f'`before` param should be "HH:MM:SS", for example 10:00:00. Got `{time_str}` instead.',
+        )
+    return seconds
+
+
+def parse_weekdays(days: str) -> frozenset[int]:
+    """Get weekday numbers (0 is Monday) from string like "weekend", "mon-fri" or "sat,sun"."""
+    weekdays: set[int] = set()
+    for part in days.lower().replace(" ", "").split(","):
+        if part in WEEKDAY_GROUPS:
+            weekdays |= WEEKDAY_GROUPS[part]
+            continue
+        first, _, last = part.partition("-")
+        if first not in WEEKDAYS or last and last not in WEEKDAYS:
+            raise ValueError(
+                f'`days` param should be like "weekday", "weekend", "mon-fri" or "sat,sun". '
+                f"Got `{days}` instead.",
+            )
+        start = WEEKDAYS.index(first)
+        end = WEEKDAYS.index(last) if last else start
+        weekdays.update(range(start, end + 1))
+    return frozenset(weekdays)
 
 
 class TimeSummary(BaseModel):
@@ -18,6 +85,92 @@ class TimeSummary(BaseModel):
     summary: str
     before: str | None = None
     image: str
+    days: str | None = None  # "weekday", "weekend", "mon-fri", "sat,sun", all days if None
+
+    @field_validator("before")
+    @classmethod
+    def check_before(cls, value: str | None) -> str | None:
+        """Check before is HH:MM:SS."""
+        if value is not None:
+            parse_time_of_day(value)
+        return value
+
+    @field_validator("days")
+    @classmethod
+    def check_days(cls, value: str | None) -> str | None:
+        """Check days could be parsed."""
+        if value is not None:
+            parse_weekdays(value)
+        return value
+
+    @cached_property
+    def before_seconds(self) -> int | None:
+        """`before` as seconds since midnight."""
+        return None if self.before is None else parse_time_of_day(self.before)
+
+    @cached_property
+    def weekdays(self) -> frozenset[int]:
+        """Weekdays when the summary could be used."""
+        return frozenset(range(7)) if self.days is None else parse_weekdays(self.days)
+
+
+@dataclass(frozen=True)
+class DaySchedule:
+    """Summaries of a weekday.
+
+    thresholds - sorted `before` seconds, summaries - summary for each of them,
+    fallback - summary if we are after all thresholds.
+    """
+
+    thresholds: tuple[int, ...]
+    summaries: tuple[str, ...]
+    fallback: str
+
+
+@dataclass(frozen=True)
+class SummarySchedule:
+    """Time-of-day summary schedule for each weekday.
+
+    Built once from `[{"summary": ..., "before": ...}, ...]`, so selecting summary for a press
+    is a bisect in the schedule of the weekday.
+    """
+
+    days: tuple[DaySchedule, ...]
+
+    @classmethod
+    def from_summaries(cls, summaries: list[TimeSummary]) -> "SummarySchedule":
+        """Build schedule.
+
+        Summary is the first in the list with `before` later than now.
+        If there is no such summary, the last one in the list.
+        Summaries with `days` are used only on these days.
+        """
+        days = []
+        for weekday in range(len(WEEKDAYS)):
+            day_summaries = [item for item in summaries if weekday in item.weekdays]
+            thresholds: list[int] = []
+            names: list[str] = []
+            for item in day_summaries:
+                # shadowed by earlier summary with later `before`, never selected
+                if item.before_seconds is not None and (
+                    not thresholds or item.before_seconds > thresholds[-1]
+                ):
+                    thresholds.append(item.before_seconds)
+                    names.append(item.summary)
+            days.append(
+                DaySchedule(
+                    thresholds=tuple(thresholds),
+                    summaries=tuple(names),
+                    fallback=day_summaries[-1].summary if day_summaries else "",
+                ),
+            )
+        return cls(tuple(days))
+
+    def pick(self, time: datetime) -> str:
+        """Get summary for the time."""
+        day = self.days[time.weekday()]
+        idx = bisect_right(day.thresholds, time.hour * 3600 + time.minute * 60 + time.second)
+        return day.summaries[idx] if idx < len(day.summaries) else day.fallback
 
 
 class DashBoardAbsent(BaseModel):
@@ -40,7 +193,12 @@ SummaryType = Union[str, list[TimeSummary]]
 
 
 class CustomBaseModel(BaseModel):
-    """Base model with custom validators."""
+    """Base model with custom validators.
+
+    Frozen: actions are shared by all presses of the button, see `Action.plan`.
+    """
+
+    model_config = ConfigDict(frozen=True)
 
     @model_validator(mode="before")
     def check_summary_type_fields(cls, values: dict[str, Any]) -> dict[str, Any]:  # noqa: N805
@@ -53,6 +211,15 @@ class CustomBaseModel(BaseModel):
 ]"""
         return values
 
+    @cached_property
+    def summary_schedule(self) -> SummarySchedule:
+        """Schedule to select summary by time if summary is a list.
+
+        Built on first use.
+        """
+        assert isinstance(self.summary, list)  # type: ignore[attr-defined]
+        return SummarySchedule.from_summaries(self.summary)  # type: ignore[attr-defined]
+
 
 class SheetAction(CustomBaseModel):
     """Action for a google sheet."""
@@ -109,6 +276,7 @@ class EventActions(CustomBaseModel):
     # todo: flag that this is button event to have other types of events
     summary: SummaryType
     actions: list[ActionItem]
+    parallel: bool | None = None  # run actions concurrently, if None use Settings.parallel_actions
 
 
 class Settings(BaseModel):
@@ -121,6 +289,38 @@ class Settings(BaseModel):
     openweathermap_key_file_name: str
     images_folder: str
     bounce_delay: int = BOUNCE_DELAY
+    reload_interval: float = RELOAD_INTERVAL  # 0 to disable hot reload of settings files
+    # "learn" - sniff all ARP / DHCP and report unknown MACs, "buttons" - only known buttons
+    sniff_mode: Literal["learn", "buttons"] = "learn"
+    unknown_mac_reports_per_minute: int = UNKNOWN_MAC_REPORTS_PER_MINUTE
+    seen_macs_capacity: int = SEEN_MACS_CAPACITY
+    seen_macs_ttl: int = SEEN_MACS_TTL
+    sniff_backend: Literal["scapy", "raw"] = "scapy"
+    sniff_interface: str | None = None  # all interfaces if None
+    press_queue_size: int = PRESS_QUEUE_SIZE
+    press_workers: int = PRESS_WORKERS
+    engine: Literal["threads", "async"] = "threads"  # how presses are handled
+    async_max_connections: int = ASYNC_MAX_CONNECTIONS
+    parallel_actions: bool = False
+    action_workers: int = ACTION_WORKERS
+    write_batch_window: float = 0  # seconds to collect Google writes of presses, 0 - no batching
+    sheet_cache_ttl: int = SHEET_CACHE_TTL
+    sheet_cache_file_name: str | None = None
+    http_timeout: float = HTTP_TIMEOUT
+    http_retries: int = HTTP_RETRIES
+    http_pool_size: int = HTTP_POOL_SIZE
+    adaptive_timeout: bool = True  # timeout from p99 latency of the backend, up to http_timeout
+    http_min_timeout: float = HTTP_MIN_TIMEOUT
+    breaker_failures: int = BREAKER_FAILURES  # 0 - never consider backend down
+    breaker_reset_timeout: float = BREAKER_RESET_TIMEOUT
+    metrics_port: int | None = None  # Prometheus metrics endpoint, no endpoint if None
+    metrics_host: str = METRICS_HOST
+    log_level: Literal["DEBUG", "INFO", "WARNING", "ERROR"] = "INFO"
+    log_format: Literal["json", "text"] = "json"
+    outbox_file_name: str | None = None  # SQLite file to retry failed actions, no retries if None
+    outbox_retry_delay: float = OUTBOX_RETRY_DELAY
+    outbox_max_retry_delay: float = OUTBOX_MAX_RETRY_DELAY
+    outbox_max_attempts: int = OUTBOX_MAX_ATTEMPTS
     dashboards: dict[str, DashboardItem]
     events: dict[str, EventActions]
 
@@ -4,10 +4,19 @@ http://demo.openhab.org:8080/doc/index.html
 """
 
 import json
-
-import requests
+import logging
+from typing import TYPE_CHECKING
 
 import models
+from circuit_breaker import timed_http
+from http_session import get_session
+
+if TYPE_CHECKING:
+    import httpx
+
+EXPECTED_COMMAND_COUNT = 2
+
+logger = logging.getLogger(__name__)
 
 
 class OpenHab:
@@ -17,37 +26,94 @@ class OpenHab:
         """Init."""
         self.settings = settings
 
-    def press(self, action_params: models.OpenhabAction) -> None:
-        """Get current item state and changes it to opposite status."""
+    def press(self, action_params: models.OpenhabAction, timeout: float | None = None) -> None:
+        """Get current item state and changes it to opposite status.
+
+        Raises requests exception if a request failed.
+
+        :param timeout: seconds for each request, `http_timeout` if None
+        """
+        timeout = timeout or self.settings.http_timeout
+        if (commands := self.commands(action_params)) is None:
+            return
+        base_url = f"{action_params.path}/items/{action_params.item}"
+        session = get_session(base_url, self.settings)  # GET and POST on the same connection
+        with timed_http("openhab"):
+            state = session.get(
+                f"{base_url}/state",
+                headers={"content-type": "application/json"},
+                timeout=timeout,
+            )
+            state.raise_for_status()
+        if (command := self.next_command(action_params, commands, state.text)) is None:
+            return
+        with timed_http("openhab"):
+            result = session.post(
+                base_url,
+                data=json.dumps(command),
+                headers={"content-type": "application/json"},
+                timeout=timeout,
+            )
+            result.raise_for_status()
+
+    async def press_async(
+        self,
+        client: "httpx.AsyncClient",
+        action_params: models.OpenhabAction,
+        timeout: float | None = None,
+    ) -> None:
+        """Get current item state and changes it to opposite status, with async client."""
+        timeout = timeout or self.settings.http_timeout
+        if (commands := self.commands(action_params)) is None:
+            return
         base_url = f"{action_params.path}/items/{action_params.item}"
+        with timed_http("openhab"):
+            state = await client.get(
+                f"{base_url}/state",
+                headers={"content-type": "application/json"},
+                timeout=timeout,
+            )
+            state.raise_for_status()
+        if (command := self.next_command(action_params, commands, state.text)) is None:
+            return
+        with timed_http("openhab"):
+            result = await client.post(
+                base_url,
+                content=json.dumps(command),
+                headers={"content-type": "application/json"},
+                timeout=timeout,
+            )
+            result.raise_for_status()
+
+    def commands(self, action_params: models.OpenhabAction) -> list[str] | None:
+        """Two commands to switch between, None if the setting is wrong."""
         commands = action_params.command.upper().split(";")
-        expected_command_count = 2
-        if len(commands) != expected_command_count:
-            print(
-                '\nWrong "command" setting in openhab action. '
+        if len(commands) != EXPECTED_COMMAND_COUNT:
+            logger.error(
+                'Wrong "command" setting in openhab action. '
                 'Should be two openHAB commands separated by ";" ("ON;OFF" or "UP;DOWN"). '
                 "Button press will switch between them.",
+                extra={"action": "openhab"},
             )
-            return
+            return None
+        return commands
 
-        state = requests.get(
-            f"{base_url}/state",
-            headers={"content-type": "application/json"},
-            timeout=5,
-        )
+    def next_command(
+        self,
+        action_params: models.OpenhabAction,
+        commands: list[str],
+        state: str,
+    ) -> str | None:
+        """Command to switch the item from the current state, None if the state is unknown."""
         try:
-            current_idx = commands.index(state.text.upper())
+            current_idx = commands.index(state.upper())
         except ValueError:
-            print(
-                f"Item {action_params.item} now in state {state.text}. "
-                f'But in "command" settings ({action_params.command}) there is no such state.',
+            logger.warning(
+                'Item %s now in state %s. But in "command" settings (%s) there is no such state.',
+                action_params.item,
+                state,
+                action_params.command,
+                extra={"action": "openhab"},
             )
-            return
-
-        command_idx = (current_idx + 1) % 2  # switch between two states
-        requests.post(
-            base_url,
-            data=json.dumps(commands[command_idx]),
-            headers={"content-type": "application/json"},
-            timeout=5,
-        )
+            return None
+        return commands[(current_idx + 1) % 2]  # switch between two states
@@ -0,0 +1,256 @@
+"""Durable outbox for button actions.
+
+Each press is recorded in SQLite (WAL journal) before it is queued for a worker,
+the worker replaces it with the actions of the press before running them, and
+each action is deleted after it succeeds. Failed actions are replayed by
+OutboxRetrier with exponential backoff, also after restart, and presses left in
+the queue by a crash are queued again on start, so a network blip, a backend
+outage or a restart does not lose presses.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import models
+
+logger = logging.getLogger(__name__)
+
+# pending - running now, retry - waiting for retry, failed - out of attempts (kept to inspect)
+SCHEMA = """
+create table if not exists outbox (
+    id integer primary key,
+    button text not null,
+    action text not null,
+    created real not null,
+    state text not null default 'pending',
+    attempts integer not null default 0,
+    next_attempt real not null default 0,
+    last_error text
+)
+"""
+INDEX = "create index if not exists outbox_due on outbox (state, next_attempt)"
+# presses queued for workers, not expanded to actions yet
+PRESS_SCHEMA = """
+create table if not exists press (
+    id integer primary key,
+    button text not null,
+    time real not null
+)
+"""
+
+
+@dataclass(frozen=True)
+class OutboxEntry:
+    """Action waiting for retry."""
+
+    id: int
+    button: str
+    action: models.ActionItem
+    created: float  # press time
+    attempts: int
+
+
+class Outbox:
+    """Actions not registered in backends yet."""
+
+    def __init__(
+        self,
+        file_name: str,
+        retry_delay: float = models.OUTBOX_RETRY_DELAY,
+        max_retry_delay: float = models.OUTBOX_MAX_RETRY_DELAY,
+        max_attempts: int = models.OUTBOX_MAX_ATTEMPTS,
+    ) -> None:
+        """Open outbox.
+
+        Actions left pending by the previous run were interrupted, so they are retried.
+        """
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()  # the connection is shared by Dispatcher workers
+        self.connection = sqlite3.connect(file_name, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("pragma journal_mode=wal")
+            # WAL with synchronous=normal survives the application crash, and commit is fast
+            self.connection.execute("pragma synchronous=normal")
+            self.connection.execute(SCHEMA)
+            self.connection.execute(INDEX)
+            self.connection.execute(PRESS_SCHEMA)
+            self.connection.execute("update outbox set state = 'retry' where state = 'pending'")
+
+    def add_press(self, button: str, press_time: float) -> int:
+        """Record the press before it is queued, returns press id."""
+        with self.lock, self.connection:
+            return (
+                self.connection.execute(
+                    "insert into press (button, time) values (?, ?)",
+                    (button, press_time),
+                ).lastrowid
+                or 0
+            )
+
+    def drop_press(self, press_id: int) -> None:
+        """The press is not handled, for example the queue is full."""
+        with self.lock, self.connection:
+            self.connection.execute("delete from press where id = ?", (press_id,))
+
+    def presses(self) -> list[tuple[int, str, float]]:
+        """Presses (id, button, time) left in the queue by the previous run."""
+        with self.lock:
+            return self.connection.execute(
+                "select id, button, time from press order by id",
+            ).fetchall()
+
+    def add(
+        self,
+        button: str,
+        actions: list[models.ActionItem],
+        press_id: int | None = None,
+        press_time: float | None = None,
+    ) -> list[int]:
+        """Record actions of the press before running them, returns entry ids.
+
+        The recorded press (press_id) is replaced with its actions in one transaction.
+
+        :param press_time: saved as `created`, now if None
+        """
+        created = time.time() if press_time is None else press_time
+        with self.lock, self.connection:
+            if press_id is not None:
+                self.connection.execute("delete from press where id = ?", (press_id,))
+            return [
+                self.connection.execute(
+                    "insert into outbox (button, action, created) values (?, ?, ?)",
+                    (button, action.model_dump_json(), created),
+                ).lastrowid
+                or 0
+                for action in actions
+            ]
+
+    def done(self, entry_id: int) -> None:
+        """Action is registered in the backend."""
+        with self.lock, self.connection:
+            self.connection.execute("delete from outbox where id = ?", (entry_id,))
+
+    def failed(self, entry_id: int, error: str) -> None:
+        """Schedule retry with exponential backoff, or give up after max_attempts."""
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "select attempts from outbox where id = ?",
+                (entry_id,),
+            ).fetchone()
+            if row is None:
+                return
+            attempts = row[0] + 1
+            delay = min(self.max_retry_delay, self.retry_delay * 2 ** (attempts - 1))
+            self.connection.execute(
+                "update outbox set state = ?, attempts = ?, next_attempt = ?, last_error = ? "
+                "where id = ?",
+                (
+                    "failed" if attempts >= self.max_attempts else "retry",
+                    attempts,
+                    time.time() + delay,
+                    error,
+                    entry_id,
+                ),
+            )
+
+    def due(self, now: float | None = None) -> list[OutboxEntry]:
+        """Take actions to retry now, they are pending until done() or failed()."""
+        now = time.time() if now is None else now
+        with self.lock, self.connection:
+            rows = self.connection.execute(
+                "select id, button, action, created, attempts from outbox "
+                "where state = 'retry' and next_attempt <= ? order by id",
+                (now,),
+            ).fetchall()
+            self.connection.executemany(
+                "update outbox set state = 'pending' where id = ?",
+                [(row[0],) for row in rows],
+            )
+        return [
+            OutboxEntry(
+                id=entry_id,
+                button=button,
+                action=models.ActionItemLoad(json.loads(action)),
+                created=created,
+                attempts=attempts,
+            )
+            for entry_id, button, action, created, attempts in rows
+        ]
+
+    def stats(self) -> dict[str, int]:
+        """Entries count by state."""
+        with self.lock:
+            counts = dict(
+                self.connection.execute("select state, count(*) from outbox group by state"),
+            )
+        return {state: counts.get(state, 0) for state in ("pending", "retry", "failed")}
+
+    def close(self) -> None:
+        """Close the database."""
+        with self.lock:
+            self.connection.close()
+
+
+class OutboxRetrier:
+    """Replay failed actions in background thread."""
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        replay: Callable[[str, models.ActionItem, float], None],
+    ) -> None:
+        """Init.
+
+        :param replay: runs the action of the button pressed at the time (timestamp),
+            raises exception if it failed
+        """
+        self.outbox = outbox
+        self.replay = replay
+        self.stopped = threading.Event()
+        self.thread: threading.Thread | None = None
+
+    def retry_due(self) -> None:
+        """Replay all actions due now."""
+        for entry in self.outbox.due():
+            fields = {"button": entry.button, "action": entry.action.type}
+            logger.info(
+                'Retry %s action of "%s" (attempt %s)',
+                entry.action.type,
+                entry.button,
+                entry.attempts + 1,
+                extra=fields,
+            )
+            try:
+                self.replay(entry.button, entry.action, entry.created)
+            except Exception as e:  # noqa: BLE001
+                logger.exception("Retry error", extra=fields)
+                self.outbox.failed(entry.id, repr(e))
+            else:
+                self.outbox.done(entry.id)
+
+    def run(self) -> None:
+        """Retry until stopped.
+
+        Backoff delays are not shorter than retry_delay, so we check the outbox that often.
+        """
+        while not self.stopped.is_set():
+            self.retry_due()
+            self.stopped.wait(self.outbox.retry_delay)
+
+    def start(self) -> None:
+        """Start retrier thread."""
+        self.thread = threading.Thread(target=self.run, name="outbox-retrier", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stop retrier thread."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,206 @@
+"""Capture button requests from raw AF_PACKET socket without scapy.
+
+To detect a button press we need only the source MAC and whether the frame is
+ARP who-has or DHCP (UDP port 67), so we parse Ethernet / ARP / IPv4 / UDP headers
+right in the receive buffer with `struct` instead of full scapy dissection.
+Linux only, needs root (or CAP_NET_RAW) like scapy sniffing.
+
+The kernel drops all other frames with classic BPF program attached to the socket,
+the same filter as the scapy backend uses, but built here, so we need no tcpdump
+to compile it.
+"""
+
+import ctypes
+import socket
+import struct
+import time
+from collections.abc import Callable, Iterable
+
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+ETH_P_ARP = 0x0806
+ETH_P_8021Q = 0x8100  # VLAN tag
+ETH_HEADER_LEN = 14
+VLAN_TAG_LEN = 4
+ARP_OP_OFFSET = 6
+ARP_WHO_HAS = 1
+IPPROTO_UDP = 17
+IP_MIN_HEADER_LEN = 20
+UDP_HEADER_LEN = 8
+DHCP_SERVER_PORT = 67
+FRAME_BUFFER_SIZE = 65536
+SO_ATTACH_FILTER = 26  # linux/filter.h, not in the socket module
+# classic BPF opcodes
+BPF_LDW = 0x20  # A = word at [k]
+BPF_LDH = 0x28  # A = half word at [k]
+BPF_LDB = 0x30  # A = byte at [k]
+BPF_LDH_IND = 0x48  # A = half word at [X + k]
+BPF_LDX_IP_LEN = 0xB1  # X = 4 * ([k] & 0xf), IPv4 header length
+BPF_JEQ = 0x15  # jump if A == k
+BPF_JSET = 0x45  # jump if A & k
+BPF_RET = 0x06  # accept k bytes of the frame, 0 - drop it
+IP_FRAGMENT_OFFSET_MASK = 0x1FFF
+
+ethertype_struct = struct.Struct("!H")
+ports_struct = struct.Struct("!HH")
+instruction_struct = struct.Struct("HBBI")  # struct sock_filter
+program_struct = struct.Struct("HP")  # struct sock_fprog
+
+Instruction = tuple[int, int, int, int]  # code, jump if true, jump if false, k
+LabeledInstruction = tuple[int, int | str, int | str, int]  # jumps may be labels
+
+
+def ethernet_payload(frame: memoryview) -> tuple[int, int]:
+    """Get (payload offset, ethertype) of Ethernet frame, ethertype 0 if it is truncated."""
+    if len(frame) < ETH_HEADER_LEN:
+        return 0, 0
+    offset = ETH_HEADER_LEN
+    (ethertype,) = ethertype_struct.unpack_from(frame, offset - 2)
+    if ethertype == ETH_P_8021Q:
+        offset += VLAN_TAG_LEN
+        if len(frame) < offset:
+            return 0, 0
+        (ethertype,) = ethertype_struct.unpack_from(frame, offset - 2)
+    return offset, ethertype
+
+
+def is_arp_who_has(frame: memoryview, offset: int) -> bool:
+    """Check if ARP packet at the offset is who-has request."""
+    if len(frame) < offset + ARP_OP_OFFSET + 2:
+        return False
+    (operation,) = ethertype_struct.unpack_from(frame, offset + ARP_OP_OFFSET)
+    return operation == ARP_WHO_HAS
+
+
+def is_dhcp(frame: memoryview, offset: int) -> bool:
+    """Check if IPv4 packet at the offset is UDP from or to DHCP server port."""
+    if len(frame) < offset + IP_MIN_HEADER_LEN or frame[offset + 9] != IPPROTO_UDP:
+        return False
+    udp_offset = offset + (frame[offset] & 0x0F) * 4  # IHL in 32-bit words
+    if len(frame) < udp_offset + UDP_HEADER_LEN:
+        return False
+    return DHCP_SERVER_PORT in ports_struct.unpack_from(frame, udp_offset)
+
+
+def parse_frame(frame: memoryview) -> tuple[str, bool] | None:
+    """Get (source MAC, is DHCP) if the frame is ARP who-has or DHCP request.
+
+    The same frames as scapy filter "arp or (udp and port 67)" + check in AmazonDash.arp_handler.
+    Returns None for all other frames.
+    """
+    offset, ethertype = ethernet_payload(frame)
+    if (ethertype == ETH_P_ARP and is_arp_who_has(frame, offset)) or (
+        ethertype == ETH_P_IP and is_dhcp(frame, offset)
+    ):
+        return frame[6:12].hex(":"), ethertype == ETH_P_IP
+    return None
+
+
+def filter_program(macs: Iterable[str] = ()) -> list[Instruction]:
+    """Classic BPF program for "arp or (udp and port 67)", only from the MACs if they are given.
+
+    Jumps are to the next instruction + offset, or to a label, resolved at the end.
+    The kernel usually strips VLAN tags before the filter, if a frame still has the
+    tag in its data it passes unchecked and is filtered by parse_frame.
+    """
+    program: list[LabeledInstruction] = [
+        (BPF_LDH, 0, 0, ETH_HEADER_LEN - 2),  # ethertype
+        (BPF_JEQ, "macs", 0, ETH_P_ARP),
+        (BPF_JEQ, "accept", 0, ETH_P_8021Q),
+        (BPF_JEQ, 0, "drop", ETH_P_IP),
+        (BPF_LDB, 0, 0, ETH_HEADER_LEN + 9),  # IP protocol
+        (BPF_JEQ, 0, "drop", IPPROTO_UDP),
+        (BPF_LDH, 0, 0, ETH_HEADER_LEN + 6),  # IP flags and fragment offset
+        (BPF_JSET, "drop", 0, IP_FRAGMENT_OFFSET_MASK),  # not the first fragment, no UDP header
+        (BPF_LDX_IP_LEN, 0, 0, ETH_HEADER_LEN),
+        (BPF_LDH_IND, 0, 0, ETH_HEADER_LEN),  # UDP source port
+        (BPF_JEQ, "macs", 0, DHCP_SERVER_PORT),
+        (BPF_LDH_IND, 0, 0, ETH_HEADER_LEN + 2),  # UDP destination port
+        (BPF_JEQ, "macs", "drop", DHCP_SERVER_PORT),
+    ]
+    labels = {"drop": len(program), "accept": len(program) + 1, "macs": len(program) + 2}
+    program += [(BPF_RET, 0, 0, 0), (BPF_RET, 0, 0, FRAME_BUFFER_SIZE)]
+    for mac in macs:
+        address = bytes.fromhex(mac.replace(":", ""))
+        program += [
+            (BPF_LDW, 0, 0, 6),  # source MAC, first 4 bytes
+            (BPF_JEQ, 0, 3, int.from_bytes(address[:4], "big")),  # to the next MAC
+            (BPF_LDH, 0, 0, 10),  # last 2 bytes
+            (BPF_JEQ, 0, 1, int.from_bytes(address[4:], "big")),
+            (BPF_RET, 0, 0, FRAME_BUFFER_SIZE),
+        ]
+    program.append((BPF_RET, 0, 0, 0 if macs else FRAME_BUFFER_SIZE))
+
+    def jump(index: int, target: int | str) -> int:
+        return labels[target] - index - 1 if isinstance(target, str) else target
+
+    return [
+        (code, jump(index, if_true), jump(index, if_false), k)
+        for index, (code, if_true, if_false, k) in enumerate(program)
+    ]
+
+
+def attach_filter(sock: socket.socket, program: list[Instruction]) -> None:
+    """Replace BPF program of the socket, the kernel does it atomically."""
+    instructions = ctypes.create_string_buffer(
+        b"".join(instruction_struct.pack(*instruction) for instruction in program),
+    )
+    sock.setsockopt(
+        socket.SOL_SOCKET,
+        SO_ATTACH_FILTER,
+        program_struct.pack(len(program), ctypes.addressof(instructions)),
+    )
+
+
+class RawCapture:
+    """Read frames from AF_PACKET socket and call handler for button requests."""
+
+    def __init__(
+        self,
+        handler: Callable[[str, float, bool], None],
+        interface: str | None = None,
+        macs: Iterable[str] = (),
+    ) -> None:
+        """Init.
+
+        :param handler: called with (source MAC, frame time, is DHCP)
+        :param interface: network interface to listen, all if None
+        :param macs: the kernel passes only frames from these MACs, all if empty
+        """
+        self.handler = handler
+        self.interface = interface
+        self.macs = list(macs)
+        self.sock: socket.socket | None = None
+        self.frames = 0  # all frames received
+        self.matched = 0  # ARP who-has and DHCP frames
+
+    def open_socket(self) -> socket.socket:
+        """Open raw socket with the kernel filter."""
+        sock = socket.socket(
+            socket.AF_PACKET,  # type: ignore[attr-defined]  # Linux only
+            socket.SOCK_RAW,
+            socket.htons(ETH_P_ALL),
+        )
+        attach_filter(sock, filter_program(self.macs))
+        if self.interface:
+            sock.bind((self.interface, 0))
+        return sock
+
+    def set_macs(self, macs: Iterable[str]) -> None:
+        """Change the MACs of the kernel filter, capture goes on."""
+        self.macs = list(macs)
+        if self.sock is not None:
+            attach_filter(self.sock, filter_program(self.macs))
+
+    def run(self) -> None:
+        """Capture frames forever."""
+        buffer = bytearray(FRAME_BUFFER_SIZE)
+        view = memoryview(buffer)
+        with self.open_socket() as sock:
+            self.sock = sock
+            while True:
+                size = sock.recv_into(buffer)
+                self.frames += 1
+                if result := parse_frame(view[:size]):
+                    self.matched += 1
+                    self.handler(result[0], time.time(), result[1])
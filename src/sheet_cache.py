@@ -0,0 +1,177 @@
+"""Caches of Google Sheet data shared by all presses.
+
+Spreadsheet and sheet names almost never change, so we do not have to resolve
+them with Drive and Sheets API calls on each button press.
+And we do not have to fetch the event sheet to find the last event of a summary.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any
+
+import models
+
+logger = logging.getLogger(__name__)
+
+_cache: "SheetIdCache | None" = None
+_caches_lock = threading.Lock()
+_event_indexes: dict[tuple[str, str], "EventIndex"] = {}
+
+
+class SheetIdCache:
+    """Spreadsheet name -> (spreadsheet id, {sheet title: sheetId}) with time to live.
+
+    Optionally persisted to JSON file so it survives restarts.
+    """
+
+    def __init__(self, ttl: int, file_name: str | None = None) -> None:
+        """Init."""
+        self.ttl = ttl
+        self.file_name = file_name
+        self.lock = threading.Lock()
+        self.items: dict[str, dict[str, Any]] = self.load()
+
+    def load(self) -> dict[str, dict[str, Any]]:
+        """Load cache from the file."""
+        if self.file_name is None or not os.path.isfile(self.file_name):
+            return {}
+        try:
+            with open(self.file_name, encoding="utf-8") as cache_file:
+                return json.load(cache_file)  # type: ignore
+        except (OSError, ValueError) as e:
+            logger.warning("Cannot load sheet ids cache from %s: %s", self.file_name, e)
+            return {}
+
+    def save(self) -> None:
+        """Save cache to the file."""
+        if self.file_name is None:
+            return
+        try:
+            tmp_file_name = f"{self.file_name}.tmp"
+            with open(tmp_file_name, "w", encoding="utf-8") as cache_file:
+                json.dump(self.items, cache_file)
+            os.replace(tmp_file_name, self.file_name)
+        except OSError as e:
+            logger.warning("Cannot save sheet ids cache to %s: %s", self.file_name, e)
+
+    def get(self, name: str) -> tuple[str, dict[str, Any]] | None:
+        """Get (spreadsheet id, sheet ids) if cached and not expired."""
+        with self.lock:
+            item = self.items.get(name)
+            if item is None or item["time"] + self.ttl < time.time():
+                return None
+            return item["id"], item["sheets"]
+
+    def set(self, name: str, spreadsheet_id: str, sheets: dict[str, Any]) -> None:
+        """Cache ids of the spreadsheet."""
+        with self.lock:
+            self.items[name] = {"id": spreadsheet_id, "sheets": sheets, "time": time.time()}
+            self.save()
+
+    def invalidate(self, name: str) -> None:
+        """Forget ids of the spreadsheet."""
+        with self.lock:
+            if self.items.pop(name, None) is not None:
+                self.save()
+
+
+class EventIndex:
+    """Index of the event sheet: summary -> (row, [summary, start, end]) of the last event.
+
+    Events are inserted at the top of the sheet so the last event of a summary is the
+    first row with it.
+    Rows are 0-based, values are unformatted (date-time as serial numbers).
+    The index is seeded from the sheet and after that updated with our own changes.
+    `row_count` is the sheet grid size we expect, if the sheet has other size it was
+    changed outside and the index should be seeded again.
+    """
+
+    def __init__(self) -> None:
+        """Init."""
+        self.lock = threading.Lock()
+        self.rows: dict[str, tuple[int, list[Any]]] = {}
+        self.row_count: int | None = None  # None if not seeded
+
+    def is_synced(self, row_count: int) -> bool:
+        """Check if the index is seeded and the sheet was not changed outside."""
+        return self.row_count == row_count
+
+    def seed(self, rows: list[list[Any]], first_row: int, row_count: int) -> None:
+        """Build index from the sheet rows, stop at the first row without summary."""
+        index: dict[str, tuple[int, list[Any]]] = {}
+        for row_idx, row in enumerate(rows, start=first_row):
+            if not row or not row[0]:
+                break
+            index.setdefault(row[0], (row_idx, list(row)))
+        with self.lock:
+            self.rows = index
+            self.row_count = row_count
+
+    def reset(self) -> None:
+        """Drop the index so it will be seeded again."""
+        with self.lock:
+            self.rows = {}
+            self.row_count = None
+
+    def find(self, summary: str) -> tuple[int | None, list[Any] | None]:
+        """Get (row, [summary, start, end]) of the last event with the summary."""
+        with self.lock:
+            if summary in self.rows:
+                row, values = self.rows[summary]
+                return row, list(values)
+            return None, None
+
+    def insert_row(self, row: int, values: list[Any]) -> None:
+        """Register row inserted before `row`, rows below are shifted down."""
+        with self.lock:
+            if self.row_count is None:
+                return
+            self.rows = {
+                summary: (event_row + 1 if event_row >= row else event_row, event)
+                for summary, (event_row, event) in self.rows.items()
+            }
+            self.rows[values[0]] = (row, list(values))
+            self.row_count += 1
+
+    def update_row(self, row: int, col: int, values: list[Any]) -> None:
+        """Register cells changed in the row."""
+        with self.lock:
+            for summary, (event_row, event) in self.rows.items():
+                if event_row == row:
+                    updated = event + [None] * (col + len(values) - len(event))
+                    updated[col : col + len(values)] = values
+                    self.rows[summary] = (event_row, updated)
+                    return
+
+
+def get_event_index(spreadsheet_id: str, sheet: str) -> EventIndex:
+    """Get event index of the sheet, create it if not created yet."""
+    key = (spreadsheet_id, sheet)
+    with _caches_lock:
+        if key not in _event_indexes:
+            _event_indexes[key] = EventIndex()
+        return _event_indexes[key]
+
+
+def get_sheet_id_cache(settings: models.Settings) -> SheetIdCache:
+    """Get the cache shared by all presses, apply reloaded settings to it.
+
+    If `sheet_cache_file_name` changed, the cache is replaced by one loaded from the new file.
+    """
+    global _cache  # noqa: PLW0603
+    with _caches_lock:
+        if _cache is None or _cache.file_name != settings.sheet_cache_file_name:
+            _cache = SheetIdCache(settings.sheet_cache_ttl, settings.sheet_cache_file_name)
+        _cache.ttl = settings.sheet_cache_ttl
+        return _cache
+
+
+def clear_caches() -> None:
+    """Forget all caches."""
+    global _cache  # noqa: PLW0603
+    with _caches_lock:
+        _cache = None
+        _event_indexes.clear()
@@ -8,6 +8,10 @@ sys.modules["scapy.all"] = Mock()
 sys.modules["scapy"] = Mock()
 sys.modules["scapy.layers.dhcp"] = Mock()
 sys.modules["scapy.layers.l2"] = Mock()
+sys.modules["scapy.sendrecv"] = Mock()
+sys.modules["scapy.config"] = Mock()
+sys.modules["scapy.arch.linux"] = Mock()
+sys.modules["scapy.error"] = Mock(Scapy_Exception=type("Scapy_Exception", (Exception,), {}))
 
 # Point sys.path to our sources before importing anything from them
 import os.path
@@ -19,7 +23,12 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "../src"))
 from amazon_dash import AmazonDash
 from models import Settings
 from action import Action
-from google_api import GoogleApi
+from google_api import GoogleApi, registry
+from sheet_cache import clear_caches
+from google_calendar import last_events
+from http_session import close_sessions
+from latency import latency
+from metrics import counters
 
 
 @pytest.fixture(scope="function")
@@ -52,3 +61,26 @@ def google_credentials():
 @pytest.fixture
 def google_api_instance(settings, google_credentials):
     yield GoogleApi(settings, "mock-api", "mock-ver")
+
+
+@pytest.fixture(autouse=True)
+def google_registry():
+    """Do not share cached Google credentials and services between tests."""
+    registry.clear()
+    yield registry
+    registry.clear()
+
+
+@pytest.fixture(autouse=True)
+def backend_caches():
+    """Do not share cached sheet ids, calendar events, HTTP sessions and metrics between tests."""
+    clear_caches()
+    last_events.clear()
+    latency.clear()
+    counters.clear()
+    yield
+    clear_caches()
+    last_events.clear()
+    latency.clear()
+    counters.clear()
+    close_sessions()
@@ -1,6 +1,12 @@
+import time
+import tracemalloc
+from contextlib import nullcontext
 from datetime import datetime, timedelta
 from unittest.mock import Mock, patch, MagicMock
 
+import pytest
+from pydantic import ValidationError
+
 import models
 from action import Action
 
@@ -22,6 +28,7 @@ def test_action(fake_datetime, action):
             value2="",
             value3="",
         ),
+        fake_datetime.now.return_value,  # the press time
     )
     act.calendar_action.assert_called_with(
         "white",
@@ -34,6 +41,7 @@ def test_action(fake_datetime, action):
             default=900,
             summary="Physiotherapy",
         ),
+        fake_datetime.now.return_value,
     )
     act.sheet_action.assert_called_with(
         "white",
@@ -47,6 +55,7 @@ def test_action(fake_datetime, action):
             default=900,
             summary="Physiotherapy",
         ),
+        fake_datetime.now.return_value,
     )
 
 
@@ -133,7 +142,7 @@ def test_mocked_actions(
     mock_openhub_action.assert_not_called()
 
 
-@patch("action.Sheet")
+@patch("google_sheet.Sheet")
 def test_sheet_action(mock_sheet, action):
     mock_sheet_instance = MagicMock()
     mock_sheet.return_value = mock_sheet_instance
@@ -160,10 +169,10 @@ def test_sheet_action(mock_sheet, action):
     with patch("action.datetime") as mock_datetime:
         mock_datetime.now = Mock(return_value=datetime(2023, 9, 9, 11, 0, 0))
         action.sheet_action("test_button", action_params)
-    mock_sheet_instance.press.assert_called_with("test_summary")
+    mock_sheet_instance.press.assert_called_with("test_summary", None)
 
 
-@patch("action.Calendar")
+@patch("google_calendar.Calendar")
 def test_calendar_action(mock_calendar, action):
     mock_calendar_instance = MagicMock()
     mock_calendar.return_value = mock_calendar_instance
@@ -191,10 +200,10 @@ def test_calendar_action(mock_calendar, action):
     with patch("action.datetime") as mock_datetime:
         mock_datetime.now = Mock(return_value=mocked_now)
         action.calendar_action("test_button", action_params)
-    mock_calendar_instance.start_event.assert_called_with("test_summary")
+    mock_calendar_instance.start_event.assert_called_with("test_summary", mocked_now)
 
 
-@patch("action.Calendar")
+@patch("google_calendar.Calendar")
 def test_calendar_close_event(mock_calendar, action):
     mock_calendar_instance = MagicMock()
     mock_calendar.return_value = mock_calendar_instance
@@ -224,7 +233,7 @@ def test_calendar_close_event(mock_calendar, action):
     mock_calendar_instance.close_event.assert_called_with(prev_even_id, mocked_now)
 
 
-@patch("action.Calendar")
+@patch("google_calendar.Calendar")
 def test_calendar_auto_close_event(mock_calendar, action):
     mock_calendar_instance = MagicMock()
     mock_calendar.return_value = mock_calendar_instance
@@ -255,3 +264,205 @@ def test_calendar_auto_close_event(mock_calendar, action):
     mock_calendar_instance.close_event.assert_called_with(
         prev_even_id, prev_event_start + timedelta(seconds=auto_closed_event_lenth_seconds)
     )
+
+
+def test_parallel_actions_latency_is_max_not_sum(action):
+    delay = 0.2
+    action.settings.parallel_actions = True
+    action.sheet_action = Mock(side_effect=lambda *args: time.sleep(delay))
+    action.calendar_action = Mock(side_effect=lambda *args: time.sleep(delay))
+    action.ifttt_action = Mock(side_effect=lambda *args: time.sleep(delay))
+
+    start = time.monotonic()
+    action.action("white")
+    elapsed = time.monotonic() - start
+
+    assert action.sheet_action.call_count == 1
+    assert action.calendar_action.call_count == 1
+    assert action.ifttt_action.call_count == 1
+    assert elapsed < 2 * delay
+
+
+def test_parallel_actions_error_isolation(action):
+    action.events["white"] = action.events["white"].model_copy(update={"parallel": True})
+    action.sheet_action = Mock(side_effect=ValueError("Google API is down"))
+    action.calendar_action = Mock()
+    action.ifttt_action = Mock()
+
+    action.action("white")
+
+    action.calendar_action.assert_called_once()
+    action.ifttt_action.assert_called_once()
+
+
+def test_button_parallel_overrides_settings(action):
+    action.settings.parallel_actions = True
+    action.events["white"] = action.events["white"].model_copy(update={"parallel": False})
+    action.sheet_action = Mock()
+    action.calendar_action = Mock()
+    action.ifttt_action = Mock()
+
+    with patch("action.get_executor") as mock_get_executor:
+        action.action("white")
+
+    mock_get_executor.assert_not_called()
+    action.sheet_action.assert_called_once()
+
+
+def test_plan_is_compiled_once(action):
+    action.compile_plans(["white"])
+    with patch.object(Action, "preprocess_actions") as mock_preprocess:
+        action.sheet_action = Mock()
+        action.calendar_action = Mock()
+        action.ifttt_action = Mock()
+        action.action("white")
+        action.action("white")
+    mock_preprocess.assert_not_called()
+    assert action.sheet_action.call_count == 2
+
+
+def test_plan_default_button(action):
+    plan = action.plan("unknown_button")
+    assert plan == tuple(action.preprocess_actions("unknown_button", action.events["__DEFAULT__"]))
+    assert action.plan("unknown_button") is plan
+
+
+PRESS_ALLOCATION_BUDGET = 8192  # bytes per whole press, deep copies of the plan alone took 15 KB
+
+
+class FakeBackend:
+    """Backend that only counts calls, Mock records every call and would exceed the budget."""
+
+    calls = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get_last_event(self, summary):
+        return None, None
+
+    def batch(self):
+        return nullcontext()
+
+    def press(self, *args, **kwargs):
+        FakeBackend.calls += 1
+
+    def start_event(self, summary, start_time=None):
+        FakeBackend.calls += 1
+
+
+@patch("google_sheet.Sheet", FakeBackend)
+@patch("google_calendar.Calendar", FakeBackend)
+@patch("ifttt.Ifttt", FakeBackend)
+def test_press_allocations_budget(action):
+    action.compile_plans(["white"])
+    press_time = datetime(2023, 9, 9, 19, 0, 0)
+    action.action("white", press_time=press_time)  # warm up
+    FakeBackend.calls = 0
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        action.action("white", press_time=press_time)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak - before < PRESS_ALLOCATION_BUDGET
+    assert FakeBackend.calls == 4  # ifttt press, calendar event, sheet press and event
+
+
+def test_press_plan_is_shared(action):
+    action.compile_plans(["white"])
+    actions = action.set_summary_by_time(list(action.plan("white")))
+    assert actions[2] is action.plan("white")[2]  # static summary, shared not copied
+
+
+def test_plan_actions_are_frozen(action):
+    with pytest.raises(ValidationError):
+        action.plan("white")[0].summary = "changed"
+
+
+@patch("google_calendar.Calendar")
+def test_calendar_action_batched(mock_calendar, settings):
+    settings.write_batch_window = 0.01
+    action = Action(settings)
+    calendar = mock_calendar.return_value
+    calendar.get_last_event.return_value = (None, None)
+    action_params = models.CalendarAction(
+        type="calendar",
+        calendar_id="calendar_id",
+        summary="test_summary",
+        autoclose=10800,
+        restart=15,
+        default=900,
+    )
+
+    press_time = datetime(2023, 9, 9, 11, 0, 0)
+    action.calendar_action("test_button", action_params, press_time)
+
+    calendar.batch.assert_called_once()
+    calendar.start_event.assert_called_once_with("test_summary", press_time)
+    assert action.batcher.batches == 1
+
+
+def test_backend_down_fails_fast(action):
+    action.settings.breaker_failures = 2
+    action.ifttt_action = Mock(side_effect=ConnectionError("IFTTT is down"))
+    action.sheet_action = Mock()
+    action.calendar_action = Mock()
+    action.outbox = Mock()
+    action.outbox.add.return_value = [1, 2, 3]
+
+    for _ in range(3):
+        action.action("white")
+
+    assert action.ifttt_action.call_count == 2  # not called after the circuit opened
+    assert action.sheet_action.call_count == 3  # other backends are not affected
+    assert action.outbox.failed.call_count == 3  # skipped action is retried later
+    assert action.breakers.stats()["ifttt"]["state"] == "open"
+
+
+def test_ifttt_outage_opens_breaker(action, requests_mock):
+    requests_mock.post(
+        "https://maker.ifttt.com/trigger/white_amazon_dash/with/key/sample_key",
+        status_code=503,
+    )
+    action.settings.breaker_failures = 2
+    action.sheet_action = Mock()
+    action.calendar_action = Mock()
+
+    with patch("ifttt.Ifttt.load_key", return_value={"key": "sample_key"}):
+        for _ in range(3):
+            action.action("white")
+
+    assert requests_mock.call_count == 2  # not called after the circuit opened
+    breaker = action.breakers.get("ifttt")
+    assert breaker.state == "open"
+    assert not breaker.latencies  # failed calls do not count in the adaptive timeout
+
+
+def test_settings_error_does_not_open_breaker(action):
+    action.settings.breaker_failures = 2
+    action.ifttt_action = Mock(side_effect=FileNotFoundError("ifttt-key.json"))
+    action.sheet_action = Mock()
+    action.calendar_action = Mock()
+
+    for _ in range(3):
+        action.action("white")
+
+    assert action.ifttt_action.call_count == 3
+    assert action.breakers.stats()["ifttt"]["state"] == "closed"
+
+
+def test_ifttt_http_latency_counts_in_timeout(action, requests_mock):
+    requests_mock.post(
+        "https://maker.ifttt.com/trigger/white_amazon_dash/with/key/sample_key",
+        text="ok",
+    )
+    action.sheet_action = Mock()
+    action.calendar_action = Mock()
+
+    with patch("ifttt.Ifttt.load_key", return_value={"key": "sample_key"}):
+        action.action("white")
+
+    assert len(action.breakers.get("ifttt").latencies) == 1  # one sample per HTTP call
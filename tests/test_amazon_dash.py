@@ -1,8 +1,13 @@
 import pytest
 import json
+import logging
 import os
 from datetime import datetime
+import subprocess
+import sys
+from dispatcher import Press
 from models import BOUNCE_DELAY
+from outbox import Outbox
 
 
 def test_button_file_name(dash):
@@ -53,17 +58,66 @@ def test_load_buttons_no_file(mocker, dash):
     ],
 )
 def test_trigger_debouncing(mocker, dash, settings, current_time, chatter_time, expected):
-    dash.debounce = {"button1": {"time": chatter_time}}
-    mock_action = mocker.patch("amazon_dash.Action")
+    dash.debounce = {"button1": chatter_time.timestamp()}
+    dash.dispatcher = mocker.Mock()
 
-    call_action = mock_action.return_value.action
     dash.settings = settings
     dash.trigger("button1", current_time)
 
     if expected:
-        call_action.assert_called_once()
+        dash.dispatcher.submit.assert_called_once_with("button1", current_time, None)
     else:
-        call_action.assert_not_called()
+        dash.dispatcher.submit.assert_not_called()
+
+
+def test_action(mocker, dash):
+    dash.actions = mocker.Mock()
+    press_time = datetime(2023, 9, 13, 12, 0, 0)
+    dash.action(Press("button1", press_time, 7))
+    dash.actions.action.assert_called_once_with("button1", press_time=press_time, press_id=7)
+
+
+def test_press_is_in_outbox_before_it_is_queued(mocker, dash, settings, tmp_path):
+    dash.settings = settings
+    dash.outbox = Outbox(str(tmp_path / "outbox.db"))
+    dash.dispatcher = mocker.Mock()
+    press_time = datetime(2023, 9, 13, 12, 0, 0)
+
+    dash.trigger("button1", press_time)
+
+    [(press_id, button, recorded_time)] = dash.outbox.presses()
+    assert (button, recorded_time) == ("button1", press_time.timestamp())
+    dash.dispatcher.submit.assert_called_once_with("button1", press_time, press_id)
+
+
+def test_dropped_press_is_removed_from_outbox(mocker, dash, settings, tmp_path):
+    dash.settings = settings
+    dash.outbox = Outbox(str(tmp_path / "outbox.db"))
+    dash.dispatcher = mocker.Mock()
+    dash.dispatcher.submit.return_value = False  # the queue is full
+
+    dash.trigger("button1", datetime(2023, 9, 13, 12, 0, 0))
+
+    assert dash.outbox.presses() == []
+
+
+def test_presses_left_by_crash_are_queued_on_start(mocker, dash, tmp_path):
+    file_name = str(tmp_path / "outbox.db")
+    press_time = datetime(2023, 9, 13, 12, 0, 0)
+    press_id = Outbox(file_name).add_press("button1", press_time.timestamp())  # crashed
+    dash.outbox = Outbox(file_name)
+    dash.dispatcher = mocker.Mock()
+
+    dash.submit_left_presses()
+
+    dash.dispatcher.submit.assert_called_once_with("button1", press_time, press_id)
+
+
+def test_compile_actions(dash, settings):
+    dash.settings = settings
+    dash.buttons = {"68:54:fd:27:aa:f1": "white", "34:d2:70:a4:e0:50": "unknown"}
+    actions = dash.compile_actions()
+    assert set(actions.plans) == {"white", "unknown"}
 
 
 class MockDateTime:
@@ -89,14 +143,223 @@ def test_arp_handler_known_mac(mocker, dash):
     mock_trigger = mocker.patch("amazon_dash.AmazonDash.trigger")
 
     dash.arp_handler(pkt)
-    mock_trigger.assert_called_once_with("TestButton", datetime.fromtimestamp(pkt.time))
+    mock_trigger.assert_called_once_with(
+        "TestButton", datetime.fromtimestamp(pkt.time), known_mac
+    )
 
 
-def test_run(mocker, dash):
+def test_run(mocker, dash, settings):
     # Mock necessary functions
     mocker.patch.object(dash, "load_buttons", return_value={})
-    mocker.patch.object(dash, "load_settings", return_value={})
-    mock_sniff = mocker.patch("amazon_dash.sniff")
+    mocker.patch.object(dash, "load_settings", return_value=settings)
+    mock_sniff = mocker.patch("scapy.sendrecv.sniff")
+    mock_dispatcher = mocker.patch("amazon_dash.Dispatcher")
+    mock_watcher = mocker.patch("amazon_dash.FileWatcher")
 
     dash.run()
     mock_sniff.assert_called_once()
+    assert mock_sniff.call_args.kwargs["opened_socket"] is dash.sniff_socket
+    mock_dispatcher.return_value.start.assert_called_once()
+    mock_watcher.return_value.start.assert_called_once()
+    assert mock_watcher.call_args.args[1] == dash.reload
+
+
+def test_capture_filter_learn(dash, settings):
+    dash.settings = settings
+    dash.buttons = {"68:54:fd:27:aa:f1": "Button1"}
+    assert dash.capture_filter() == "arp or (udp and port 67)"
+
+
+def test_capture_filter_buttons(dash, settings):
+    settings.sniff_mode = "buttons"
+    dash.settings = settings
+    dash.buttons = {"68:54:fd:27:aa:f1": "Button1", "34:d2:70:a4:e0:50": "Button2"}
+    assert dash.capture_filter() == (
+        "(arp or (udp and port 67)) and "
+        "(ether src 34:d2:70:a4:e0:50 or ether src 68:54:fd:27:aa:f1)"
+    )
+
+
+def test_unknown_mac_reports_rate_limit(mocker, dash, settings, caplog):
+    caplog.set_level(logging.INFO)
+    settings.unknown_mac_reports_per_minute = 2
+    dash.settings = settings
+    monotonic = mocker.patch("amazon_dash.time.monotonic", return_value=1000.0)
+    for idx in range(3):
+        pkt = mocker.MagicMock()
+        pkt.src = f"00:11:22:33:44:5{idx}"
+        pkt.haslayer.side_effect = lambda layer: layer is sys.modules["scapy.layers.l2"].ARP
+        pkt["ARP"].op = 1
+        dash.arp_handler(pkt)
+    dash.arp_handler(pkt)  # the same suppressed MAC again
+
+    assert set(dash.seen_macs.items) == {"00:11:22:33:44:50", "00:11:22:33:44:51"}
+    assert dash.suppressed_reports == 1
+
+    monotonic.return_value = 1061.0
+    dash.arp_handler(pkt)
+    assert "00:11:22:33:44:52" in dash.seen_macs
+    assert "Suppressed 1 unknown MAC reports" in caplog.text
+
+
+def test_run_raw_backend(mocker, dash, settings):
+    settings.sniff_backend = "raw"
+    mocker.patch.object(dash, "load_buttons", return_value={})
+    mocker.patch.object(dash, "load_settings", return_value=settings)
+    mocker.patch("amazon_dash.Dispatcher")
+    mocker.patch("amazon_dash.FileWatcher")
+    mock_sniff = mocker.patch("scapy.sendrecv.sniff")
+    mock_raw_capture = mocker.patch("amazon_dash.RawCapture")
+
+    dash.run()
+    mock_raw_capture.return_value.run.assert_called_once()
+    mock_sniff.assert_not_called()
+
+
+def test_import_does_not_load_backends():
+    code = (
+        "import sys; sys.path.insert(0, 'src'); import amazon_dash; "
+        "loaded = [m for m in ('scapy', 'googleapiclient', 'requests', 'google_sheet', "
+        "'google_calendar', 'ifttt', 'openhab') if m in sys.modules]; "
+        "assert not loaded, loaded"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_scapy_socket_decodes_ether():
+    """With the real scapy conf the socket decodes frames as Ether, not Raw.
+
+    scapy is mocked in tests, so check it in a clean interpreter.
+    """
+    code = (
+        "import sys; sys.path.insert(0, 'src')\n"
+        "from unittest.mock import Mock\n"
+        "import scapy.arch  # sets conf.L2listen\n"
+        "from scapy.config import conf\n"
+        "from amazon_dash import AmazonDash\n"
+        "from models import Settings\n"
+        "ARPHRD_ETHER = 1\n"
+        "# like L2Socket.__init__ picks its decode class\n"
+        "conf.L2listen = lambda **kwargs: Mock(LL=conf.l2types.num2layer.get(ARPHRD_ETHER))\n"
+        "dash = AmazonDash()\n"
+        "with open('tests/resources/settings.json', encoding='utf-8') as f:\n"
+        "    dash.settings = Settings.model_validate_json(f.read())\n"
+        "sock = dash.open_scapy_socket()\n"
+        "assert sock.LL is not None and sock.LL.__name__ == 'Ether', sock.LL\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if "No module named 'scapy" in result.stderr:
+        pytest.skip("scapy is not installed")
+    assert result.returncode == 0, result.stderr
+
+
+@pytest.fixture
+def running_dash(dash, settings, mocker):
+    settings.sniff_mode = "buttons"
+    dash.settings = settings
+    dash.buttons = {"68:54:fd:27:aa:f1": "white"}
+    dash.actions = dash.compile_actions()
+    dash.sniff_socket = mocker.Mock()
+    dash.sniff_filter = dash.capture_filter()
+    return dash
+
+
+def write_settings(folder, buttons=None, settings=None):
+    os.makedirs(os.path.join(folder, "amazon-dash-private"), exist_ok=True)
+    if buttons is not None:
+        with open(os.path.join(folder, "amazon-dash-private", "buttons.json"), "w") as f:
+            f.write(json.dumps(buttons))
+    if settings is not None:
+        with open(os.path.join(folder, "amazon-dash-private", "settings.json"), "w") as f:
+            f.write(settings)
+
+
+def test_reload_buttons(mocker, running_dash, tmp_path):
+    attach_filter = mocker.patch.object(sys.modules["scapy.arch.linux"], "attach_filter")
+    actions = running_dash.actions
+    running_dash.debounce = {"white": 1.0}
+    write_settings(tmp_path, buttons={"68:54:fd:27:aa:f1": "white", "34:d2:70:a4:e0:50": "violet"})
+
+    running_dash.reload([running_dash.button_file_name(str(tmp_path))], str(tmp_path))
+
+    assert running_dash.buttons["34:d2:70:a4:e0:50"] == "violet"
+    assert running_dash.actions is actions  # settings are the same, plans are kept
+    assert set(actions.plans) == {"white", "violet"}
+    assert running_dash.debounce == {"white": 1.0}
+    attach_filter.assert_called_once()
+    assert "ether src 34:d2:70:a4:e0:50" in running_dash.sniff_filter
+
+
+def test_reload_buttons_filter_error(mocker, running_dash, tmp_path, caplog):
+    from scapy.error import Scapy_Exception
+
+    mocker.patch.object(
+        sys.modules["scapy.arch.linux"],
+        "attach_filter",
+        side_effect=Scapy_Exception("tcpdump not available"),
+    )
+    old_filter = running_dash.sniff_filter
+    write_settings(tmp_path, buttons={"68:54:fd:27:aa:f1": "white", "34:d2:70:a4:e0:50": "violet"})
+
+    running_dash.reload([running_dash.button_file_name(str(tmp_path))], str(tmp_path))
+
+    assert running_dash.buttons["34:d2:70:a4:e0:50"] == "violet"
+    assert running_dash.sniff_filter == old_filter
+    assert "Cannot change capture filter" in caplog.text
+
+
+def test_reload_buttons_raw_backend(mocker, running_dash, tmp_path):
+    running_dash.sniff_socket = None
+    running_dash.raw_capture = mocker.Mock()
+    write_settings(tmp_path, buttons={"68:54:fd:27:aa:f1": "white", "34:d2:70:a4:e0:50": "violet"})
+
+    running_dash.reload([running_dash.button_file_name(str(tmp_path))], str(tmp_path))
+
+    running_dash.raw_capture.set_macs.assert_called_once_with(
+        ["34:d2:70:a4:e0:50", "68:54:fd:27:aa:f1"]
+    )
+    assert "ether src 34:d2:70:a4:e0:50" in running_dash.sniff_filter
+
+
+def test_reload_settings(running_dash, settings, tmp_path, caplog):
+    changed = settings.model_copy(update={"bounce_delay": 1, "press_workers": 7})
+    write_settings(tmp_path, settings=changed.model_dump_json())
+    actions = running_dash.actions
+
+    running_dash.reload([running_dash.setting_file_name(str(tmp_path))], str(tmp_path))
+
+    assert running_dash.settings.bounce_delay == 1
+    assert running_dash.actions is not actions
+    assert running_dash.actions.settings is running_dash.settings
+    assert "white" in running_dash.actions.plans
+    assert "Restart to apply changed settings: press_workers" in caplog.text
+
+
+def test_reload_settings_keeps_breakers(running_dash, settings, tmp_path):
+    breaker = running_dash.actions.breakers.get("ifttt")
+    breaker.failure()
+    changed = settings.model_copy(update={"breaker_failures": 1})
+    write_settings(tmp_path, settings=changed.model_dump_json())
+
+    running_dash.reload([running_dash.setting_file_name(str(tmp_path))], str(tmp_path))
+
+    assert running_dash.actions.breakers.get("ifttt") is breaker
+    assert breaker.failure_threshold == 1
+    assert running_dash.stats()["breakers"]["ifttt"]["failures"] == 1
+
+
+def test_reload_settings_applies_log_level(running_dash, settings, tmp_path, mocker):
+    set_level = mocker.patch.object(logging.getLogger(), "setLevel")
+    changed = settings.model_copy(update={"log_level": "DEBUG"})
+    write_settings(tmp_path, settings=changed.model_dump_json())
+
+    running_dash.reload([running_dash.setting_file_name(str(tmp_path))], str(tmp_path))
+
+    set_level.assert_called_once_with("DEBUG")
+
+
+def test_reload_invalid_settings_keeps_previous(running_dash, settings, tmp_path, caplog):
+    write_settings(tmp_path, settings="{not json")
+    running_dash.reload([running_dash.setting_file_name(str(tmp_path))], str(tmp_path))
+    assert running_dash.settings is settings
+    assert "Settings are not reloaded" in caplog.text
@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+import httpx
+
+import models
+from async_engine import AsyncEngine
+
+
+def test_submit_runs_handler_in_event_loop(settings):
+    buttons = []
+
+    async def handler(press, client):
+        await asyncio.sleep(0)
+        buttons.append(press.button)
+
+    engine = AsyncEngine(handler, settings)
+    engine.start()
+
+    assert engine.submit("white", datetime(2023, 9, 13, 12, 0, 0))
+    assert engine.submit("violet", datetime(2023, 9, 13, 12, 0, 1))
+    engine.stop()
+
+    assert sorted(buttons) == ["violet", "white"]
+    stats = engine.stats()
+    assert stats["submitted"] == 2
+    assert stats["processed"] == 2
+    assert stats["dropped"] == 0
+    assert stats["depth"] == 0
+
+
+def test_submit_drops_when_too_many_in_flight(settings, caplog):
+    settings.press_queue_size = 1
+    release = threading.Event()
+
+    async def handler(button, client):
+        await asyncio.to_thread(release.wait)
+
+    engine = AsyncEngine(handler, settings)
+    engine.start()
+    assert engine.submit("white", datetime.now())
+    assert not engine.submit("violet", datetime.now())
+
+    assert engine.stats()["dropped"] == 1
+    assert engine.stats()["max_depth"] == 1
+    assert "Too many presses in flight" in caplog.text
+
+    release.set()
+    engine.stop()
+    assert engine.stats()["processed"] == 1
+
+
+def test_handler_error_does_not_stop_engine(settings):
+    handler = AsyncMock(side_effect=[ValueError("backend is down"), None])
+    engine = AsyncEngine(handler, settings)
+    engine.start()
+
+    engine.submit("white", datetime.now())
+    engine.submit("violet", datetime.now())
+    engine.stop()
+
+    assert handler.call_count == 2
+    assert engine.stats()["failed"] == 1
+    assert engine.stats()["processed"] == 2
+
+
+def test_presses_share_client(settings):
+    clients = []
+
+    async def handler(button, client):
+        clients.append(client)
+
+    engine = AsyncEngine(handler, settings)
+    engine.start()
+    engine.submit("white", datetime.now())
+    engine.submit("violet", datetime.now())
+    engine.stop()
+
+    assert clients[0] is clients[1]
+    assert clients[0].is_closed
+
+
+def test_openhab_action_async(action):
+    requests = []
+
+    def backend(request):
+        requests.append(request)
+        if request.method == "GET":
+            return httpx.Response(200, text="ON")
+        return httpx.Response(200)
+
+    action_params = models.OpenhabAction(
+        type="openhab", path="http://openhab:8080", item="Light", command="ON;OFF"
+    )
+
+    async def press():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(backend)) as client:
+            await action.openhab_action_async("white", action_params, client)
+
+    asyncio.run(press())
+
+    assert [(request.method, str(request.url)) for request in requests] == [
+        ("GET", "http://openhab:8080/items/Light/state"),
+        ("POST", "http://openhab:8080/items/Light"),
+    ]
+    assert requests[1].content == b'"OFF"'
+
+
+@patch("google_calendar.Calendar")
+def test_calendar_action_async(mock_calendar, action):
+    calendar = MagicMock()
+    mock_calendar.return_value = calendar
+    prev_event_start = datetime(2023, 9, 9, 10, 0, 0)
+    calendar.get_last_event_async = AsyncMock(return_value=(1, ["test_summary", prev_event_start]))
+    action_params = models.CalendarAction(
+        type="calendar",
+        calendar_id="some_id",
+        restart=15,
+        autoclose=10800,
+        default=900,
+        summary="test_summary",
+    )
+
+    mocked_now = datetime(2023, 9, 9, 11, 0, 0)
+    client = Mock()
+    with patch("action.datetime") as mock_datetime:
+        mock_datetime.now = Mock(return_value=mocked_now)
+        asyncio.run(action.calendar_action_async("test_button", action_params, client))
+
+    calendar.get_last_event_async.assert_awaited_once_with(client, "test_summary")
+    calendar.close_event.assert_called_with(1, mocked_now)
+    calendar.batch_async.assert_called_once_with(client)
+
+
+def test_parallel_actions_async_latency_is_max_not_sum(action):
+    delay = 0.2
+    action.settings.parallel_actions = True
+
+    async def slow_action(*args):
+        await asyncio.sleep(delay)
+
+    action.sheet_action_async = AsyncMock(side_effect=slow_action)
+    action.calendar_action_async = AsyncMock(side_effect=slow_action)
+    action.ifttt_action_async = AsyncMock(side_effect=ValueError("IFTTT is down"))
+
+    start = time.monotonic()
+    asyncio.run(action.action_async("white", Mock()))
+    elapsed = time.monotonic() - start
+
+    action.sheet_action_async.assert_awaited_once()
+    action.calendar_action_async.assert_awaited_once()
+    action.ifttt_action_async.assert_awaited_once()
+    assert delay <= elapsed < 2 * delay
@@ -0,0 +1,183 @@
+from unittest.mock import Mock
+
+import httplib2
+import httpx
+import pytest
+from googleapiclient.errors import HttpError
+from requests.exceptions import ConnectionError, HTTPError, Timeout
+
+import models
+from circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    LATENCY_SAMPLES,
+    OPEN,
+    CircuitBreaker,
+    CircuitBreakers,
+    current_breaker,
+    endpoint,
+    is_outage,
+    timed_http,
+)
+from ifttt import IftttError
+from latency import latency
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_opens_after_failures_in_a_row():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=Clock())
+    breaker.failure()
+    breaker.failure()
+    breaker.success()  # resets the count
+    breaker.failure()
+    breaker.failure()
+    assert breaker.allow()
+
+    breaker.failure()
+
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_half_open_probe():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.failure()
+    clock.now = 29
+    assert not breaker.allow()
+
+    clock.now = 30
+    assert breaker.allow()  # the probe
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # only one probe at a time
+
+    breaker.failure()  # probe failed
+    assert breaker.state == OPEN
+    clock.now = 59
+    assert not breaker.allow()
+
+    clock.now = 60
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_zero_threshold_never_opens():
+    breaker = CircuitBreaker(failure_threshold=0, reset_timeout=30)
+    for _ in range(100):
+        breaker.failure()
+    assert breaker.allow()
+
+
+def test_timeout_from_p99_latency():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    assert breaker.timeout(min_timeout=1, max_timeout=5) == 5  # no latencies yet
+
+    for _ in range(99):
+        breaker.record(0.5)
+    breaker.record(3)  # the slowest 1%
+    assert breaker.p99() == 0.5
+    assert breaker.timeout(min_timeout=1, max_timeout=5) == 1.5
+
+    for _ in range(LATENCY_SAMPLES):
+        breaker.record(0.1)
+    assert breaker.timeout(min_timeout=1, max_timeout=5) == 1  # not shorter than min
+
+    for _ in range(LATENCY_SAMPLES):
+        breaker.record(10)
+    assert breaker.timeout(min_timeout=1, max_timeout=5) == 5  # not longer than max
+
+
+def test_half_open_probe_waits_for_max_timeout():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    for _ in range(LATENCY_SAMPLES):
+        breaker.record(0.1)
+    breaker.failure()
+    clock.now = 30
+    assert breaker.allow()
+
+    assert breaker.timeout(min_timeout=0.1, max_timeout=5) == 5
+
+    breaker.success()
+    assert breaker.timeout(min_timeout=0.1, max_timeout=5) == pytest.approx(0.3)
+
+
+def test_timed_http_records_latency_in_current_breaker():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    with timed_http("ifttt"):  # no current breaker
+        pass
+    token = current_breaker.set(breaker)
+    try:
+        with timed_http("ifttt"):
+            pass
+        with pytest.raises(HTTPError), timed_http("ifttt"):
+            raise HTTPError(response=Mock(status_code=503))
+        with pytest.raises(Timeout), timed_http("ifttt"):
+            raise Timeout()
+    finally:
+        current_breaker.reset(token)
+
+    assert len(breaker.latencies) == 2  # the answer and the timeout
+    assert latency.snapshot()[("http", "ifttt")]["count"] == 4
+
+
+def test_fixed_timeout_if_not_adaptive(settings):
+    settings.adaptive_timeout = False
+    breakers = CircuitBreakers(settings)
+    for _ in range(100):
+        breakers.get("ifttt").record(0.1)
+    assert breakers.timeout("ifttt") == settings.http_timeout
+
+
+@pytest.mark.parametrize(
+    "error, outage",
+    [
+        (ConnectionError("refused"), True),
+        (TimeoutError(), True),
+        (HttpError(Mock(status=503), b""), True),
+        (HttpError(Mock(status=429), b""), True),
+        (HttpError(Mock(status=404), b""), False),
+        (HTTPError(response=Mock(status_code=400)), False),
+        (Timeout(), True),
+        (httpx.ConnectError("refused"), True),
+        (httplib2.ServerNotFoundError(), True),
+        (TypeError('Missing required parameter "spreadsheetId"'), False),
+        (ValueError("No sheet"), False),
+        (KeyError("presses"), False),
+        (FileNotFoundError("ifttt-key.json"), False),
+    ],
+)
+def test_is_outage(error, outage):
+    assert is_outage(error) == outage
+
+
+def test_is_outage_of_wrapped_error():
+    try:
+        try:
+            raise ConnectionError("refused")
+        except ConnectionError as e:
+            raise IftttError("white", e) from None
+    except IftttError as e:
+        assert is_outage(e)
+
+
+def test_endpoint():
+    assert endpoint(models.IftttAction(type="ifttt", summary="s")) == "ifttt"
+    assert (
+        endpoint(
+            models.OpenhabAction(
+                type="openhab", path="http://openhab:8080/rest", item="Light", command="ON;OFF"
+            )
+        )
+        == "openhab openhab:8080"
+    )
@@ -0,0 +1,53 @@
+import threading
+from datetime import datetime
+from unittest.mock import Mock
+
+from dispatcher import Dispatcher
+
+
+def test_submit_runs_handler_in_worker():
+    handler = Mock()
+    dispatcher = Dispatcher(handler, queue_size=10, workers=2)
+    dispatcher.start()
+
+    assert dispatcher.submit("white", datetime(2023, 9, 13, 12, 0, 0))
+    assert dispatcher.submit("violet", datetime(2023, 9, 13, 12, 0, 1))
+    dispatcher.stop()
+
+    assert sorted(call.args[0].button for call in handler.call_args_list) == ["violet", "white"]
+    stats = dispatcher.stats()
+    assert stats["submitted"] == 2
+    assert stats["processed"] == 2
+    assert stats["dropped"] == 0
+    assert stats["depth"] == 0
+
+
+def test_submit_drops_when_queue_is_full(caplog):
+    release = threading.Event()
+    dispatcher = Dispatcher(lambda button: release.wait(), queue_size=1, workers=1)
+    # worker is not started so nothing is consumed from the queue
+    assert dispatcher.submit("white", datetime.now())
+    assert not dispatcher.submit("violet", datetime.now())
+
+    assert dispatcher.stats()["dropped"] == 1
+    assert dispatcher.stats()["max_depth"] == 1
+    assert "Press queue is full" in caplog.text
+
+    release.set()
+    dispatcher.start()
+    dispatcher.stop()
+    assert dispatcher.stats()["processed"] == 1
+
+
+def test_handler_error_does_not_stop_worker():
+    handler = Mock(side_effect=[ValueError("backend is down"), None])
+    dispatcher = Dispatcher(handler, queue_size=10, workers=1)
+    dispatcher.start()
+
+    dispatcher.submit("white", datetime.now())
+    dispatcher.submit("violet", datetime.now())
+    dispatcher.stop()
+
+    assert handler.call_count == 2
+    assert dispatcher.stats()["failed"] == 1
+    assert dispatcher.stats()["processed"] == 2
@@ -0,0 +1,45 @@
+from expiring_set import ExpiringSet
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_capacity_evicts_least_recent():
+    seen = ExpiringSet(capacity=2, ttl=60, clock=FakeClock())
+    seen.add("a")
+    seen.add("b")
+    seen.add("a")  # renew
+    seen.add("c")
+
+    assert "a" in seen
+    assert "b" not in seen
+    assert "c" in seen
+    assert seen.stats() == {"size": 2, "capacity": 2, "evictions": 1, "expirations": 0}
+
+
+def test_ttl_expires():
+    clock = FakeClock()
+    seen = ExpiringSet(capacity=10, ttl=60, clock=clock)
+    seen.add("a")
+    clock.now = 59
+    assert "a" in seen
+    clock.now = 60
+    assert "a" not in seen
+    assert len(seen) == 0
+    assert seen.stats()["expirations"] == 1
+
+
+def test_dash_stats(dash, settings):
+    dash.settings = settings
+    dash.learn("00:11:22:33:44:55", is_dhcp=True)
+    assert dash.stats() == {
+        "seen_macs": {"size": 0, "capacity": 1000, "evictions": 0, "expirations": 0},
+        "seen_dhcp": {"size": 1, "capacity": 1000, "evictions": 0, "expirations": 0},
+        "debounce": 0,
+        "breakers": {},
+    }
@@ -0,0 +1,40 @@
+import threading
+
+from file_watcher import FileWatcher, open_inotify
+
+
+def test_changed(tmp_path):
+    path = tmp_path / "settings.json"
+    path.write_text("{}")
+    watcher = FileWatcher([str(path)], lambda changed: None, interval=1)
+
+    assert watcher.changed() == []
+    path.write_text('{"bounce_delay": 1}')
+    assert watcher.changed() == [str(path)]
+    assert watcher.changed() == []
+    path.unlink()
+    assert watcher.changed() == [str(path)]
+
+
+def test_watch_thread_calls_back(tmp_path):
+    path = tmp_path / "buttons.json"
+    path.write_text("{}")
+    called = threading.Event()
+    watcher = FileWatcher([str(path)], lambda changed: called.set(), interval=0.05)
+    watcher.start()
+    try:
+        path.write_text('{"68:54:fd:27:aa:f1": "white"}')
+        assert called.wait(timeout=5)
+    finally:
+        watcher.stop()
+
+
+def test_inotify(tmp_path):
+    fd = open_inotify({str(tmp_path)})
+    if fd is not None:  # Linux
+        watcher = FileWatcher([str(tmp_path / "settings.json")], lambda changed: None, interval=5)
+        watcher.inotify_fd = fd
+        (tmp_path / "settings.json").write_text("{}")
+        watcher.wait()  # returns right after the write, not in 5 seconds
+        assert watcher.changed() == [str(tmp_path / "settings.json")]
+        watcher.stop()
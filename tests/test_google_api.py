@@ -1,7 +1,12 @@
+import threading
+
 import pytest
+from google.auth.credentials import AnonymousCredentials
 from googleapiclient.errors import UnknownApiNameOrVersion
 from unittest.mock import Mock, patch
 
+from google_api import GoogleApi, discovery_document
+
 
 def test_get_credentials_success(google_api_instance, google_credentials):
     # Assert that from_json_keyfile_name is called in __init__
@@ -28,7 +33,7 @@ def test_get_credentials_success(google_api_instance, google_credentials):
     )
 
 
-@patch("google_api.discovery.build")
+@patch("google_api.discovery.build_from_document")
 def test_get_service_with_http(mock_build, google_api_instance):
     mock_service = Mock()
     mock_build.return_value = mock_service
@@ -38,9 +43,11 @@ def test_get_service_with_http(mock_build, google_api_instance):
 
     service = google_api_instance.get_service("calendar", "v3")
 
-    mock_build.assert_called_once_with(
-        "calendar", "v3", credentials=google_api_instance.credentials
-    )
+    mock_build.assert_called_once()
+    assert mock_build.call_args.args == (discovery_document("calendar", "v3"),)
+    http = mock_build.call_args.kwargs["http"]
+    assert http.credentials is google_api_instance.credentials
+    assert http.http.timeout == google_api_instance.settings.http_timeout
     assert service == mock_service
 
 
@@ -54,3 +61,75 @@ def test_get_service_without_http(google_api_instance):
 def test_service_undefined(google_api_instance):
     with pytest.raises(UnknownApiNameOrVersion):
         google_api_instance.service
+
+
+@patch("google_api.discovery.build_from_document")
+def test_service_is_built_once_per_thread(mock_build, google_api_instance):
+    first = google_api_instance.get_service("calendar", "v3")
+    second = google_api_instance.get_service("calendar", "v3")
+    assert first is second
+    mock_build.assert_called_once()
+
+    services = []
+    thread = threading.Thread(
+        target=lambda: services.append(google_api_instance.get_service("calendar", "v3"))
+    )
+    thread.start()
+    thread.join()
+    assert mock_build.call_count == 2
+
+
+def test_credentials_are_loaded_once(settings, google_credentials):
+    GoogleApi(settings, "calendar", "v3")
+    GoogleApi(settings, "sheets", "v4")
+    google_credentials.assert_called_once()
+
+
+@patch("googleapiclient.discovery.build_http")
+def test_service_is_built_offline(mock_build_http, google_api_instance):
+    google_api_instance.credentials = AnonymousCredentials()
+    for api, version in [("sheets", "v4"), ("drive", "v3"), ("calendar", "v3")]:
+        assert google_api_instance.get_service(api, version) is not None
+    mock_build_http.assert_not_called()
+
+
+def test_execute_async_sends_request_with_httpx(google_api_instance):
+    import asyncio
+
+    import httpx
+    from googleapiclient.errors import HttpError
+    from googleapiclient.http import HttpRequest
+    from googleapiclient.model import JsonModel
+
+    google_api_instance.credentials = Mock(valid=True)
+    google_api_instance.credentials.apply.side_effect = lambda headers: headers.update(
+        authorization="Bearer token"
+    )
+    sent = []
+
+    def backend(request):
+        sent.append(request)
+        if request.url.path == "/missing":
+            return httpx.Response(404, json={"error": {"message": "not found"}})
+        return httpx.Response(200, json={"id": "event-id"})
+
+    def api_request(path):
+        return HttpRequest(
+            Mock(),
+            JsonModel().response,
+            f"https://www.googleapis.com{path}",
+            method="POST",
+            body='{"summary": "test"}',
+            headers={"content-type": "application/json"},
+        )
+
+    async def execute():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(backend)) as client:
+            result = await google_api_instance.execute_async(client, api_request("/events"))
+            with pytest.raises(HttpError):
+                await google_api_instance.execute_async(client, api_request("/missing"))
+        return result
+
+    assert asyncio.run(execute()) == {"id": "event-id"}
+    assert sent[0].headers["authorization"] == "Bearer token"
+    assert sent[0].content == b'{"summary": "test"}'
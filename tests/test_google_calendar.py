@@ -1,9 +1,12 @@
 import time
 
 import pytest
-from unittest.mock import patch, Mock
+from unittest.mock import ANY, patch, Mock
 import datetime
-from google_calendar import Calendar
+import httplib2
+from googleapiclient.errors import HttpError
+
+from google_calendar import Calendar, last_events
 from freezegun import freeze_time
 
 
@@ -17,13 +20,12 @@ def mock_get_credentials():
 
 @pytest.fixture
 def mock_discovery_build():
-    with patch("googleapiclient.discovery.build") as mock_build:
+    with patch("googleapiclient.discovery.build_from_document") as mock_build:
         yield mock_build
 
 
 @pytest.fixture
-def mock_calendar(mock_get_credentials, mock_discovery_build):
-    settings = {"test": "setting", "credentials_file_name": "test_credentials.json"}
+def mock_calendar(settings, mock_get_credentials, mock_discovery_build):
     calendar_id = "test_calendar_id"
     with patch("google_calendar.GoogleApi", return_value=Mock()):
         calendar = Calendar(settings, calendar_id)
@@ -69,13 +71,20 @@ def test_delete_event(mock_calendar):
 
 
 def test_close_event(mock_calendar):
-    mock_calendar.close_event("123", datetime.datetime.now())
-    assert mock_calendar.service.events().update.call_count == 1
+    close_time = datetime.datetime(2023, 9, 14, 10, 42, 1)
+    mock_calendar.close_event("123", close_time)
+    mock_calendar.service.events().patch.assert_called_once_with(
+        calendarId=mock_calendar.calendarId,
+        eventId="123",
+        body={"end": {"dateTime": mock_calendar.time_to_str(close_time)}},
+    )
+    mock_calendar.service.events().patch().execute.assert_called_once()
+    mock_calendar.service.events().get.assert_not_called()
+    mock_calendar.service.events().update.assert_not_called()
 
 
-def test_google_api_get_credentials(mock_get_credentials):
+def test_google_api_get_credentials(settings, mock_get_credentials):
     # This test checks if the get_credentials method was mocked correctly
-    settings = {"test": "setting", "credentials_file_name": "test_credentials.json"}
     calendar_id = "test_calendar_id"
     calendar = Calendar(settings, calendar_id)
     assert calendar.credentials is not None
@@ -110,3 +119,128 @@ def test_google_today(mock_calendar):
         mock_today.replace(hour=0, minute=0, second=0, microsecond=0)
     )
     assert result == expected_format
+
+
+def calendar_event(summary="Test Event", event_id="123", status="confirmed"):
+    return {
+        "start": {"dateTime": "2023-01-01T00:00:00Z"},
+        "end": {"dateTime": "2023-01-01T01:00:00Z"},
+        "summary": summary,
+        "id": event_id,
+        "status": status,
+    }
+
+
+def test_get_last_event_cached(mock_calendar):
+    last_events.set(mock_calendar.calendarId, "Test Event", "123")
+    mock_calendar.service.events().get.return_value.execute.return_value = calendar_event()
+
+    event_id, event = mock_calendar.get_last_event("Test Event")
+
+    assert event_id == "123"
+    assert event[0] == "Test Event"
+    mock_calendar.service.events().list.assert_not_called()
+
+
+def test_get_last_event_cached_is_cancelled(mock_calendar):
+    last_events.set(mock_calendar.calendarId, "Test Event", "123")
+    mock_calendar.service.events().get.return_value.execute.return_value = calendar_event(
+        status="cancelled"
+    )
+    mock_calendar.service.events().list.return_value.execute.return_value = {
+        "items": [calendar_event(event_id="456")]
+    }
+
+    event_id, _ = mock_calendar.get_last_event("Test Event")
+
+    assert event_id == "456"
+    assert last_events.get(mock_calendar.calendarId, "Test Event") == "456"
+
+
+def test_get_last_event_cached_is_deleted(mock_calendar):
+    last_events.set(mock_calendar.calendarId, "Test Event", "123")
+    mock_calendar.service.events().get.return_value.execute.side_effect = HttpError(
+        httplib2.Response({"status": 410}), b"Deleted"
+    )
+    mock_calendar.service.events().list.return_value.execute.return_value = {"items": []}
+
+    assert mock_calendar.get_last_event("Test Event") == (None, None)
+    assert last_events.get(mock_calendar.calendarId, "Test Event") is None
+
+
+def test_get_last_event_widens_search_window(mock_calendar):
+    mock_calendar.service.events().list.return_value.execute.side_effect = [
+        {"items": []},
+        {"items": [calendar_event(event_id="1")], "nextPageToken": "page2"},
+        {"items": [calendar_event(event_id="2")]},
+    ]
+
+    event_id, _ = mock_calendar.get_last_event("Test Event")
+
+    assert event_id == "2"
+    assert mock_calendar.service.events().list.return_value.execute.call_count == 3
+
+
+def test_start_event_remembers_event(mock_calendar):
+    mock_calendar.service.events().insert.return_value.execute.return_value = {"id": "789"}
+    mock_calendar.start_event("Test Event")
+    assert last_events.get(mock_calendar.calendarId, "Test Event") == "789"
+
+    mock_calendar.delete_event("789")
+    assert last_events.get(mock_calendar.calendarId, "Test Event") is None
+
+
+def test_batch(mock_calendar):
+    service = mock_calendar.service
+    service.events().get.return_value.execute.return_value = calendar_event(event_id="123")
+    last_events.set(mock_calendar.calendarId, "Test Event", "123")
+    http_batch = service.new_batch_http_request.return_value
+    http_batch.execute.side_effect = lambda: service.new_batch_http_request.call_args.kwargs[
+        "callback"
+    ]("0", {"id": "789"}, None)
+
+    with mock_calendar.batch():
+        mock_calendar.close_event("123", datetime.datetime(2023, 1, 1, 2, 0))
+        event_id, event = mock_calendar.get_last_event("Test Event")
+        assert event_id == "123"
+        assert event[2].hour == 2  # pending patch is applied
+
+        mock_calendar.start_event("Other Event")
+        event_id, event = mock_calendar.get_last_event("Other Event")
+        assert event_id == "pending-0"
+        mock_calendar.close_event(event_id, datetime.datetime(2023, 1, 1, 3, 0))
+
+        service.events().insert().execute.assert_not_called()
+        service.events().patch().execute.assert_not_called()
+
+    http_batch.execute.assert_called_once()
+    assert [call.kwargs["request_id"] for call in http_batch.add.call_args_list] == ["0", "1"]
+    service.events().patch.assert_called_with(
+        calendarId=mock_calendar.calendarId, eventId="123", body=ANY
+    )
+    inserted = service.events().insert.call_args.kwargs["body"]
+    assert inserted["summary"] == "Other Event"
+    assert inserted["end"]["dateTime"].startswith("2023-01-01T03:00:00")
+    assert last_events.get(mock_calendar.calendarId, "Other Event") == "789"
+
+
+def test_batch_raises_request_error(mock_calendar):
+    service = mock_calendar.service
+    error = HttpError(httplib2.Response({"status": 500}), b"Backend Error")
+    service.new_batch_http_request.return_value.execute.side_effect = (
+        lambda: service.new_batch_http_request.call_args.kwargs["callback"]("0", None, error)
+    )
+
+    with pytest.raises(HttpError), mock_calendar.batch():
+        mock_calendar.start_event("Test Event")
+
+
+def test_has_event_at(mock_calendar):
+    start = datetime.datetime(2023, 9, 14, 10, 42, 1).astimezone()
+    mock_calendar.get_last_event = Mock(return_value=("1", ["Test Event", start]))
+
+    assert mock_calendar.has_event_at("Test Event", datetime.datetime(2023, 9, 14, 10, 42, 1))
+    assert not mock_calendar.has_event_at("Test Event", datetime.datetime(2023, 9, 14, 10, 43))
+
+    mock_calendar.get_last_event = Mock(return_value=(None, None))
+    assert not mock_calendar.has_event_at("Test Event", datetime.datetime(2023, 9, 14, 10, 42, 1))
@@ -2,6 +2,7 @@ from datetime import datetime, timedelta
 
 import pytest
 from unittest.mock import Mock, patch, PropertyMock
+from freezegun import freeze_time
 from google_sheet import Sheet
 
 
@@ -15,13 +16,12 @@ def mock_get_credentials():
 
 @pytest.fixture
 def mock_discovery_build():
-    with patch("googleapiclient.discovery.build") as mock_build:
+    with patch("googleapiclient.discovery.build_from_document") as mock_build:
         yield mock_build
 
 
 @pytest.fixture
-def mock_sheet(mock_get_credentials, mock_discovery_build):
-    settings = {"test": "setting", "credentials_file_name": "test_credentials.json"}
+def mock_sheet(settings, mock_get_credentials, mock_discovery_build):
     sheet_name = "test_calendar_id"
     with (
         patch("google_calendar.GoogleApi", return_value=Mock()),
@@ -107,6 +107,7 @@ def test_get_last_event(mock_sheet):
     mock_serial_for_end_date = (datetime(2023, 1, 2, 12, 0) - datetime(1899, 12, 30)).days
     mock_rows = [["summary", mock_serial_for_start_date, mock_serial_for_end_date]]
     mock_sheet.get_rows = Mock(return_value=mock_rows)
+    mock_sheet.get_row_count = Mock(return_value=1000)
 
     # When
     row, event = mock_sheet.get_last_event("summary")
@@ -123,8 +124,9 @@ def test_get_last_event(mock_sheet):
 
 def test_get_last_event_not_found(mock_sheet):
     # Given
-    # Mocking find_last_row method to return None for both row and event
-    mock_sheet.find_last_row = Mock(return_value=(None, None))
+    # Empty event sheet
+    mock_sheet.get_rows = Mock(return_value=[])
+    mock_sheet.get_row_count = Mock(return_value=1000)
 
     # When
     row, event = mock_sheet.get_last_event("summary")
@@ -134,32 +136,104 @@ def test_get_last_event_not_found(mock_sheet):
     assert event is None
 
 
+def test_event_index_seeded_once(mock_sheet):
+    mock_sheet.get_rows = Mock(return_value=[["other", 1.0], ["summary", 2.0, 3.0]])
+    mock_sheet.get_row_count = Mock(return_value=1000)
+
+    assert mock_sheet.get_last_event("summary")[0] == 2
+    assert mock_sheet.get_last_event("other")[0] == 1
+    mock_sheet.get_rows.assert_called_once_with(sheet="event", row=1, rows=1000, cols=3)
+
+
+def test_event_index_reseeded_if_changed_outside(mock_sheet):
+    mock_sheet.get_rows = Mock(return_value=[["summary", 2.0, 3.0]])
+    mock_sheet.get_row_count = Mock(return_value=1000)
+    assert mock_sheet.get_last_event("summary")[0] == 1
+
+    mock_sheet.get_rows = Mock(return_value=[["other", 1.0], ["summary", 2.0, 3.0]])
+    mock_sheet.get_row_count = Mock(return_value=1001)
+    assert mock_sheet.get_last_event("summary")[0] == 2
+    mock_sheet.get_rows.assert_called_once()
+
+
+def test_event_index_follows_our_changes(mock_sheet):
+    mock_sheet.sheets = {"press": 1, "event": 2}
+    mock_sheet.get_rows = Mock(return_value=[["summary", 2.0], ["other", 1.0, 1.5]])
+    mock_sheet.get_row_count = Mock(return_value=1000)
+    assert mock_sheet.get_last_event("summary")[0] == 1
+
+    close_time = datetime(2023, 1, 2, 12, 0)
+    mock_sheet.close_event(1, close_time)
+    mock_sheet.press("summary")  # does not change event sheet
+    mock_sheet.start_event("new")
+    mock_sheet.get_row_count = Mock(return_value=1001)
+
+    assert mock_sheet.get_last_event("new")[0] == 1
+    row, event = mock_sheet.get_last_event("summary")
+    assert row == 2
+    assert event[2] == close_time
+    assert mock_sheet.get_last_event("other")[0] == 3
+    mock_sheet.get_rows.assert_called_once()
+
+
+def test_event_index_reset_on_write_error(mock_sheet):
+    mock_sheet.sheets = {"press": 1, "event": 2}
+    mock_sheet.get_rows = Mock(return_value=[["summary", 2.0]])
+    mock_sheet.get_row_count = Mock(return_value=1000)
+    mock_sheet.get_last_event("summary")
+
+    mock_sheet.service.spreadsheets().batchUpdate.return_value.execute.side_effect = ValueError
+    with pytest.raises(ValueError):
+        mock_sheet.start_event("summary")
+
+    mock_sheet.get_last_event("summary")
+    assert mock_sheet.get_rows.call_count == 2
+
+
+def test_get_row_count(mock_sheet):
+    mock_sheet.service.spreadsheets().get.return_value.execute.return_value = {
+        "sheets": [
+            {"properties": {"title": "press", "gridProperties": {"rowCount": 10}}},
+            {"properties": {"title": "event", "gridProperties": {"rowCount": 20}}},
+        ]
+    }
+    assert mock_sheet.get_row_count("event") == 20
+    with pytest.raises(ValueError):
+        mock_sheet.get_row_count("unknown")
+
+
+def batch_update_requests(mock_sheet):
+    """Requests sent with the last batchUpdate call."""
+    return mock_sheet.service.spreadsheets().batchUpdate.call_args.kwargs["body"]["requests"]
+
+
 def test_start_event(mock_sheet):
     # Given
     current_time = datetime(2023, 1, 1, 12, 0)
-    with patch("datetime.datetime") as mock_datetime:
-        mock_datetime.now.return_value = current_time
-        mock_sheet.insert_row = Mock()
-        mock_sheet.copy_row_formatting = Mock()
-        mock_sheet.update_cells = Mock()
-
+    mock_sheet.sheets = {"press": 1, "event": 2}
+    with freeze_time(current_time):
         # When
         mock_sheet.start_event("Test Event")
 
-        # Then
-        mock_sheet.insert_row.assert_called_once_with(sheet=mock_sheet.event_sheet)
-        mock_sheet.copy_row_formatting.assert_called_once_with(sheet=mock_sheet.event_sheet)
-        mock_sheet.update_cells.assert_called_once_with(
-            sheet=mock_sheet.event_sheet,
-            values=["Test Event", current_time.strftime("%d/%m/%Y %H:%M:%S")],
-        )
+    # Then
+    mock_sheet.service.spreadsheets().batchUpdate.return_value.execute.assert_called_once()
+    insert, copy_formatting, update = batch_update_requests(mock_sheet)
+    assert insert["insertDimension"]["range"]["sheetId"] == 2
+    assert copy_formatting["copyPaste"]["destination"]["sheetId"] == 2
+    assert update["updateCells"]["start"] == {"sheetId": 2, "rowIndex": 1, "columnIndex": 0}
+    assert update["updateCells"]["rows"] == [
+        {
+            "values": [
+                {"userEnteredValue": {"stringValue": "Test Event"}},
+                {"userEnteredValue": {"numberValue": mock_sheet.to_serial_time(current_time)}},
+            ]
+        }
+    ]
 
 
 def test_close_event(mock_sheet):
-    # Mock the update_cells method
-    mock_sheet.update_cells = Mock()
-
     # Given
+    mock_sheet.sheets = {"press": 1, "event": 2}
     close_time = datetime(2023, 1, 2, 12, 0)
     event_row = 1
 
@@ -167,33 +241,95 @@ def test_close_event(mock_sheet):
     mock_sheet.close_event(event_row, close_time)
 
     # Then
-    mock_sheet.update_cells.assert_called_once_with(
-        sheet=mock_sheet.event_sheet,
-        row=event_row,
-        col=2,
-        values=[close_time.strftime("%d/%m/%Y %H:%M:%S"), "=C2-B2"],
-    )
+    (update,) = batch_update_requests(mock_sheet)
+    assert update["updateCells"]["start"] == {"sheetId": 2, "rowIndex": 1, "columnIndex": 2}
+    assert update["updateCells"]["rows"][0]["values"] == [
+        {"userEnteredValue": {"numberValue": mock_sheet.to_serial_time(close_time)}},
+        {"userEnteredValue": {"formulaValue": "=C2-B2"}},
+    ]
 
 
 def test_press(mock_sheet):
     # Given
     current_time = datetime(2023, 1, 3, 12, 0)
-    with patch("datetime.datetime") as mock_datetime:
-        mock_datetime.now.return_value = current_time
-        mock_sheet.insert_row = Mock()
-        mock_sheet.copy_row_formatting = Mock()
-        mock_sheet.update_cells = Mock()
-
+    mock_sheet.sheets = {"press": 1, "event": 2}
+    with freeze_time(current_time):
         # When
         mock_sheet.press("Button Pressed")
 
-        # Then
-        mock_sheet.insert_row.assert_called_once_with(sheet=mock_sheet.press_sheet)
-        mock_sheet.copy_row_formatting.assert_called_once_with(sheet=mock_sheet.press_sheet)
-        mock_sheet.update_cells.assert_called_once_with(
-            sheet=mock_sheet.press_sheet,
-            values=["Button Pressed", current_time.strftime("%d/%m/%Y %H:%M:%S")],
-        )
+    # Then
+    mock_sheet.service.spreadsheets().batchUpdate.return_value.execute.assert_called_once()
+    requests = batch_update_requests(mock_sheet)
+    assert [list(request) for request in requests] == [
+        ["insertDimension"],
+        ["copyPaste"],
+        ["updateCells"],
+    ]
+    assert all(
+        request["updateCells"]["start"]["sheetId"] == 1
+        for request in requests
+        if "updateCells" in request
+    )
+
+
+def test_batch_press_and_event_in_one_request(mock_sheet):
+    mock_sheet.sheets = {"press": 1, "event": 2}
+    execute = mock_sheet.service.spreadsheets().batchUpdate.return_value.execute
+
+    with mock_sheet.batch():
+        mock_sheet.press("summary")
+        mock_sheet.close_event(1, datetime(2023, 1, 2, 12, 0))
+        mock_sheet.start_event("summary")
+        execute.assert_not_called()
+
+    execute.assert_called_once()
+    requests = batch_update_requests(mock_sheet)
+    assert len(requests) == 7
+    assert requests[3]["updateCells"]["start"]["rowIndex"] == 1  # close before insert
+
+
+def test_batch_flushes_before_reading_written_sheet(mock_sheet):
+    mock_sheet.sheets = {"press": 1, "event": 2}
+    execute = mock_sheet.service.spreadsheets().batchUpdate.return_value.execute
+    mock_sheet.service.spreadsheets().values().get().execute = Mock(return_value={})
+
+    with mock_sheet.batch():
+        mock_sheet.press("summary")
+        mock_sheet.get_rows("event")
+        execute.assert_not_called()
+        mock_sheet.get_rows("press")
+        execute.assert_called_once()
+    execute.assert_called_once()
+
+
+def test_batch_reads_pending_events_from_index(mock_sheet):
+    mock_sheet.sheets = {"press": 1, "event": 2}
+    mock_sheet.get_rows = Mock(return_value=[["summary", 2.0]])
+    mock_sheet.get_row_count = Mock(return_value=1000)
+    execute = mock_sheet.service.spreadsheets().batchUpdate.return_value.execute
+
+    with mock_sheet.batch():
+        mock_sheet.get_last_event("summary")
+        mock_sheet.start_event("new")
+        assert mock_sheet.get_last_event("new")[0] == 1
+        assert mock_sheet.get_last_event("summary")[0] == 2
+        execute.assert_not_called()
+    mock_sheet.get_row_count.assert_called_once()
+    execute.assert_called_once()
+
+
+def test_cell_data(mock_sheet):
+    assert mock_sheet.cell_data("text") == {"userEnteredValue": {"stringValue": "text"}}
+    assert mock_sheet.cell_data(1.5) == {"userEnteredValue": {"numberValue": 1.5}}
+    assert mock_sheet.cell_data("=A1") == {"userEnteredValue": {"formulaValue": "=A1"}}
+    assert mock_sheet.cell_data(datetime(1900, 1, 1, 12)) == {
+        "userEnteredValue": {"numberValue": 2.5}
+    }
+
+
+def test_serial_time_round_trip(mock_sheet):
+    time = datetime(2023, 9, 14, 10, 42, 1)
+    assert mock_sheet.from_serial_time(mock_sheet.to_serial_time(time)) == time
 
 
 def test_copy_row_formatting(mock_sheet):
@@ -275,3 +411,15 @@ def test_insert_row(mock_sheet):
     mock_sheet.insert_row("TestSheet", 1)
 
     assert mock_sheet.service.spreadsheets().batchUpdate.called
+
+
+def test_has_press(mock_sheet):
+    press_time = datetime(2023, 9, 9, 11, 0, 0)
+    serial = mock_sheet.to_serial_time(press_time)
+    mock_sheet.get_rows = Mock(
+        return_value=[["other", serial], ["test_summary", serial - 1], ["test_summary", serial]]
+    )
+
+    assert mock_sheet.has_press("test_summary", press_time)
+    assert not mock_sheet.has_press("test_summary", press_time + timedelta(seconds=5))
+    mock_sheet.get_rows.assert_called_with(sheet="press", row=1, rows=1000)
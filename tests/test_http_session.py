@@ -0,0 +1,23 @@
+from http_session import close_sessions, get_session
+
+
+def test_session_per_host(settings):
+    ifttt = get_session("https://maker.ifttt.com/trigger/a/with/key/k", settings)
+    assert get_session("https://maker.ifttt.com/trigger/b/with/key/k", settings) is ifttt
+    assert get_session("http://maker.ifttt.com/trigger/a", settings) is not ifttt
+    assert get_session("http://openhab:8080/rest/items/a", settings) is not ifttt
+
+
+def test_session_settings(settings):
+    settings.http_retries = 3
+    settings.http_pool_size = 7
+    adapter = get_session("http://openhab:8080/rest", settings).get_adapter("http://openhab:8080")
+    assert adapter.max_retries.connect == 3
+    assert adapter.max_retries.read == 0
+    assert adapter._pool_maxsize == 7
+
+
+def test_close_sessions(settings):
+    session = get_session("http://openhab:8080/rest", settings)
+    close_sessions()
+    assert get_session("http://openhab:8080/rest", settings) is not session
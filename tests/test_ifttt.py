@@ -1,6 +1,9 @@
 import json
 
-from ifttt import Ifttt
+import pytest
+
+import ifttt as ifttt_module
+from ifttt import Ifttt, IftttError
 from requests.exceptions import RequestException
 
 
@@ -12,10 +15,9 @@ def test_load_key(mocker, settings):
     assert ifttt.key == "sample_key"
 
 
-def test_press_success(mocker, requests_mock, capsys):
+def test_press_success(mocker, requests_mock, caplog, settings):
     mocker.patch.object(Ifttt, "load_key", return_value={"key": "sample_key"})
 
-    settings = {"ifttt_key_file_name": "sample_key_file_name"}
     ifttt = Ifttt(settings)
 
     url = "https://maker.ifttt.com/trigger/summary/with/key/sample_key"
@@ -32,38 +34,48 @@ def test_press_success(mocker, requests_mock, capsys):
     assert request_payload["value2"] == "value2"
     assert request_payload["value3"] == "value3"
 
-    captured = capsys.readouterr()
     assert (
-        "error" not in captured.out.lower()
+        "error" not in caplog.text.lower()
     )  # Assuming all error messages contain the word "error"
-    assert "fail" not in captured.out.lower()  # Assuming failure messages contain the word "fail"
+    assert "fail" not in caplog.text.lower()  # Assuming failure messages contain the word "fail"
 
 
-def test_press_failure_status_code(mocker, requests_mock, capsys):
+def test_press_failure_status_code(mocker, requests_mock, settings):
     mocker.patch.object(Ifttt, "load_key", return_value={"key": "sample_key"})
 
-    settings = {"ifttt_key_file_name": "sample_key_file_name"}
     ifttt = Ifttt(settings)
 
     url = "https://maker.ifttt.com/trigger/summary/with/key/sample_key"
     requests_mock.post(url, text="Bad Request", status_code=400)
 
-    ifttt.press("summary", "value1", "value2", "value3")
-    captured = capsys.readouterr()
-
-    assert "*" * 10 + " IFTTT error:\n" in captured.out
+    with pytest.raises(IftttError, match="IFTTT summary event failed: HTTP 400") as error:
+        ifttt.press("summary", "value1", "value2", "value3")
+    assert error.value.response.status_code == 400
 
 
-def test_press_request_exception(mocker, requests_mock, capsys):
+def test_press_request_exception(mocker, requests_mock, settings):
     mocker.patch.object(Ifttt, "load_key", return_value={"key": "sample_key"})
 
-    settings = {"ifttt_key_file_name": "sample_key_file_name"}
     ifttt = Ifttt(settings)
 
     url = "https://maker.ifttt.com/trigger/summary/with/key/sample_key"
     requests_mock.post(url, exc=RequestException)
 
+    with pytest.raises(IftttError, match="IFTTT summary event failed: RequestException") as error:
+        ifttt.press("summary", "value1", "value2", "value3")
+    assert error.value.response is None
+    assert error.value.__cause__ is None  # it has the URL with the key
+
+
+def test_press_reuses_session(mocker, requests_mock, settings):
+    mocker.patch.object(Ifttt, "load_key", return_value={"key": "sample_key"})
+    ifttt = Ifttt(settings)
+    requests_mock.post(
+        "https://maker.ifttt.com/trigger/summary/with/key/sample_key", text="OK", status_code=200
+    )
+    get_session = mocker.spy(ifttt_module, "get_session")
+
+    ifttt.press("summary", "value1", "value2", "value3")
     ifttt.press("summary", "value1", "value2", "value3")
-    captured = capsys.readouterr()
 
-    assert "*" * 10 + " IFTTT request fail:\n" in captured.out
+    assert get_session.spy_return_list[0] is get_session.spy_return_list[1]
@@ -0,0 +1,101 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+
+import pytest
+
+from dispatcher import Dispatcher
+from latency import SUB_BUCKETS, Histogram, LatencyRecorder, bucket_index, bucket_start, latency
+
+
+@pytest.mark.parametrize("value", [0, 1, 63, 64, 65, 127, 128, 1000, 123_456, 10**9])
+def test_bucket_contains_value(value):
+    index = bucket_index(value)
+    assert bucket_start(index) <= value < bucket_start(index + 1)
+    assert bucket_start(index + 1) - bucket_start(index) <= max(1, value / SUB_BUCKETS)
+
+
+def test_percentiles_precision():
+    histogram = Histogram()
+    values = [random.uniform(0.001, 2) for _ in range(10_000)]
+    for value in values:
+        histogram.record(value)
+    values.sort()
+
+    for percent in (50, 90, 99):
+        exact = values[round(len(values) * percent / 100) - 1]
+        assert exact <= histogram.percentile(percent) <= exact * (1 + 1 / SUB_BUCKETS) + 1e-6
+    assert histogram.count == 10_000
+    assert histogram.max / 1_000_000 == pytest.approx(values[-1], abs=1e-6)
+    assert histogram.mean() == pytest.approx(sum(values) / len(values), rel=1e-3)
+
+
+def test_empty_histogram():
+    assert Histogram().percentile(99) == 0
+    assert Histogram().mean() == 0
+
+
+def test_recorder_timed_and_report():
+    recorder = LatencyRecorder()
+    with pytest.raises(ValueError):
+        with recorder.timed("http", "sheets"):
+            raise ValueError("recorded anyway")
+    recorder.record("press", "white", 0.25)
+
+    snapshot = recorder.snapshot()
+    assert snapshot[("http", "sheets")]["count"] == 1
+    assert snapshot[("press", "white")]["p99"] == pytest.approx(0.25, rel=1 / SUB_BUCKETS)
+    report = recorder.report().splitlines()
+    assert report[0].split() == [
+        "stage", "button", "/", "backend", "count", "mean", "p50", "p90", "p99", "max"
+    ]
+    assert report[2].split()[:3] == ["press", "white", "1"]
+
+
+def test_press_stages(dash, settings):
+    dash.settings = settings
+    dash.dispatcher = Dispatcher(Mock(), queue_size=10, workers=1)
+    dash.dispatcher.start()
+
+    dash.trigger("white", datetime.now() - timedelta(seconds=0.1))
+    dash.dispatcher.stop()
+
+    snapshot = latency.snapshot()
+    assert snapshot[("capture", "white")]["p50"] >= 0.1
+    assert snapshot[("debounce", "white")]["count"] == 1
+    assert snapshot[("queue", "white")]["count"] == 1
+    assert snapshot[("press", "white")]["p50"] >= 0.1
+
+
+def test_action_stages(action):
+    action.sheet_action = Mock()
+    action.calendar_action = Mock()
+    action.ifttt_action = Mock(side_effect=lambda *args: time.sleep(0.01))
+
+    action.action("white")
+    action.action("white")
+
+    snapshot = latency.snapshot()
+    assert snapshot[("preprocess_actions", "white")]["count"] == 1  # the plan is compiled once
+    assert snapshot[("set_summary_by_time", "white")]["count"] == 2
+    assert snapshot[("action", "ifttt")]["p50"] >= 0.01
+
+
+def test_log_latency_on_signal(dash, caplog):
+    caplog.set_level(logging.INFO)
+    latency.record("press", "white", 0.1)
+    dash.request_latency(0, None)
+    assert "Press path latencies" not in caplog.text  # not logged from the signal handler
+    assert dash.latency_requested.is_set()
+
+    threading.Thread(target=dash.report_latency, daemon=True).start()
+    for _ in range(100):
+        if "Press path latencies" in caplog.text:
+            break
+        time.sleep(0.01)
+    out = caplog.text
+    assert "Press path latencies" in out
+    assert "press" in out and "white" in out
@@ -0,0 +1,96 @@
+import io
+import json
+import logging
+import queue
+
+import pytest
+
+from log import DroppingQueueHandler, JsonFormatter, LogWriter
+from metrics import counters
+
+logger = logging.getLogger("test_log")
+
+
+@pytest.fixture
+def root_level():
+    root = logging.getLogger()
+    level = root.level
+    yield root
+    root.setLevel(level)
+
+
+def test_json_formatter_adds_extra_fields():
+    record = logger.makeRecord(
+        "test_log",
+        logging.INFO,
+        __file__,
+        1,
+        'button "%s" pressed',
+        ("white",),
+        None,
+        extra={"button": "white", "mac": "68:54:fd:27:aa:f1", "duration": 0.25},
+    )
+
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "test_log"
+    assert entry["message"] == 'button "white" pressed'
+    assert entry["button"] == "white"
+    assert entry["mac"] == "68:54:fd:27:aa:f1"
+    assert entry["duration"] == 0.25
+    assert "exception" not in entry
+
+
+def test_writer_writes_json_lines(root_level):
+    root_level.setLevel(logging.INFO)
+    stream = io.StringIO()
+    writer = LogWriter(stream=stream)
+    writer.start()
+    try:
+        logger.info("ifttt action done", extra={"button": "white", "action": "ifttt"})
+        try:
+            raise ValueError("backend is down")
+        except ValueError:
+            logger.exception("Event handling error")
+    finally:
+        writer.stop()
+
+    done, error = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert done["message"] == "ifttt action done"
+    assert done["action"] == "ifttt"
+    assert error["level"] == "ERROR"
+    assert "ValueError: backend is down" in error["exception"]
+
+
+def test_writer_text_format(root_level):
+    root_level.setLevel(logging.INFO)
+    stream = io.StringIO()
+    writer = LogWriter("text", stream=stream)
+    writer.start()
+    logger.info('button "%s" pressed', "white")
+    writer.stop()
+
+    assert stream.getvalue().rstrip().endswith('INFO test_log: button "white" pressed')
+
+
+def test_debug_is_not_formatted_below_level(root_level):
+    root_level.setLevel(logging.INFO)
+
+    class Dump:
+        def __repr__(self):
+            raise AssertionError("formatted")
+
+    logger.debug("Actions: %r", Dump())
+
+
+def test_full_queue_drops_records():
+    handler = DroppingQueueHandler(queue.Queue(1))
+    record = logger.makeRecord("test_log", logging.INFO, __file__, 1, "press", None, None)
+
+    handler.handle(record)
+    handler.handle(record)
+
+    assert handler.queue.qsize() == 1
+    assert counters.totals()[("log_dropped",)] == 1
+
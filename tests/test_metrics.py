@@ -0,0 +1,96 @@
+import threading
+import urllib.error
+import urllib.request
+from datetime import datetime
+from unittest.mock import Mock
+
+import pytest
+from googleapiclient.errors import HttpError
+
+from dispatcher import Dispatcher
+from latency import latency
+from metrics import MetricsServer, ThreadCounters, collect, counters, escape
+
+
+def test_thread_counters():
+    thread_counters = ThreadCounters()
+
+    def work():
+        for _ in range(1000):
+            thread_counters.inc("presses")
+        thread_counters.inc(("presses", "white"), 5)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert thread_counters.totals() == {"presses": 4000, ("presses", "white"): 20}
+
+
+def test_escape():
+    assert escape('a"b\\c\nd') == 'a\\"b\\\\c\\nd'
+
+
+def test_collect(dash, settings):
+    dash.settings = settings
+    dash.actions = dash.compile_actions()
+    dash.dispatcher = Dispatcher(Mock(), queue_size=10, workers=1)
+    dash.frames = 3
+    dash.learn("00:11:22:33:44:55", is_dhcp=False)
+    dash.trigger("white", datetime(2023, 9, 13, 12, 0, 0))
+    dash.trigger("white", datetime(2023, 9, 13, 12, 0, 1))  # bounced
+    latency.record("action", "sheet", 0.5)
+    counters.inc(("google_requests", "sheets"), 2)
+
+    text = collect(dash)
+
+    assert "amazon_dash_frames_total 3\n" in text
+    assert "amazon_dash_unknown_frames_total 1\n" in text
+    assert 'amazon_dash_unknown_macs{request="arp"} 1\n' in text
+    assert 'amazon_dash_presses_total{button="white"} 1\n' in text
+    assert 'amazon_dash_bounced_presses_total{button="white"} 1\n' in text
+    assert "amazon_dash_queue_depth 1\n" in text
+    assert 'amazon_dash_google_requests_total{api="sheets"} 2\n' in text
+    assert "# TYPE amazon_dash_latency_seconds summary" in text
+    assert 'amazon_dash_latency_seconds_count{stage="action",label="sheet"} 1\n' in text
+    assert 'amazon_dash_latency_seconds{stage="action",label="sheet",quantile="0.99"}' in text
+
+
+def test_action_errors_counted(action):
+    action.sheet_action = Mock(side_effect=ConnectionError("Google is down"))
+    action.calendar_action = Mock()
+    action.ifttt_action = Mock()
+
+    action.action("white")
+
+    assert counters.totals() == {("action_errors", "sheet"): 1}
+
+
+def test_google_quota_counted(google_api_instance):
+    request = Mock()
+    request.execute.side_effect = HttpError(Mock(status=429), b"quota")
+
+    with pytest.raises(HttpError):
+        google_api_instance.execute(request)
+
+    assert counters.totals() == {
+        ("google_requests", "mock-api"): 1,
+        ("google_quota_exceeded", "mock-api"): 1,
+    }
+
+
+def test_metrics_server(dash, settings):
+    dash.settings = settings
+    server = MetricsServer("127.0.0.1", 0, lambda: collect(dash))
+    server.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            assert response.headers["content-type"].startswith("text/plain")
+            assert b"amazon_dash_frames_total 0" in response.read()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/")
+    finally:
+        server.stop()
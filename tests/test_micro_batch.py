@@ -0,0 +1,121 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from unittest.mock import Mock
+
+import pytest
+
+from micro_batch import MicroBatcher
+
+
+class Backend:
+    def __init__(self):
+        self.writes = []
+        self.flushed = []
+
+    @contextmanager
+    def batch(self):
+        yield self
+        self.flushed.append(list(self.writes))
+
+
+def run_in_threads(batcher, key, open_backend, works):
+    errors = []
+
+    def run(work):
+        try:
+            batcher.run(key, open_backend, work)
+        except Exception as e:
+            errors.append(e)
+
+    threads = []
+    for work in works:
+        thread = threading.Thread(target=run, args=(work,))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def test_presses_in_window_are_flushed_together():
+    backend = Backend()
+    open_backend = Mock(return_value=backend)
+    batcher = MicroBatcher(window=0.2)
+
+    errors = run_in_threads(
+        batcher,
+        "sheet",
+        open_backend,
+        [lambda b, idx=idx: b.writes.append(idx) for idx in range(3)],
+    )
+
+    assert errors == []
+    open_backend.assert_called_once()
+    assert [sorted(writes) for writes in backend.flushed] == [[0, 1, 2]]
+    assert (batcher.batches, batcher.works) == (1, 3)
+
+
+def test_error_of_one_press_does_not_fail_others():
+    backend = Backend()
+    batcher = MicroBatcher(window=0.2)
+
+    def fail(_):
+        raise ValueError("wrong summary")
+
+    errors = run_in_threads(
+        batcher, "sheet", lambda: backend, [lambda b: b.writes.append(1), fail]
+    )
+
+    assert [str(e) for e in errors] == ["wrong summary"]
+    assert backend.flushed == [[1]]
+
+
+def test_flush_error_fails_all_presses():
+    class FailingBackend(Backend):
+        @contextmanager
+        def batch(self):
+            yield self
+            raise ConnectionError("network is unreachable")
+
+    batcher = MicroBatcher(window=0)
+    with pytest.raises(ConnectionError):
+        batcher.run("calendar", FailingBackend, lambda b: None)
+
+
+def test_flushes_of_one_backend_do_not_overlap():
+    events = []
+
+    class SlowBackend(Backend):
+        @contextmanager
+        def batch(self):
+            events.append("start")
+            yield self
+            time.sleep(0.2)
+            events.append("end")
+
+    batcher = MicroBatcher(window=0.05)
+    first = threading.Thread(
+        target=batcher.run, args=("sheet", SlowBackend, lambda b: events.append(1))
+    )
+    first.start()
+    time.sleep(0.1)  # the first press is flushing
+    batcher.run("sheet", SlowBackend, lambda b: events.append(2))
+    first.join()
+
+    assert events == ["start", 1, "end", "start", 2, "end"]
+
+
+def test_flush_runs_in_timer_thread_with_press_context():
+    press = contextvars.ContextVar("press")
+    press.set("white")
+    seen = []
+
+    MicroBatcher(window=0).run(
+        "sheet", Backend, lambda b: seen.append((threading.current_thread(), press.get()))
+    )
+
+    [(thread, value)] = seen
+    assert thread is not threading.current_thread()  # the press worker does not sleep
+    assert value == "white"
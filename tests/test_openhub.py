@@ -1,5 +1,6 @@
 # test_openhab.py
 import pytest
+import requests
 
 import models
 from openhab import OpenHab
@@ -7,11 +8,14 @@ from unittest.mock import Mock, patch
 
 
 @pytest.fixture
-def openhab_settings():
-    return {
-        # sample settings for the OpenHab instance, adjust as required
-        "sample_key": "sample_value"
-    }
+def openhab_settings(settings):
+    return settings
+
+
+@pytest.fixture
+def session():
+    with patch("openhab.get_session") as mock_get_session:
+        yield mock_get_session.return_value
 
 
 @pytest.fixture
@@ -21,29 +25,25 @@ def action_params():
     )
 
 
-@patch("openhab.requests.get")
-def test_openhab_press_wrong_commands(mock_get, openhab_settings, action_params, capsys):
+def test_openhab_press_wrong_commands(session, openhab_settings, action_params, caplog):
     openhab = OpenHab(openhab_settings)
-    action_params.command = "ON"
+    action_params = action_params.model_copy(update={"command": "ON"})
 
-    # Mock the requests.get response (though it won't be used in this specific test)
-    mock_get.return_value = Mock(text="ON")
+    # Mock the session.get response (though it won't be used in this specific test)
+    session.get.return_value = Mock(text="ON")
 
     openhab.press(action_params)
 
-    captured = capsys.readouterr()
-    assert 'Wrong "command" setting in openhab action' in captured.out
+    assert 'Wrong "command" setting in openhab action' in caplog.text
 
 
-@patch("openhab.requests.get")
-@patch("openhab.requests.post")
-def test_openhab_press_switch_state(mock_post, mock_get, openhab_settings, action_params):
+def test_openhab_press_switch_state(session, openhab_settings, action_params):
     openhab = OpenHab(openhab_settings)
-    mock_get.return_value = Mock(text="ON")
+    session.get.return_value = Mock(text="ON")
 
     openhab.press(action_params)
 
-    mock_post.assert_called_once_with(
+    session.post.assert_called_once_with(
         f"{action_params.path}/items/{action_params.item}",
         data='"OFF"',
         headers={"content-type": "application/json"},
@@ -51,14 +51,23 @@ def test_openhab_press_switch_state(mock_post, mock_get, openhab_settings, actio
     )
 
 
-@patch("openhab.requests.get")
-@patch("openhab.requests.post")
-def test_openhab_press_invalid_state(mock_post, mock_get, openhab_settings, action_params, capsys):
+def test_openhab_press_invalid_state(session, openhab_settings, action_params, caplog):
     openhab = OpenHab(openhab_settings)
-    mock_get.return_value = Mock(text="INVALID_STATE")
+    session.get.return_value = Mock(text="INVALID_STATE")
 
     openhab.press(action_params)
 
-    captured = capsys.readouterr()
-    assert f"Item {action_params.item} now in state INVALID_STATE" in captured.out
-    mock_post.assert_not_called()
+    assert f"Item {action_params.item} now in state INVALID_STATE" in caplog.text
+    session.post.assert_not_called()
+
+
+def test_openhab_press_server_error(session, openhab_settings, action_params):
+    openhab = OpenHab(openhab_settings)
+    state = Mock(text="Internal Server Error")
+    state.raise_for_status.side_effect = requests.HTTPError("500 Server Error")
+    session.get.return_value = state
+
+    with pytest.raises(requests.HTTPError):
+        openhab.press(action_params)
+
+    session.post.assert_not_called()
@@ -0,0 +1,156 @@
+from datetime import datetime
+from unittest.mock import Mock, patch
+
+import pytest
+import requests
+
+import models
+from action import Action
+from outbox import Outbox, OutboxRetrier
+
+IFTTT_ACTION = models.IftttAction(type="ifttt", summary="white_amazon_dash")
+
+
+def test_failed_action_is_retried_with_backoff(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"), retry_delay=5, max_retry_delay=12)
+    (entry_id,) = outbox.add("white", [IFTTT_ACTION])
+    assert outbox.stats() == {"pending": 1, "retry": 0, "failed": 0}
+
+    with patch("outbox.time.time", return_value=1000.0):
+        outbox.failed(entry_id, "timeout")
+    assert outbox.due(now=1004.9) == []
+    (entry,) = outbox.due(now=1005.0)
+    assert entry.action == IFTTT_ACTION
+    assert entry.button == "white"
+    assert entry.attempts == 1
+    assert outbox.due(now=1005.0) == []  # taken, pending now
+
+    with patch("outbox.time.time", return_value=2000.0):
+        outbox.failed(entry_id, "timeout")
+    assert outbox.due(now=2009.9) == []
+    assert len(outbox.due(now=2010.0)) == 1
+
+    with patch("outbox.time.time", return_value=3000.0):
+        outbox.failed(entry_id, "timeout")
+    assert len(outbox.due(now=3012.0)) == 1  # max_retry_delay
+
+    outbox.done(entry_id)
+    assert outbox.stats() == {"pending": 0, "retry": 0, "failed": 0}
+
+
+def test_max_attempts(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"), max_attempts=1)
+    (entry_id,) = outbox.add("white", [IFTTT_ACTION])
+    outbox.failed(entry_id, "timeout")
+    assert outbox.stats() == {"pending": 0, "retry": 0, "failed": 1}
+
+
+def test_pending_actions_are_retried_after_restart(tmp_path):
+    file_name = str(tmp_path / "outbox.db")
+    Outbox(file_name).add("white", [IFTTT_ACTION])  # crashed before the action finished
+
+    outbox = Outbox(file_name)
+    (entry,) = outbox.due()
+    assert entry.action == IFTTT_ACTION
+
+
+def test_action_records_outbox(tmp_path, settings):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    action = Action(settings, outbox)
+    action.ifttt_action = Mock()
+    action.sheet_action = Mock(side_effect=Exception("network is unreachable"))
+    action.calendar_action = Mock()
+
+    action.action("white")
+
+    assert outbox.stats() == {"pending": 0, "retry": 1, "failed": 0}
+    (entry,) = outbox.due(now=float("inf"))
+    assert entry.action.type == "sheet"
+    assert isinstance(entry.action.summary, str)  # resolved for the press time
+
+
+def test_press_is_replaced_with_its_actions(tmp_path, settings):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    action = Action(settings, outbox)
+    action.ifttt_action = Mock()
+    action.sheet_action = Mock(side_effect=Exception("network is unreachable"))
+    action.calendar_action = Mock()
+    press_time = datetime(2023, 9, 13, 12, 0, 0)
+    press_id = outbox.add_press("white", press_time.timestamp())
+
+    action.action("white", press_time=press_time, press_id=press_id)
+
+    assert outbox.presses() == []
+    (entry,) = outbox.due(now=float("inf"))
+    assert entry.created == press_time.timestamp()
+
+
+def test_ifttt_down_action_is_kept_for_retry(tmp_path, settings, requests_mock):
+    requests_mock.post(
+        "https://maker.ifttt.com/trigger/white_amazon_dash/with/key/sample_key",
+        exc=requests.ConnectionError,
+    )
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    action = Action(settings, outbox)
+    action.sheet_action = Mock()
+    action.calendar_action = Mock()
+
+    with patch("ifttt.Ifttt.load_key", return_value={"key": "sample_key"}):
+        action.action("white")
+
+    assert outbox.stats() == {"pending": 0, "retry": 1, "failed": 0}
+    (entry,) = outbox.due(now=float("inf"))
+    assert entry.action.type == "ifttt"
+
+
+def test_retrier(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    first, second = outbox.add("white", [IFTTT_ACTION, IFTTT_ACTION], press_time=1000.0)
+    outbox.failed(first, "timeout")
+    outbox.failed(second, "timeout")
+    replay = Mock(side_effect=[None, Exception("still down")])
+
+    with patch("outbox.time.time", return_value=4102444800.0):  # 2100-01-01, all retries are due
+        OutboxRetrier(outbox, replay).retry_due()
+
+    replay.assert_called_with("white", IFTTT_ACTION, 1000.0)  # with the press time
+    assert outbox.stats() == {"pending": 0, "retry": 1, "failed": 0}
+
+
+SHEET_ACTION = models.SheetAction(
+    type="sheet",
+    name="amazon_dash",
+    press_sheet="press",
+    event_sheet="event",
+    summary="white_amazon_dash",
+    restart=15,
+    autoclose=10800,
+    default=900,
+)
+
+
+@pytest.mark.parametrize("registered", [True, False])
+def test_replay_skips_registered_press(settings, registered):
+    action = Action(settings)
+    sheet = Mock()
+    sheet.has_press.return_value = registered  # the batchUpdate was applied but its answer lost
+    action.open_sheet = Mock(return_value=sheet)
+    action.sheet_action = Mock()
+    press_time = datetime(2023, 9, 13, 12, 0, 0)
+
+    action.replay("white", SHEET_ACTION, press_time)
+
+    sheet.has_press.assert_called_once_with("white_amazon_dash", press_time)
+    assert action.sheet_action.called is not registered
+    if not registered:
+        action.sheet_action.assert_called_once_with("white", SHEET_ACTION, press_time)
+
+
+def test_replay_sends_ifttt_again(settings):
+    action = Action(settings)
+    action.ifttt_action = Mock()
+    press_time = datetime(2023, 9, 13, 12, 0, 0)
+
+    action.replay("white", IFTTT_ACTION, press_time)
+
+    action.ifttt_action.assert_called_once_with("white", IFTTT_ACTION, press_time)
@@ -0,0 +1,129 @@
+import socket
+import struct
+from datetime import datetime
+from unittest.mock import Mock, patch
+
+import pytest
+
+from raw_capture import RawCapture, attach_filter, filter_program, parse_frame
+
+SRC_MAC = bytes.fromhex("6854fd27aaf1")
+BROADCAST = b"\xff" * 6
+
+
+def ethernet(ethertype, payload, vlan=False):
+    header = BROADCAST + SRC_MAC
+    if vlan:
+        header += struct.pack("!HH", 0x8100, 42)
+    return memoryview(header + struct.pack("!H", ethertype) + payload)
+
+
+def arp(operation):
+    return struct.pack("!HHBBH", 1, 0x0800, 6, 4, operation) + SRC_MAC + bytes(4 + 6 + 4)
+
+
+def udp(src_port, dst_port, ip_options=b""):
+    ihl = 5 + len(ip_options) // 4
+    ip_header = bytes([0x40 | ihl, 0]) + bytes(7) + bytes([17]) + bytes(10) + ip_options
+    return ip_header + struct.pack("!HHHH", src_port, dst_port, 8 + 240, 0) + bytes(240)
+
+
+@pytest.mark.parametrize(
+    "frame, expected",
+    [
+        (ethernet(0x0806, arp(1)), ("68:54:fd:27:aa:f1", False)),
+        (ethernet(0x0806, arp(1), vlan=True), ("68:54:fd:27:aa:f1", False)),
+        (ethernet(0x0806, arp(2)), None),  # ARP reply
+        (ethernet(0x0800, udp(68, 67)), ("68:54:fd:27:aa:f1", True)),
+        (ethernet(0x0800, udp(68, 67, ip_options=bytes(4))), ("68:54:fd:27:aa:f1", True)),
+        (ethernet(0x0800, udp(68, 67), vlan=True), ("68:54:fd:27:aa:f1", True)),
+        (ethernet(0x0800, udp(5353, 5353)), None),
+        (ethernet(0x86DD, bytes(60)), None),  # IPv6
+        (ethernet(0x0800, udp(68, 67))[:30], None),  # truncated
+        (ethernet(0x0806, arp(1))[:16], None),  # truncated
+        (memoryview(bytes(10)), None),
+    ],
+)
+def test_parse_frame(frame, expected):
+    assert parse_frame(frame) == expected
+
+
+def test_parse_frame_tcp():
+    payload = bytearray(udp(68, 67))
+    payload[9] = 6  # TCP
+    assert parse_frame(ethernet(0x0800, bytes(payload))) is None
+
+
+def kernel_filtered(frames, macs=()):
+    """Frames the kernel passes through the filter (unix socket, the same BPF as raw socket)."""
+    sender, receiver = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    with sender, receiver:
+        attach_filter(receiver, filter_program(macs))
+        for frame in frames:
+            sender.send(bytes(frame))
+        receiver.setblocking(False)
+        passed = []
+        try:
+            while True:
+                passed.append(receiver.recv(65536))
+        except BlockingIOError:
+            return passed
+
+
+def test_kernel_filter():
+    button_frames = [ethernet(0x0806, arp(1)), ethernet(0x0800, udp(68, 67))]
+    other_frames = [ethernet(0x0800, udp(5353, 5353)), ethernet(0x86DD, bytes(60))]
+
+    assert kernel_filtered(button_frames + other_frames) == [bytes(f) for f in button_frames]
+
+
+def test_kernel_filter_macs():
+    other_mac = bytearray(ethernet(0x0806, arp(1)))
+    other_mac[6:12] = bytes.fromhex("34d270a4e050")
+    frames = [ethernet(0x0806, arp(1)), other_mac]
+
+    assert kernel_filtered(frames, ["68:54:fd:27:aa:f1"]) == [bytes(frames[0])]
+    assert len(kernel_filtered(frames, ["68:54:fd:27:aa:f1", "34:d2:70:a4:e0:50"])) == 2
+
+
+def test_run_calls_handler_for_button_requests():
+    frames = [bytes(ethernet(0x0806, arp(1))), bytes(ethernet(0x0806, arp(2)))]
+
+    def recv_into(buffer):
+        if not frames:
+            raise KeyboardInterrupt
+        frame = frames.pop(0)
+        buffer[: len(frame)] = frame
+        return len(frame)
+
+    handler = Mock()
+    capture = RawCapture(handler)
+    sock = Mock()
+    sock.__enter__ = Mock(return_value=sock)
+    sock.__exit__ = Mock(return_value=False)
+    sock.recv_into.side_effect = recv_into
+    with patch.object(capture, "open_socket", return_value=sock), pytest.raises(KeyboardInterrupt):
+        capture.run()
+
+    handler.assert_called_once()
+    assert handler.call_args.args[0] == "68:54:fd:27:aa:f1"
+    assert capture.frames == 2
+    assert capture.matched == 1
+
+
+def test_raw_frame_handler(mocker, dash, settings):
+    dash.settings = settings
+    dash.buttons = {"68:54:fd:27:aa:f1": "Button1"}
+    trigger = mocker.patch.object(dash, "trigger")
+
+    dash.raw_frame_handler("68:54:fd:27:aa:f1", 1234567890.0, False)
+    trigger.assert_called_once_with(
+        "Button1", datetime.fromtimestamp(1234567890.0), "68:54:fd:27:aa:f1"
+    )
+
+    dash.raw_frame_handler("00:11:22:33:44:55", 1234567890.0, True)
+    assert set(dash.seen_dhcp.items) == {"00:11:22:33:44:55"}
+
+    settings.sniff_mode = "buttons"
+    dash.raw_frame_handler("00:11:22:33:44:56", 1234567890.0, False)
+    assert "00:11:22:33:44:56" not in dash.seen_macs
@@ -0,0 +1,132 @@
+from unittest.mock import Mock, patch
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from google_sheet import Sheet
+from sheet_cache import EventIndex, SheetIdCache, get_sheet_id_cache
+
+
+def test_get_set():
+    cache = SheetIdCache(ttl=60)
+    assert cache.get("amazon_dash") is None
+    cache.set("amazon_dash", "spreadsheet-id", {"press": 1, "event": 2})
+    assert cache.get("amazon_dash") == ("spreadsheet-id", {"press": 1, "event": 2})
+
+
+def test_expired():
+    cache = SheetIdCache(ttl=60)
+    with patch("sheet_cache.time.time", return_value=1000):
+        cache.set("amazon_dash", "spreadsheet-id", {"press": 1})
+    with patch("sheet_cache.time.time", return_value=1061):
+        assert cache.get("amazon_dash") is None
+
+
+def test_persisted(tmp_path):
+    file_name = str(tmp_path / "sheet-cache.json")
+    SheetIdCache(ttl=60, file_name=file_name).set("amazon_dash", "spreadsheet-id", {"press": 1})
+    assert SheetIdCache(ttl=60, file_name=file_name).get("amazon_dash") == (
+        "spreadsheet-id",
+        {"press": 1},
+    )
+
+
+def test_cannot_save(tmp_path, caplog):
+    cache = SheetIdCache(ttl=60, file_name=str(tmp_path / "no-such-folder" / "cache.json"))
+    cache.set("amazon_dash", "spreadsheet-id", {"press": 1})
+    assert cache.get("amazon_dash") == ("spreadsheet-id", {"press": 1})
+    assert "Cannot save sheet ids cache" in caplog.text
+
+
+def test_shared_cache(settings):
+    assert get_sheet_id_cache(settings) is get_sheet_id_cache(settings)
+
+
+def test_reloaded_cache_settings(settings, tmp_path):
+    cache = get_sheet_id_cache(settings)
+
+    assert get_sheet_id_cache(settings.model_copy(update={"sheet_cache_ttl": 60})) is cache
+    assert cache.ttl == 60
+
+    file_name = str(tmp_path / "cache.json")
+    new_cache = get_sheet_id_cache(settings.model_copy(update={"sheet_cache_file_name": file_name}))
+    assert new_cache is not cache
+    assert new_cache.file_name == file_name
+
+
+@pytest.fixture
+def sheet(settings, google_credentials):
+    with (
+        patch("googleapiclient.discovery.build_from_document"),
+        patch("google_sheet.Sheet.get_file_id", return_value="spreadsheet-id") as get_file_id,
+        patch(
+            "google_sheet.Sheet.get_sheets", return_value={"press": 1, "event": 2}
+        ) as get_sheets,
+    ):
+        yield get_file_id, get_sheets
+
+
+def test_sheet_resolves_ids_once(settings, sheet):
+    get_file_id, get_sheets = sheet
+    Sheet(settings, "amazon_dash")
+    second = Sheet(settings, "amazon_dash")
+
+    get_file_id.assert_called_once_with("amazon_dash")
+    get_sheets.assert_called_once()
+    assert second.spreadSheetId == "spreadsheet-id"
+    assert second.sheets == {"press": 1, "event": 2}
+
+
+def test_sheet_not_found_invalidates_cache(settings, sheet):
+    get_file_id, _ = sheet
+    spreadsheet = Sheet(settings, "amazon_dash")
+    request = Mock()
+    request.execute.side_effect = HttpError(httplib2.Response({"status": 404}), b"Not Found")
+
+    with pytest.raises(HttpError):
+        spreadsheet.execute(request)
+
+    Sheet(settings, "amazon_dash")
+    assert get_file_id.call_count == 2
+
+
+def test_sheet_other_error_keeps_cache(settings, sheet):
+    get_file_id, _ = sheet
+    spreadsheet = Sheet(settings, "amazon_dash")
+    request = Mock()
+    request.execute.side_effect = HttpError(httplib2.Response({"status": 500}), b"Backend Error")
+
+    with pytest.raises(HttpError):
+        spreadsheet.execute(request)
+
+    Sheet(settings, "amazon_dash")
+    get_file_id.assert_called_once()
+
+
+def test_event_index():
+    index = EventIndex()
+    assert not index.is_synced(10)
+    index.seed([["a", 1.0], ["b", 2.0, 3.0], ["a", 0.5, 0.7], [], ["c", 1.0]], 1, 10)
+    assert index.is_synced(10)
+    assert index.find("a") == (1, ["a", 1.0])
+    assert index.find("b") == (2, ["b", 2.0, 3.0])
+    assert index.find("c") == (None, None)  # after empty row
+
+    index.insert_row(1, ["b", 4.0])
+    assert index.find("a") == (2, ["a", 1.0])
+    assert index.find("b") == (1, ["b", 4.0])
+    assert index.is_synced(11)
+
+    index.update_row(2, 2, [5.0])
+    assert index.find("a") == (2, ["a", 1.0, 5.0])
+
+    index.reset()
+    assert not index.is_synced(11)
+    assert index.find("a") == (None, None)
+
+
+def test_event_index_not_seeded_ignores_changes():
+    index = EventIndex()
+    index.insert_row(1, ["a", 1.0])
+    assert index.find("a") == (None, None)
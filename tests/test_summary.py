@@ -1,6 +1,8 @@
+from datetime import datetime
+
 import pytest
 from pydantic import ValidationError
-from models import EventActions
+from models import EventActions, SummarySchedule, TimeSummary
 
 
 def test_valid_input():
@@ -66,6 +68,57 @@ def test_invalid_input():
     assert "summary param must be string" in str(excinfo.value)
 
 
+@pytest.mark.parametrize(
+    "before, error",
+    [
+        ("10:aa:00", 'Between ":" in `before` param should be numbers.'),
+        ("10:00", '`before` param should be "HH:MM:SS"'),
+        ("10:00:60", '`before` param should be "HH:MM:SS"'),
+    ],
+)
+def test_invalid_before(before, error):
+    with pytest.raises(ValidationError) as excinfo:
+        TimeSummary(summary="summary", before=before, image="image.png")
+    assert error in str(excinfo.value)
+
+
+def test_invalid_days():
+    with pytest.raises(ValidationError) as excinfo:
+        TimeSummary(summary="summary", days="holiday", image="image.png")
+    assert "`days` param should be like" in str(excinfo.value)
+
+
+def test_summary_schedule():
+    schedule = SummarySchedule.from_summaries(
+        [
+            TimeSummary(summary="morning", before="12:00:00", image="morning.png"),
+            TimeSummary(summary="shadowed", before="11:00:00", image="morning.png"),
+            TimeSummary(summary="day", before="18:00:00", image="day.png"),
+            TimeSummary(summary="evening", image="evening.png"),
+        ]
+    )
+    saturday = datetime(2023, 9, 9)
+    assert schedule.pick(saturday.replace(hour=10, minute=59)) == "morning"
+    assert schedule.pick(saturday.replace(hour=11, minute=59, second=59)) == "morning"
+    assert schedule.pick(saturday.replace(hour=12)) == "day"
+    assert schedule.pick(saturday.replace(hour=18)) == "evening"
+
+
+def test_summary_schedule_days():
+    schedule = SummarySchedule.from_summaries(
+        [
+            TimeSummary(summary="work", before="18:00:00", days="mon-fri", image="work.png"),
+            TimeSummary(summary="weekend", days="weekend", image="weekend.png"),
+            TimeSummary(summary="evening", days="weekday", image="evening.png"),
+        ]
+    )
+    friday, saturday = datetime(2023, 9, 8, 10), datetime(2023, 9, 9, 10)
+    assert schedule.pick(friday) == "work"
+    assert schedule.pick(friday.replace(hour=19)) == "evening"
+    assert schedule.pick(saturday) == "weekend"
+    assert schedule.pick(saturday.replace(hour=19)) == "weekend"
+
+
 # Then run the tests
 test_valid_input()
 test_invalid_input()